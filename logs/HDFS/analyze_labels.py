@@ -0,0 +1,8 @@
+"""Advise on the labels of HDFS, see ingest/label_advisor.py"""
+
+from plugin import PLUGIN  # Also puts the ingest engine on sys.path
+
+from ingest.label_advisor import main
+
+if __name__ == "__main__":
+    main(PLUGIN)
@@ -0,0 +1,98 @@
+"""Compare header field extraction before and after the single-pass parser."""
+
+import random
+import re
+import time
+from datetime import datetime, timedelta
+
+from plugin import PLUGIN
+
+extract_fields = PLUGIN.extract_fields
+
+NUM_LINES = 1_000_000
+
+COMPONENTS = [
+    "dfs.DataNode$PacketResponder",
+    "dfs.DataNode$DataXceiver",
+    "dfs.FSNamesystem",
+    "dfs.DataBlockScanner",
+]
+
+
+def synthetic_lines(num_lines: int) -> list[tuple[str, str]]:
+    """Header lines with their contents, in the HDFS LogHub format"""
+    rng = random.Random(0)
+    timestamp = datetime(2008, 11, 9, 20, 35, 18)
+    lines = []
+    for _ in range(num_lines):
+        timestamp += timedelta(milliseconds=rng.randint(0, 2000))
+        block = f"blk_{rng.randint(-(2**63), 2**63)}"
+        content = rng.choice(
+            [
+                f"Receiving block {block} src: /10.250.19.102:54106 "
+                "dest: /10.250.19.102:50010",
+                f"PacketResponder 1 for block {block} terminating",
+                "BLOCK* NameSystem.allocateBlock: /mnt/hadoop/job.jar. "
+                f"{block}",
+            ]
+        )
+        header = (
+            f"{timestamp:%m%d%y %H%M%S} {rng.randint(100, 9999)} "
+            f"{rng.choice(['INFO', 'WARN'])} {rng.choice(COMPONENTS)}:\n"
+        )
+        lines.append((header, content))
+    return lines
+
+
+def extract_fields_before(line: str, content: str):
+    """The per-field extraction generate_labels.py used to run"""
+    log_level_match = re.search(r"\d+ \d+ \d+ (\w+)", line)
+    component_match = re.search(r"\d+ \d+ \d+ \w+ ([\w.$]+):", line)
+    labels = {
+        "log_level": log_level_match.group(1) if log_level_match else None,
+        "component": component_match.group(1) if component_match else None,
+    }
+
+    block_id_match = re.search(r"blk_-?\d+", content)
+    source_match = re.search(r"src:\s*/(\S+)", content)
+    destination_match = re.search(r"dest:\s*/(\S+)", content)
+    structured_metadata = {
+        "block_id": block_id_match.group(0) if block_id_match else None,
+        "source": source_match.group(1) if source_match else None,
+        "destination": (
+            destination_match.group(1) if destination_match else None
+        ),
+    }
+
+    timestamp_match = re.match(r"^(\d{6}\s+\d{6}\s+\d{3})", line)
+    if timestamp_match is None:
+        return None
+    timestamp = datetime.strptime(
+        timestamp_match.group(1), "%m%d%y %H%M%S %f"
+    )
+    return labels, structured_metadata, timestamp
+
+
+def lines_per_second(extract, lines) -> float:
+    start = time.perf_counter()
+    for line, content in lines:
+        extract(line, content)
+    return len(lines) / (time.perf_counter() - start)
+
+
+def main():
+    lines = synthetic_lines(NUM_LINES)
+    for line, content in lines[:10_000]:
+        assert extract_fields(line, content) == extract_fields_before(
+            line, content
+        )
+
+    before = lines_per_second(extract_fields_before, lines)
+    after = lines_per_second(extract_fields, lines)
+    print(f"HDFS, {NUM_LINES} synthetic lines")
+    print(f"before: {before:>12,.0f} lines/s")
+    print(f"after:  {after:>12,.0f} lines/s ({after / before:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,5 @@
 from datetime import datetime
-from typing import Any, Dict, Optional
+from typing import Optional
 
 from pydantic import BaseModel, field_serializer
 
@@ -14,6 +14,8 @@ class StructuredMetadata(BaseModel):
     block_id: Optional[str]
     source: Optional[str]
     destination: Optional[str]
+    # Drain template of the content, when parsed without a structured CSV
+    template_id: Optional[str] = None
     # thread_id: Optional[str]
 
 
@@ -26,7 +28,3 @@ class LogEntry(BaseModel):
     @field_serializer("timestamp")
     def serialize_datetime(self, dt: datetime, _info):
         return dt.isoformat()
-
-
-class LokiPayload(BaseModel):
-    streams: list[Dict[str, Any]]
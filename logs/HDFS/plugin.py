@@ -0,0 +1,103 @@
+import os
+import re
+import sys
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+# The shared ingest engine lives next to the dataset directories
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+)
+
+from ingest.plugin import ParserPlugin  # noqa: E402
+from models import Labels, LogEntry, StructuredMetadata  # noqa: E402
+
+# Standard header, "<date> <time> <pid> <level> <component>:", parsed in one
+# pass. Lines that do not match fall back to the per-field patterns below.
+HEADER_PATTERN = re.compile(
+    r"(?P<date>\d{6}) (?P<time>\d{6}) (?P<millis>\d{3})\d* "
+    r"(?P<log_level>\w+) (?P<component>[\w.$]+):"
+)
+LOG_LEVEL_PATTERN = re.compile(r"\d+ \d+ \d+ (\w+)")
+COMPONENT_PATTERN = re.compile(r"\d+ \d+ \d+ \w+ ([\w.$]+):")
+BLOCK_ID_PATTERN = re.compile(r"blk_-?\d+")
+SOURCE_PATTERN = re.compile(r"src:\s*/(\S+)")
+DESTINATION_PATTERN = re.compile(r"dest:\s*/(\S+)")
+
+
+def _group(match, group=1):
+    return match.group(group) if match else None
+
+
+def _extract_metadata(content: str) -> Dict[str, Optional[str]]:
+    # Substring checks skip the regex for contents without the field
+    return {
+        "block_id": _group(
+            "blk_" in content and BLOCK_ID_PATTERN.search(content), 0
+        ),
+        "source": _group("src:" in content and SOURCE_PATTERN.search(content)),
+        "destination": _group(
+            "dest:" in content and DESTINATION_PATTERN.search(content)
+        ),
+    }
+
+
+class HdfsPlugin(ParserPlugin):
+    name = "hdfs"
+    dataset = "HDFS"
+    labels_model = Labels
+    metadata_model = StructuredMetadata
+    entry_model = LogEntry
+    timestamp_pattern = re.compile(r"^(\d{6}\s+\d{6}\s+\d{3})")
+    timestamp_format = "%m%d%y %H%M%S %f"
+    max_rebase_lines = 600_000
+    # LogHub's "<Date> <Time> <Pid> <Level> <Component>: <Content>" and
+    # Drain settings of its benchmark
+    content_pattern = re.compile(r"\s*\S+\s+\S+\s+\S+\s+\S+\s+.*?:\s+")
+    drain_depth = 4
+    drain_similarity = 0.5
+    drain_masks = (
+        re.compile(r"blk_-?\d+"),
+        re.compile(r"(\d+\.){3}\d+(:\d+)?"),
+    )
+
+    def extract_fields(
+        self, line: str, content: str
+    ) -> Optional[Tuple[Dict, Dict, datetime]]:
+        match = HEADER_PATTERN.match(line)
+        if match is None:
+            return self._extract_fields_per_pattern(line, content)
+
+        date, time, millis = match.group("date", "time", "millis")
+        year = int(date[4:6])
+        # Same pivot as strptime's %y
+        year += 2000 if year < 69 else 1900
+        timestamp = datetime(
+            year,
+            int(date[0:2]),
+            int(date[2:4]),
+            int(time[0:2]),
+            int(time[2:4]),
+            int(time[4:6]),
+            int(millis) * 1000,
+        )
+        labels = {
+            "log_level": match.group("log_level"),
+            "component": match.group("component"),
+        }
+        return labels, _extract_metadata(content), timestamp
+
+    def _extract_fields_per_pattern(
+        self, line: str, content: str
+    ) -> Optional[Tuple[Dict, Dict, datetime]]:
+        timestamp = self.parse_timestamp(line)
+        if timestamp is None:
+            return None
+        labels = {
+            "log_level": _group(LOG_LEVEL_PATTERN.search(line)),
+            "component": _group(COMPONENT_PATTERN.search(line)),
+        }
+        return labels, _extract_metadata(content), timestamp
+
+
+PLUGIN = HdfsPlugin()
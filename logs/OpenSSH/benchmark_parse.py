@@ -0,0 +1,76 @@
+"""Compare header field extraction before and after the single-pass parser."""
+
+import random
+import re
+import time
+from datetime import datetime, timedelta
+
+from plugin import PLUGIN
+
+extract_fields = PLUGIN.extract_fields
+
+NUM_LINES = 1_000_000
+
+
+def synthetic_lines(num_lines: int) -> list[tuple[str, str]]:
+    """Header lines with their contents, in the OpenSSH LogHub format"""
+    rng = random.Random(0)
+    timestamp = datetime(1900, 12, 10, 6, 55, 46)
+    lines = []
+    for _ in range(num_lines):
+        timestamp += timedelta(milliseconds=rng.randint(0, 2000))
+        content = rng.choice(
+            [
+                "Failed password for root from 183.62.140.253 port "
+                f"{rng.randint(1024, 65535)} ssh2",
+                "pam_unix(sshd:auth): authentication failure; logname= "
+                "uid=0 euid=0 tty=ssh ruser= rhost=183.62.140.253",
+                "Received disconnect from 187.141.143.180: 11: Bye Bye "
+                "[preauth]",
+            ]
+        )
+        header = (
+            f"{timestamp:%b} {timestamp.day:2d} {timestamp:%H:%M:%S} LabSZ "
+            f"sshd[{rng.randint(1000, 30000)}]:\n"
+        )
+        lines.append((header, content))
+    return lines
+
+
+def extract_fields_before(line: str, content: str):
+    """The per-field extraction generate_labels.py used to run"""
+    labels = {"hostname": "LabSZ"}
+    process_match = re.search(r"sshd\[(\d+)\]", line)
+    process_id = process_match.group(1) if process_match else None
+    structured_metadata = {"process_id": process_id}
+
+    timestamp_match = re.match(
+        r"^(\w{3}\s+\d{1,2}\s+\d{2}:\d{2}:\d{2})", line
+    ).group(1)
+    timestamp = datetime.strptime(timestamp_match, "%b %d %H:%M:%S")
+    return labels, structured_metadata, timestamp
+
+
+def lines_per_second(extract, lines) -> float:
+    start = time.perf_counter()
+    for line, content in lines:
+        extract(line, content)
+    return len(lines) / (time.perf_counter() - start)
+
+
+def main():
+    lines = synthetic_lines(NUM_LINES)
+    for line, content in lines[:10_000]:
+        assert extract_fields(line, content) == extract_fields_before(
+            line, content
+        )
+
+    before = lines_per_second(extract_fields_before, lines)
+    after = lines_per_second(extract_fields, lines)
+    print(f"OpenSSH, {NUM_LINES} synthetic lines")
+    print(f"before: {before:>12,.0f} lines/s")
+    print(f"after:  {after:>12,.0f} lines/s ({after / before:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
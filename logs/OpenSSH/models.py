@@ -1,5 +1,5 @@
 from datetime import datetime
-from typing import Any, Dict, Optional
+from typing import Optional
 
 from pydantic import BaseModel, field_serializer, field_validator
 
@@ -13,6 +13,8 @@ class StructuredMetadata(BaseModel):
     process_id: str
     rhost: Optional[str] = None
     ruser: Optional[str] = None
+    # Drain template of the content, when parsed without a structured CSV
+    template_id: Optional[str] = None
 
     @field_validator("process_id", mode="before")
     @classmethod
@@ -29,7 +31,3 @@ class LogEntry(BaseModel):
     @field_serializer("timestamp")
     def serialize_datetime(self, dt: datetime, _info):
         return dt.isoformat()
-
-
-class LokiPayload(BaseModel):
-    streams: list[Dict[str, Any]]
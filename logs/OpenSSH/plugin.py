@@ -0,0 +1,93 @@
+import calendar
+import os
+import re
+import sys
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+# The shared ingest engine lives next to the dataset directories
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+)
+
+from ingest.plugin import ParserPlugin  # noqa: E402
+from models import Labels, LogEntry, StructuredMetadata  # noqa: E402
+
+# Standard header, "<month> <day> <time> <host> sshd[<pid>]", parsed in one
+# pass. Lines that do not match fall back to the per-field patterns below.
+HEADER_PATTERN = re.compile(
+    r"(?P<month>[A-Za-z]{3})\s+(?P<day>\d{1,2})\s+"
+    r"(?P<hour>\d{2}):(?P<minute>\d{2}):(?P<second>\d{2}) "
+    r"\S+ sshd\[(?P<process_id>\d+)\]"
+)
+PROCESS_PATTERN = re.compile(r"sshd\[(\d+)\]")
+# Month abbreviations as understood by strptime's %b
+MONTHS = {
+    name.lower(): number
+    for number, name in enumerate(calendar.month_abbr)
+    if name
+}
+
+
+class OpenSshPlugin(ParserPlugin):
+    name = "openssh"
+    dataset = "OpenSSH"
+    labels_model = Labels
+    metadata_model = StructuredMetadata
+    entry_model = LogEntry
+    timestamp_pattern = re.compile(r"^(\w{3}\s+\d{1,2}\s+\d{2}:\d{2}:\d{2})")
+    timestamp_format = "%b %d %H:%M:%S"
+    # LogHub's "<Date> <Day> <Time> <Component> sshd[<Pid>]: <Content>"
+    # and Drain settings of its benchmark
+    content_pattern = re.compile(r"\s*\S+\s+\S+\s+\S+\s+\S+\s+sshd\[.*?\]:\s+")
+    drain_depth = 5
+    drain_similarity = 0.6
+    drain_masks = (
+        re.compile(r"(\d+\.){3}\d+"),
+        re.compile(r"([\w-]+\.){2,}[\w-]+"),
+    )
+
+    def extract_fields(
+        self, line: str, content: str
+    ) -> Optional[Tuple[Dict, Dict, datetime]]:
+        match = HEADER_PATTERN.match(line)
+        month = MONTHS.get(match.group("month").lower()) if match else None
+        if month is None:
+            return self._extract_fields_per_pattern(line, content)
+
+        # strptime without a year defaults to 1900
+        timestamp = datetime(
+            1900,
+            month,
+            int(match.group("day")),
+            int(match.group("hour")),
+            int(match.group("minute")),
+            int(match.group("second")),
+        )
+        labels = {"hostname": "LabSZ"}
+        structured_metadata = {"process_id": match.group("process_id")}
+        return labels, structured_metadata, timestamp
+
+    def _extract_fields_per_pattern(
+        self, line: str, content: str
+    ) -> Optional[Tuple[Dict, Dict, datetime]]:
+        process_match = PROCESS_PATTERN.search(line)
+        # rhost_match = re.search(r"rhost=(\S+)", line)
+        # rhost = rhost_match.group(1) if rhost_match else None
+        # user_match = re.search(r"user=(\S+)", line)
+        # ruser = user_match.group(1) if user_match else None
+        process_id = process_match.group(1) if process_match else None
+
+        timestamp = self.parse_timestamp(line)
+        if timestamp is None:
+            return None
+        labels = {"hostname": "LabSZ"}
+        structured_metadata = {
+            "process_id": process_id,
+            # "rhost": rhost,
+            # "ruser": ruser,
+        }
+        return labels, structured_metadata, timestamp
+
+
+PLUGIN = OpenSshPlugin()
@@ -0,0 +1,8 @@
+"""Sort the parsed OpenSSH logs, see ingest/sort_logs.py"""
+
+from plugin import PLUGIN  # Also puts the ingest engine on sys.path
+
+from ingest.sort_logs import main
+
+if __name__ == "__main__":
+    main(PLUGIN)
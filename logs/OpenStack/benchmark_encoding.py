@@ -0,0 +1,8 @@
+"""Compare push encodings on OpenStack, see ingest/benchmark_encoding.py"""
+
+from plugin import PLUGIN  # Also puts the ingest engine on sys.path
+
+from ingest.benchmark_encoding import main
+
+if __name__ == "__main__":
+    main(PLUGIN)
@@ -0,0 +1,112 @@
+"""Compare header field extraction before and after the single-pass parser."""
+
+import random
+import re
+import time
+from datetime import datetime, timedelta
+
+from plugin import PLUGIN
+
+extract_fields = PLUGIN.extract_fields
+
+NUM_LINES = 1_000_000
+
+LOG_FILES = [
+    "nova-api.log.1.2017-05-16_13:53:08",
+    "nova-compute.log.1.2017-05-16_13:55:31",
+    "nova-scheduler.log.1.2017-05-16_13:53:08",
+]
+COMPONENTS = [
+    "nova.osapi_compute.wsgi.server",
+    "nova.compute.manager",
+    "nova.metadata.wsgi.server",
+]
+
+
+def synthetic_lines(num_lines: int) -> list[tuple[str, str]]:
+    """Header lines with their contents, in the OpenStack LogHub format"""
+    rng = random.Random(0)
+    timestamp = datetime(2017, 5, 16, 0, 0, 0)
+    lines = []
+    for _ in range(num_lines):
+        timestamp += timedelta(milliseconds=rng.randint(0, 500))
+        context = rng.choice(
+            [
+                f"[req-{rng.getrandbits(128):032x} "
+                "113d3a99c3da401fbd62cc2caa5b96d2 "
+                "54fadb412c4e40cdbaed9335e4c35a9e - - -]",
+                "[-]",
+            ]
+        )
+        content = rng.choice(
+            [
+                '10.11.10.1 "GET /v2/54fadb412c4e40cdbaed9335e4c35a9e/'
+                'servers/detail HTTP/1.1" status: 200 len: 1893 time: '
+                f"0.{rng.randint(10**6, 10**7)}",
+                "[instance: b9000564-fe1a-409b-b8cc-1e88b294cd1d] "
+                "VM Started (Lifecycle Event)",
+            ]
+        )
+        millis = timestamp.microsecond // 1000
+        header = (
+            f"{rng.choice(LOG_FILES)} "
+            f"{timestamp:%Y-%m-%d %H:%M:%S}.{millis:03d} "
+            f"{rng.randint(2000, 30000)} "
+            f"{rng.choice(['INFO', 'INFO', 'WARNING', 'ERROR'])} "
+            f"{rng.choice(COMPONENTS)} {context}\n"
+        )
+        lines.append((header, content))
+    return lines
+
+
+def extract_fields_before(line: str, content: str):
+    """The per-field extraction generate_labels.py used to run"""
+    log_level_match = re.search(r"\s(INFO|WARN|ERROR|DEBUG)\s", line)
+    labels = {
+        "log_file_type": line.split(".")[0],
+        "log_level": log_level_match.group(1) if log_level_match else None,
+        "component": line.split()[5] if len(line.split()) > 5 else None,
+        "log_file_name": line.split()[0],
+    }
+
+    req_match = re.search(r"req-([a-f0-9-]+)", line)
+    structured_metadata = {
+        "request_id": req_match.group(1) if req_match else None,
+        "tenant_id": line.split()[7] if len(line.split()) > 7 else None,
+        "user_id": line.split()[8] if len(line.split()) > 8 else None,
+    }
+
+    timestamp_match = re.search(
+        r"\d{2}-\d{2}\s\d{2}:\d{2}:\d{2}\.\d{3}", line
+    )
+    if timestamp_match is None:
+        return None
+    timestamp = datetime.strptime(
+        timestamp_match.group(), "%m-%d %H:%M:%S.%f"
+    )
+    return labels, structured_metadata, timestamp
+
+
+def lines_per_second(extract, lines) -> float:
+    start = time.perf_counter()
+    for line, content in lines:
+        extract(line, content)
+    return len(lines) / (time.perf_counter() - start)
+
+
+def main():
+    lines = synthetic_lines(NUM_LINES)
+    for line, content in lines[:10_000]:
+        assert extract_fields(line, content) == extract_fields_before(
+            line, content
+        )
+
+    before = lines_per_second(extract_fields_before, lines)
+    after = lines_per_second(extract_fields, lines)
+    print(f"OpenStack, {NUM_LINES} synthetic lines")
+    print(f"before: {before:>12,.0f} lines/s")
+    print(f"after:  {after:>12,.0f} lines/s ({after / before:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
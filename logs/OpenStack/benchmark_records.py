@@ -0,0 +1,8 @@
+"""Compare models and records on OpenStack, see ingest/benchmark_records.py"""
+
+from plugin import PLUGIN  # Also puts the ingest engine on sys.path
+
+from ingest.benchmark_records import main
+
+if __name__ == "__main__":
+    main(PLUGIN)
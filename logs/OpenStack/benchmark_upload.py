@@ -0,0 +1,8 @@
+"""Benchmark uploading OpenStack, see ingest/benchmark_upload.py"""
+
+from plugin import PLUGIN  # Also puts the ingest engine on sys.path
+
+from ingest.benchmark_upload import main
+
+if __name__ == "__main__":
+    main(PLUGIN)
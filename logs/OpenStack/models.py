@@ -1,5 +1,5 @@
 from datetime import datetime
-from typing import Any, Dict, Optional
+from typing import Optional
 
 from pydantic import BaseModel, field_serializer
 
@@ -17,6 +17,8 @@ class StructuredMetadata(BaseModel):
     request_id: Optional[str]
     tenant_id: Optional[str]
     user_id: Optional[str]
+    # Drain template of the content, when parsed without a structured CSV
+    template_id: Optional[str] = None
 
 
 class LogEntry(BaseModel):
@@ -28,7 +30,3 @@ class LogEntry(BaseModel):
     @field_serializer("timestamp")
     def serialize_datetime(self, dt: datetime, _info):
         return dt.isoformat()
-
-
-class LokiPayload(BaseModel):
-    streams: list[Dict[str, Any]]
@@ -0,0 +1,129 @@
+import os
+import re
+import sys
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+# The shared ingest engine lives next to the dataset directories
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+)
+
+from ingest.plugin import ParserPlugin  # noqa: E402
+from models import Labels, LogEntry, StructuredMetadata  # noqa: E402
+
+# Standard header, "<file> <date> <time> <pid> <level> <component>
+# [req-<id> <tenant> <user> ...]", parsed in one pass. Lines that do not
+# match fall back to the per-field patterns below.
+HEADER_PATTERN = re.compile(
+    r"\S+ \d{4}-(?P<month>\d{2})-(?P<day>\d{2}) "
+    r"(?P<hour>\d{2}):(?P<minute>\d{2}):(?P<second>\d{2})\.(?P<millis>\d{3}) "
+    r"\d+ (?P<log_level>\w+) \S+(?: \[req-(?P<request_id>[a-f0-9-]+))?"
+)
+LOG_LEVEL_PATTERN = re.compile(r"\s(INFO|WARN|ERROR|DEBUG)\s")
+REQUEST_ID_PATTERN = re.compile(r"req-([a-f0-9-]+)")
+LOG_LEVELS = {"INFO", "WARN", "ERROR", "DEBUG"}
+
+
+def _token(tokens: List[str], index: int) -> Optional[str]:
+    return tokens[index] if len(tokens) > index else None
+
+
+class OpenStackPlugin(ParserPlugin):
+    name = "openstack"
+    dataset = "OpenStack"
+    labels_model = Labels
+    metadata_model = StructuredMetadata
+    entry_model = LogEntry
+    timestamp_pattern = re.compile(r"(\d{2}-\d{2}\s\d{2}:\d{2}:\d{2}\.\d{3})")
+    timestamp_format = "%m-%d %H:%M:%S.%f"
+    # LogHub's "<Logrecord> <Date> <Time> <Pid> <Level> <Component>
+    # [<ADDR>] <Content>" and Drain settings of its benchmark
+    content_pattern = re.compile(
+        r"\s*\S+\s+\S+\s+\S+\s+\S+\s+\S+\s+\S+\s+\[.*?\]\s+"
+    )
+    drain_depth = 5
+    drain_similarity = 0.5
+    drain_masks = (
+        re.compile(r"((\d+\.){3}\d+,?)+"),
+        re.compile(r"/.+?\s"),
+        re.compile(r"\d+"),
+    )
+
+    def extract_fields(
+        self, line: str, content: str
+    ) -> Optional[Tuple[Dict, Dict, datetime]]:
+        match = HEADER_PATTERN.match(line)
+        if match is None:
+            return self._extract_fields_per_pattern(line, content)
+
+        tokens = line.split()
+        log_level = match.group("log_level")
+        if log_level not in LOG_LEVELS:
+            log_level_match = LOG_LEVEL_PATTERN.search(
+                line, match.end("log_level")
+            )
+            log_level = log_level_match.group(1) if log_level_match else None
+        request_id = match.group("request_id")
+        # Keep the first "req-" of the line, as a plain search would
+        if request_id is None or line.find("req-") + 4 != match.start(
+            "request_id"
+        ):
+            request_id_match = REQUEST_ID_PATTERN.search(line)
+            request_id = (
+                request_id_match.group(1) if request_id_match else None
+            )
+
+        # strptime without a year defaults to 1900
+        timestamp = datetime(
+            1900,
+            int(match.group("month")),
+            int(match.group("day")),
+            int(match.group("hour")),
+            int(match.group("minute")),
+            int(match.group("second")),
+            int(match.group("millis")) * 1000,
+        )
+        labels = {
+            "log_file_type": line.partition(".")[0],
+            "log_level": log_level,
+            "component": _token(tokens, 5),
+            "log_file_name": tokens[0],
+        }
+        structured_metadata = {
+            "request_id": request_id,
+            "tenant_id": _token(tokens, 7),
+            "user_id": _token(tokens, 8),
+        }
+        return labels, structured_metadata, timestamp
+
+    def _extract_fields_per_pattern(
+        self, line: str, content: str
+    ) -> Optional[Tuple[Dict, Dict, datetime]]:
+        timestamp = self.parse_timestamp(line)
+        if timestamp is None:
+            return None  # Skip entries without a valid timestamp
+
+        tokens = line.split()
+        log_level_match = LOG_LEVEL_PATTERN.search(line)
+        labels = {
+            "log_file_type": line.partition(".")[0],
+            "log_level": log_level_match.group(1) if log_level_match else None,
+            "component": _token(tokens, 5),
+            "log_file_name": tokens[0],
+            # "line_id": None,
+        }
+
+        req_match = REQUEST_ID_PATTERN.search(line)
+        structured_metadata = {
+            "request_id": req_match.group(1) if req_match else None,
+            "tenant_id": _token(tokens, 7),
+            "user_id": _token(tokens, 8),
+        }
+        return labels, structured_metadata, timestamp
+
+    def line(self, content: str) -> str:
+        return content.replace('"', '"').replace("\n", "\\n")
+
+
+PLUGIN = OpenStackPlugin()
@@ -1,40 +1,285 @@
-""""Script to delete and clean up logs from Grafana Loki."""
+"""Script to delete and clean up logs from Grafana Loki.
 
+Delete requests are sent concurrently for every application and time
+window, then the compactor's delete request list is polled until all of
+them are processed, and count queries confirm that no lines are left.
+Deletion needs the compactor's retention and delete request store, as
+set up in run_loki/loki-config.yaml.
+"""
+
+import argparse
+import asyncio
 import os
+import sys
+import time
 from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
 
-import requests
+import aiohttp
 from dotenv import load_dotenv
 
+from ingest.flow_control import (
+    RETRYABLE_STATUSES,
+    backoff_delay,
+    parse_retry_after,
+)
+
 load_dotenv()
 
-# LOKI_URL = os.getenv("LOKI_URL")
-LOKI_URL = "https://logs-prod-006.grafana.net"
+# The push URL of the uploader, or Loki's base URL
+LOKI_URL = os.getenv("LOKI_URL", "https://logs-prod-006.grafana.net")
+LOKI_URL = LOKI_URL.removesuffix("/loki/api/v1/push").rstrip("/")
+LOKI_TENANT = os.getenv("LOKI_TENANT", "tenant1")
 USER_ID = os.getenv("USER_ID", "")
 API_KEY = os.getenv("API_KEY", "")
 
-# Calculate yesterday's midnight timestamp
-yesterday_midnight = datetime.now(timezone.utc).replace(
-    hour=0, minute=0, second=0, microsecond=0
-) - timedelta(days=1)
-start_timestamp = int(yesterday_midnight.timestamp())
-end_timestamp = int(datetime.now(timezone.utc).timestamp())
-
-delete_url = f"{LOKI_URL}/loki/api/v1/delete"
-params = {
-    "query": {"application": "openstack"},
-    "start": start_timestamp,
-    "end": end_timestamp,
-}
-
-res = requests.post(
-    delete_url,
-    params=params,
-    auth=(USER_ID, API_KEY),
-    headers={"Content-type": "application/json"},
-)
+# Delete requests and count queries in flight
+CLEAN_CONCURRENCY = int(os.getenv("CLEAN_CONCURRENCY", 8))
+# How often the delete request list is polled, and for how long
+CLEAN_POLL_SECONDS = float(os.getenv("CLEAN_POLL_SECONDS", 5.0))
+CLEAN_TIMEOUT_SECONDS = float(os.getenv("CLEAN_TIMEOUT_SECONDS", 1800.0))
+MAX_RETRIES = int(os.getenv("MAX_RETRIES", 10))
+RETRY_BASE_SECONDS = float(os.getenv("RETRY_BASE_SECONDS", 0.5))
+RETRY_MAX_SECONDS = float(os.getenv("RETRY_MAX_SECONDS", 30.0))
+
+DELETE_PATH = "/loki/api/v1/delete"
+QUERY_PATH = "/loki/api/v1/query"
+APPLICATIONS = ("openssh", "openstack", "hdfs")
+
+# (application, start, end) of a delete request, in Unix seconds
+Deletion = Tuple[str, int, int]
+
+
+def selector(application: str) -> str:
+    return f'{{application="{application}"}}'
+
+
+def time_windows(start: int, end: int, window: int) -> List[Tuple[int, int]]:
+    """[start, end) split into windows of at most window seconds"""
+    return [
+        (window_start, min(window_start + window, end))
+        for window_start in range(start, end, window)
+    ]
+
+
+async def request(
+    session: aiohttp.ClientSession,
+    method: str,
+    path: str,
+    params: Dict[str, Any],
+) -> Any:
+    """Call Loki's API, retrying 429/5xx responses and connection errors
+
+    Returns the decoded JSON response, None if it has no body.
+    """
+    for attempt in range(MAX_RETRIES + 1):
+        retry_after = None
+        try:
+            async with session.request(
+                method, f"{LOKI_URL}{path}", params=params
+            ) as response:
+                if response.status < 300:
+                    if response.status == 204:
+                        return None
+                    return await response.json(content_type=None)
+                text = await response.text()
+                if response.status not in RETRYABLE_STATUSES:
+                    raise RuntimeError(
+                        f"{method} {path} failed: {response.status} - {text}"
+                    )
+                retry_after = parse_retry_after(
+                    response.headers.get("Retry-After")
+                )
+                error = f"{response.status} - {text}"
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            error = repr(e)
+        if attempt == MAX_RETRIES:
+            raise RuntimeError(f"{method} {path} failed: {error}")
+        await asyncio.sleep(
+            backoff_delay(
+                attempt, RETRY_BASE_SECONDS, RETRY_MAX_SECONDS, retry_after
+            )
+        )
+
+
+async def delete(
+    session: aiohttp.ClientSession,
+    limit: asyncio.Semaphore,
+    deletion: Deletion,
+):
+    application, start, end = deletion
+    params = {"query": selector(application), "start": start, "end": end}
+    async with limit:
+        await request(session, "POST", DELETE_PATH, params)
+
+
+def _processed(
+    requests: List[Dict[str, Any]], deletions: List[Deletion]
+) -> Dict[Deletion, bool]:
+    """Whether the latest delete request of each deletion is processed"""
+    latest: Dict[Deletion, Dict[str, Any]] = {}
+    for delete_request in requests:
+        key = (
+            delete_request["query"],
+            round(float(delete_request["start_time"])),
+            round(float(delete_request["end_time"])),
+        )
+        previous = latest.get(key)
+        if previous is None or float(delete_request["created_at"]) > float(
+            previous["created_at"]
+        ):
+            latest[key] = delete_request
+    processed = {}
+    for deletion in deletions:
+        application, start, end = deletion
+        delete_request = latest.get((selector(application), start, end))
+        processed[deletion] = (
+            delete_request is not None
+            and delete_request["status"] == "processed"
+        )
+    return processed
+
+
+async def wait_processed(
+    session: aiohttp.ClientSession, deletions: List[Deletion]
+) -> List[Deletion]:
+    """Poll the delete requests until processed, returns the pending ones"""
+    deadline = time.monotonic() + CLEAN_TIMEOUT_SECONDS
+    while True:
+        requests = await request(session, "GET", DELETE_PATH, {}) or []
+        processed = _processed(requests, deletions)
+        pending = [
+            deletion for deletion in deletions if not processed[deletion]
+        ]
+        print(
+            f"{len(deletions) - len(pending)}/{len(deletions)} delete "
+            "requests processed"
+        )
+        if not pending or time.monotonic() >= deadline:
+            return pending
+        await asyncio.sleep(CLEAN_POLL_SECONDS)
+
+
+async def count_lines(
+    session: aiohttp.ClientSession,
+    limit: asyncio.Semaphore,
+    deletion: Deletion,
+) -> int:
+    """Lines of the application left in the window, by an instant query"""
+    application, start, end = deletion
+    params = {
+        "query": (
+            f"sum(count_over_time({selector(application)}[{end - start}s]))"
+        ),
+        "time": end,
+    }
+    async with limit:
+        response = await request(session, "GET", QUERY_PATH, params)
+    result = response["data"]["result"]
+    return int(float(result[0]["value"][1])) if result else 0
+
+
+async def clean(
+    applications: List[str],
+    start: int,
+    end: int,
+    window: int,
+    verify_only: bool = False,
+) -> bool:
+    """Delete the applications' lines in [start, end), True if none is left"""
+    deletions = [
+        (application, window_start, window_end)
+        for application in applications
+        for window_start, window_end in time_windows(start, end, window)
+    ]
+    limit = asyncio.Semaphore(CLEAN_CONCURRENCY)
+    async with aiohttp.ClientSession(
+        auth=aiohttp.BasicAuth(USER_ID, API_KEY),
+        headers={"X-Scope-OrgID": LOKI_TENANT},
+    ) as session:
+        if not verify_only:
+            await asyncio.gather(
+                *(delete(session, limit, deletion) for deletion in deletions)
+            )
+            print(f"Sent {len(deletions)} delete requests")
+            pending = await wait_processed(session, deletions)
+            if pending:
+                print(
+                    f"{len(pending)} delete requests still pending after "
+                    f"{CLEAN_TIMEOUT_SECONDS:g}s"
+                )
+
+        counts = await asyncio.gather(
+            *(count_lines(session, limit, deletion) for deletion in deletions)
+        )
+    left = [
+        (deletion, count)
+        for deletion, count in zip(deletions, counts)
+        if count
+    ]
+    for (application, window_start, window_end), count in left:
+        window_text = " to ".join(
+            datetime.fromtimestamp(t, timezone.utc).isoformat()
+            for t in (window_start, window_end)
+        )
+        print(f"{count} {application} lines left from {window_text}")
+    return not left
+
+
+def _timestamp(value: Optional[str], default: datetime) -> int:
+    moment = datetime.fromisoformat(value) if value else default
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return int(moment.timestamp())
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Delete logs from Loki and check that they are gone"
+    )
+    parser.add_argument(
+        "applications",
+        nargs="*",
+        default=list(APPLICATIONS),
+        help="application labels to delete, all datasets by default",
+    )
+    parser.add_argument(
+        "--start", help="ISO time to delete from, yesterday's midnight UTC"
+    )
+    parser.add_argument("--end", help="ISO time to delete up to, now")
+    parser.add_argument(
+        "--window-hours",
+        type=float,
+        default=24.0,
+        help="split the range into delete requests of this many hours",
+    )
+    parser.add_argument(
+        "--verify-only",
+        action="store_true",
+        help="only count the lines left, without deleting",
+    )
+    args = parser.parse_args()
+
+    now = datetime.now(timezone.utc)
+    # Yesterday's midnight
+    yesterday_midnight = now.replace(
+        hour=0, minute=0, second=0, microsecond=0
+    ) - timedelta(days=1)
+    start = _timestamp(args.start, yesterday_midnight)
+    end = _timestamp(args.end, now)
+    if end <= start:
+        parser.error("--end must be after --start")
+    window = max(int(args.window_hours * 3600), 1)
+
+    if not asyncio.run(
+        clean(args.applications, start, end, window, args.verify_only)
+    ):
+        sys.exit(1)
+    if args.verify_only:
+        print("No lines left")
+    else:
+        print("Successfully deleted logs")
+
 
-if res.status_code == 204:
-    print("Successfully deleted logs")
-else:
-    print(f"Failed to delete logs: {res.status_code} - {res.text}")
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""Compare Loki push encodings by bytes on the wire and encode CPU time."""
+
+import time
+from itertools import islice
+
+from ingest.log_io import iter_logs
+from ingest.push_encoding import ENCODERS, snappy
+from ingest.upload_to_loki import Batch
+
+NUM_LINES = 100_000
+
+
+def load_batches(plugin, filename: str, num_lines: int) -> list[Batch]:
+    """Build upload batches from the first num_lines parsed entries"""
+    entries = list(islice(iter_logs(filename), num_lines))
+    batches = [Batch(plugin)]
+    for record in plugin.record_schema.upload_records(entries):
+        batches[-1].add(record)
+        if batches[-1].is_full():
+            batches.append(Batch(plugin))
+    return [batch for batch in batches if batch.num_lines]
+
+
+def benchmark(batches: list[Batch], encoding: str) -> tuple[int, float]:
+    """Return total body bytes and CPU seconds spent encoding all batches"""
+    encoder = ENCODERS[encoding]
+    payloads = [batch.to_payload() for batch in batches]
+    total_bytes = 0
+    start = time.process_time()
+    for payload in payloads:
+        body, _ = encoder(payload)
+        total_bytes += len(body)
+    return total_bytes, time.process_time() - start
+
+
+def main(plugin):
+    batches = load_batches(plugin, plugin.parsed_log_file, NUM_LINES)
+    num_lines = sum(batch.num_lines for batch in batches)
+    scale = NUM_LINES / num_lines
+    print(f"Encoding {num_lines} lines in {len(batches)} batches")
+    print(f"{'encoding':<10} {'MB/100k lines':>14} {'CPU s/100k lines':>17}")
+    for encoding in ENCODERS:
+        if encoding == "protobuf" and snappy is None:
+            print(f"{encoding:<10} skipped, python-snappy is not installed")
+            continue
+        total_bytes, cpu_seconds = benchmark(batches, encoding)
+        print(
+            f"{encoding:<10} {total_bytes * scale / 1e6:>14.2f} "
+            f"{cpu_seconds * scale:>17.3f}"
+        )
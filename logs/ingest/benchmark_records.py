@@ -0,0 +1,162 @@
+"""Compare per-line CPU time of pydantic models and compact records."""
+
+import asyncio
+import json
+import os
+import tempfile
+import time
+from itertools import islice
+
+from ingest.log_io import BLOCK_SIZE, iter_logs, write_logs
+from ingest.models import LokiPayload
+from ingest.records import UploadRecord, encode_records
+from ingest.upload_journal import UploadJournal
+from ingest.tenants import TenantRouter
+from ingest.upload_to_loki import (
+    LOKI_TENANT,
+    Batch,
+    Tenant,
+    Tenants,
+    batcher,
+    producer,
+)
+
+NUM_LINES = 100_000
+
+
+def parse_with_models(plugin, records):
+    """Build and serialize entries as generate_labels.py used to"""
+    for labels, structured_metadata, timestamp, content in records:
+        log_entry = plugin.entry_model(
+            labels=plugin.labels_model(**labels),
+            structured_metadata=plugin.metadata_model(**structured_metadata),
+            timestamp=timestamp,
+            content=content,
+        )
+        json.dumps(log_entry.model_dump())
+
+
+def parse_with_records(plugin, records):
+    """Serialize extracted entries as generate_labels.py does"""
+    for start in range(0, len(records), BLOCK_SIZE):
+        block = records[start:start + BLOCK_SIZE]
+        encode_records("parsed.ndjson", block, plugin.record_schema)
+
+
+async def upload_with_models(plugin, filename):
+    """Queue and batch entries as upload_to_loki.py used to"""
+    entry_queue = asyncio.Queue(maxsize=1000)
+    batch_queue = asyncio.Queue(maxsize=100)
+
+    async def produce():
+        for index, entry in enumerate(iter_logs(filename)):
+            await entry_queue.put((index, plugin.entry_model(**entry)))
+        await entry_queue.put(None)
+
+    async def batch_entries():
+        batch = Batch(plugin)
+        while True:
+            item = await asyncio.wait_for(
+                entry_queue.get(), timeout=batch.linger_remaining()
+            )
+            if item is None:
+                break
+            index, log_entry = item
+            labels = log_entry.labels.model_dump(exclude_none=True)
+            record = UploadRecord(
+                plugin.record_schema.label_sets.intern(labels),
+                log_entry.structured_metadata.model_dump(
+                    exclude_none=True, mode="json"
+                ),
+                log_entry.timestamp,
+                plugin.line(log_entry.content),
+            )
+            batch.add(record, index)
+            if batch.is_full():
+                await batch_queue.put(batch)
+                batch = Batch(plugin)
+        await batch_queue.put(batch)
+        await batch_queue.put(None)
+
+    async def build_payloads():
+        # Payloads used to be validated on construction
+        while (batch := await batch_queue.get()) is not None:
+            LokiPayload(streams=batch.to_payload().streams)
+
+    await asyncio.gather(produce(), batch_entries(), build_payloads())
+
+
+async def upload_with_records(plugin, filename):
+    """Queue and batch entries as upload_to_loki.py does"""
+    entry_queue = asyncio.Queue(maxsize=2)
+    batch_queue = asyncio.Queue(maxsize=100)
+    journal = UploadJournal(f"{filename}.journal", filename)
+    # Every tenant's batches go to batch_queue, nothing is pushed
+    tenants = Tenants(
+        TenantRouter(LOKI_TENANT), lambda name: Tenant(name, batch_queue)
+    )
+
+    async def produce():
+        await producer(entry_queue, filename, journal, plugin)
+        await entry_queue.put(None)
+
+    async def batch_entries():
+        await batcher(entry_queue, tenants, plugin)
+        await batch_queue.put(None)
+
+    async def build_payloads():
+        while (batch := await batch_queue.get()) is not None:
+            batch.to_payload()
+
+    await asyncio.gather(produce(), batch_entries(), build_payloads())
+    journal.close()
+
+
+def cpu_seconds(function, *args) -> float:
+    start = time.process_time()
+    result = function(*args)
+    if asyncio.iscoroutine(result):
+        asyncio.run(result)
+    return time.process_time() - start
+
+
+def report(stage: str, before: float, after: float):
+    speedup = before / after
+    print(f"{stage:<16} {before:>15.2f} {after:>16.2f} ({speedup:.1f}x)")
+
+
+def main(plugin):
+    entries = list(islice(iter_logs(plugin.parsed_log_file), NUM_LINES))
+    # The fields generate_labels.py gets from extract_fields, and the
+    # entries as upload_to_loki.py reads them from an ndjson file
+    records = []
+    for entry in entries:
+        log_entry = plugin.entry_model(**entry)
+        records.append(
+            (
+                log_entry.labels.model_dump(),
+                log_entry.structured_metadata.model_dump(),
+                log_entry.timestamp,
+                log_entry.content,
+            )
+        )
+
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, "parsed.ndjson")
+        write_logs(filename, entries, plugin)
+
+        print(f"{plugin.dataset}, {len(entries)} parsed entries")
+        print(
+            f"{'stage':<16} {'models µs/line':>15} {'records µs/line':>16}"
+        )
+        per_line = 1e6 / len(entries)
+        report(
+            "generate_labels",
+            cpu_seconds(parse_with_models, plugin, records) * per_line,
+            cpu_seconds(parse_with_records, plugin, records) * per_line,
+        )
+        report(
+            "upload producer",
+            cpu_seconds(upload_with_models, plugin, filename) * per_line,
+            cpu_seconds(upload_with_records, plugin, filename) * per_line,
+        )
@@ -0,0 +1,105 @@
+"""Measure upload throughput and push latency against a Loki stand-in."""
+
+import asyncio
+import inspect
+import json
+import os
+import sys
+import tempfile
+from itertools import islice
+
+from ingest.log_io import iter_logs, write_logs
+from ingest.loki_stand_in import LokiStandIn
+from ingest.push_encoding import ENCODERS, snappy
+
+NUM_LINES = 100_000
+
+# LokiStandIn settings of each scenario
+PROFILES = {
+    "ideal": {},
+    "latency": {"latency": 0.05, "jitter": 0.05},
+    "faulty": {"error_rate": 0.01, "throttle_rate": 0.05},
+}
+
+
+async def upload(plugin, url: str, filename: str, encoding: str) -> dict:
+    """Run the dataset's upload_to_loki.py, returns its metrics summary
+
+    The uploader runs in its own process, configured through the
+    environment like a real upload, so the stand-in does not share its
+    event loop.
+    """
+    plugin_file = os.path.abspath(inspect.getfile(type(plugin)))
+    summary_file = f"{filename}.{encoding}.metrics.json"
+    # The stand-in has no rate limits, so only pace pushes if asked to
+    env = {"INGESTION_RATE_MB": "0", "PER_STREAM_RATE_LIMIT_MB": "0"}
+    env.update(
+        os.environ,
+        LOKI_URL=url,
+        PARSED_LOG_FILE=filename,
+        PUSH_ENCODING=encoding,
+        UPLOAD_JOURNAL=f"{filename}.journal",
+        METRICS_SUMMARY=summary_file,
+        METRICS_PORT="",
+    )
+    process = await asyncio.create_subprocess_exec(
+        sys.executable,
+        "upload_to_loki.py",
+        cwd=os.path.dirname(plugin_file),
+        env=env,
+        stdout=asyncio.subprocess.DEVNULL,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    _, stderr = await process.communicate()
+    if process.returncode:
+        raise RuntimeError(
+            f"upload_to_loki.py failed with {encoding}:\n"
+            + stderr.decode("utf-8", "replace")[-2000:]
+        )
+    with open(summary_file) as fd:
+        return json.load(fd)
+
+
+async def benchmark(plugin, filename: str, num_lines: int):
+    encodings = [
+        encoding
+        for encoding in ENCODERS
+        if encoding != "protobuf" or snappy is not None
+    ]
+    if len(encodings) < len(ENCODERS):
+        print("protobuf skipped, python-snappy is not installed")
+    print(
+        f"{'profile':<9} {'encoding':<9} {'lines/s':>9} "
+        f"{'p99 ms':>8} {'retries':>8} {'MB sent':>8}"
+    )
+    for profile, settings in PROFILES.items():
+        stand_in = LokiStandIn(seed=0, **settings)
+        url = await stand_in.start()
+        try:
+            for encoding in encodings:
+                stand_in.reset()
+                summary = await upload(plugin, url, filename, encoding)
+                p99 = summary["push_latency_seconds"]["p99"] or 0.0
+                print(
+                    f"{profile:<9} {encoding:<9} "
+                    f"{summary['lines_per_second']:>9.0f} "
+                    f"{p99 * 1000:>8.1f} {summary['retries']:>8} "
+                    f"{summary['sent_bytes'] / 1e6:>8.2f}"
+                )
+                if stand_in.lines != num_lines:
+                    print(
+                        f"  the stand-in accepted {stand_in.lines} of "
+                        f"{num_lines} lines"
+                    )
+        finally:
+            await stand_in.stop()
+
+
+def main(plugin):
+    entries = list(islice(iter_logs(plugin.parsed_log_file), NUM_LINES))
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, "parsed.ndjson")
+        write_logs(filename, entries, plugin)
+        mode = os.getenv("UPLOAD_MODE", "now")
+        print(f"{plugin.dataset}, {len(entries)} entries, {mode} upload mode")
+        asyncio.run(benchmark(plugin, filename, len(entries)))
@@ -0,0 +1,187 @@
+"""Streaming Drain log template miner.
+
+Drain (He et al., ICWS 2017) assigns each log content to a template in one
+pass: the content's token count and first tokens lead down a fixed-depth
+parse tree to a leaf holding a few templates, the content joins the most
+similar one if it is similar enough, and the tokens where they differ
+become wildcards. Otherwise the content starts a new template.
+
+Templates are kept in least recently used order and the oldest ones are
+dropped beyond max_templates, with the tree nodes they leave empty, so
+memory stays bounded on logs with unbounded variety. A dropped template
+that shows up again gets a new id.
+"""
+
+import csv
+import re
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence
+
+WILDCARD = "<*>"
+_DIGIT = re.compile(r"\d")
+
+
+class LogTemplate:
+    """A template: its tokens, where WILDCARD stands for variable ones"""
+
+    __slots__ = ("id", "tokens", "size", "_path")
+
+    def __init__(self, id: int, tokens: List[str], path: List[tuple]):
+        self.id = id
+        self.tokens = tokens
+        self.size = 1  # Contents matched
+        # (node, key) pairs from the root down to the templates of the leaf
+        self._path = path
+
+    @property
+    def template(self) -> str:
+        return " ".join(self.tokens)
+
+
+class DrainMiner:
+    """Assign contents to templates incrementally, see the module doc
+
+    depth counts the tree levels as in the Drain paper: the root and the
+    token count levels plus depth - 2 levels of leading tokens. A content
+    joins a template when the share of their tokens that are equal, not
+    counting the template's wildcards, is at least similarity. masks are
+    replaced by WILDCARD before tokenizing, e.g. IP addresses or block
+    ids, and tokens with digits or masks never pick a tree branch of
+    their own.
+    """
+
+    def __init__(
+        self,
+        depth: int = 4,
+        similarity: float = 0.5,
+        max_children: int = 100,
+        max_templates: Optional[int] = None,
+        masks: Sequence[re.Pattern] = (),
+    ):
+        self.depth = max(depth - 2, 1)
+        self.similarity = similarity
+        self.max_children = max_children
+        self.max_templates = max_templates
+        self.masks = list(masks)
+        # Token count -> nested {token: child} nodes, the None key of the
+        # last node holding the templates of the leaf
+        self._root: Dict[int, dict] = {}
+        self.templates: "OrderedDict[int, LogTemplate]" = OrderedDict()
+        self.evicted = 0
+        self._next_id = 1
+
+    def add(self, content: str) -> LogTemplate:
+        """The template of content, new or updated to cover it"""
+        for mask in self.masks:
+            content = mask.sub(WILDCARD, content)
+        tokens = content.split()
+        template = self._match(tokens)
+        if template is None:
+            path = self._leaf(tokens)
+            template = LogTemplate(self._next_id, tokens, path)
+            self._next_id += 1
+            node, key = path[-1]
+            node[key].append(template)
+            self.templates[template.id] = template
+            if (
+                self.max_templates is not None
+                and len(self.templates) > self.max_templates
+            ):
+                _, oldest = self.templates.popitem(last=False)
+                self._remove(oldest)
+                self.evicted += 1
+            return template
+
+        if template.tokens != tokens:
+            template.tokens = [
+                old if old == new else WILDCARD
+                for old, new in zip(template.tokens, tokens)
+            ]
+        template.size += 1
+        self.templates.move_to_end(template.id)
+        return template
+
+    @staticmethod
+    def _branch(token: str) -> str:
+        if WILDCARD in token or _DIGIT.search(token):
+            return WILDCARD
+        return token
+
+    def _match(self, tokens: List[str]) -> Optional[LogTemplate]:
+        """Most similar template of the leaf of tokens, if similar enough"""
+        node = self._root.get(len(tokens))
+        if node is None:
+            return None
+        for token in tokens[:self.depth]:
+            child = node.get(self._branch(token))
+            if child is None:
+                child = node.get(WILDCARD)
+                if child is None:
+                    return None
+            node = child
+
+        best = None
+        best_similarity = best_wildcards = -1
+        for template in node.get(None, ()):
+            equal = wildcards = 0
+            for old, new in zip(template.tokens, tokens):
+                if old == WILDCARD:
+                    wildcards += 1
+                elif old == new:
+                    equal += 1
+            similarity = equal / len(tokens) if tokens else 1.0
+            if similarity > best_similarity or (
+                similarity == best_similarity and wildcards > best_wildcards
+            ):
+                best = template
+                best_similarity = similarity
+                best_wildcards = wildcards
+        if best is None or best_similarity < self.similarity:
+            return None
+        return best
+
+    def _leaf(self, tokens: List[str]) -> List[tuple]:
+        """The path to the templates list of the leaf of tokens
+
+        The nodes and the list are added if missing. A node keeps a slot
+        for the wildcard branch, which takes the tokens once the other
+        max_children - 1 are taken.
+        """
+        path = [(self._root, len(tokens))]
+        node = self._root.setdefault(len(tokens), {})
+        for token in tokens[:self.depth]:
+            token = self._branch(token)
+            child = node.get(token)
+            if child is None:
+                if token != WILDCARD and (
+                    len(node) + (WILDCARD not in node) >= self.max_children
+                ):
+                    token = WILDCARD
+                child = node.setdefault(token, {})
+            path.append((node, token))
+            node = child
+        node.setdefault(None, [])
+        path.append((node, None))
+        return path
+
+    def _remove(self, template: LogTemplate):
+        """Remove a template, and the nodes of its path left empty"""
+        node, key = template._path[-1]
+        node[key].remove(template)
+        for node, key in reversed(template._path):
+            if node[key]:
+                break
+            del node[key]
+
+    def write_templates(self, filename: str):
+        """Write the templates kept, most matched first, as a CSV"""
+        with open(filename, "w", newline="") as fd:
+            writer = csv.writer(fd)
+            writer.writerow(["TemplateId", "Template", "Occurrences"])
+            templates = sorted(
+                self.templates.values(), key=lambda t: (-t.size, t.id)
+            )
+            for template in templates:
+                writer.writerow(
+                    [template.id, template.template, template.size]
+                )
@@ -0,0 +1,96 @@
+"""Strip the message contents from raw LogHub lines, keeping the headers.
+
+The raw log is memory-mapped and the structured CSV is read in lockstep
+with it, one row per line, so neither is held in memory. Each line's
+content is located once, at its last occurrence in the line, and sliced
+out; the headers are collected into large writes.
+"""
+
+import csv
+import mmap
+import os
+from operator import itemgetter
+from typing import Iterator, Tuple
+
+from ingest.log_io import READ_CHUNK_SIZE
+
+# Headers are written in chunks of at least this many bytes
+FILTER_WRITE_SIZE = 4 << 20
+
+
+def _csv_contents(csvfile) -> Iterator[Tuple[str, str]]:
+    """LineId and Content of each row of a structured CSV"""
+    reader = csv.reader(csvfile)
+    fieldnames = next(reader, [])
+    return map(
+        itemgetter(fieldnames.index("LineId"), fieldnames.index("Content")),
+        reader,
+    )
+
+
+def _filter_lines(data: mmap.mmap, contents, outfile):
+    """Write the lines of data without the content of their CSV rows"""
+    view = memoryview(data)
+    out = bytearray()
+    size = len(data)
+    start = 0
+    line_number = 0
+    try:
+        for line_id, content in contents:
+            line_id = int(line_id)
+            if line_id <= line_number:
+                raise ValueError(
+                    f"The structured CSV is not sorted by LineId, {line_id} "
+                    f"comes after {line_number}"
+                )
+            if line_id > line_number + 1:
+                # Lines without a row are copied as they are
+                for _ in range(line_id - line_number - 1):
+                    end = data.find(b"\n", start)
+                    end = size if end < 0 else end + 1
+                    out += view[start:end]
+                    start = end
+            if start >= size:
+                break
+            line_number = line_id
+
+            end = data.find(b"\n", start)
+            if end < 0:  # A last line without a trailing newline
+                end = size
+            content = content.encode("utf-8")
+            cut = data.rfind(content, start, end)
+            if cut < 0:
+                line = data[start:end]
+            else:
+                line = data[start:cut]
+                if cut + len(content) < end:
+                    line += data[cut + len(content):end]
+            out += line.strip()
+            out += b"\n"
+            start = end + 1
+            if len(out) >= FILTER_WRITE_SIZE:
+                outfile.write(out)
+                out.clear()
+        out += view[start:]
+        outfile.write(out)
+    finally:
+        view.release()
+
+
+def filter_logs(original_log_file, parsed_log_file, output_log_file):
+    """Write the lines of the raw log without the contents in the CSV
+
+    Lines without a row in the CSV are copied as they are.
+    """
+    with open(original_log_file, "rb") as infile, open(
+        parsed_log_file, "r", newline="", buffering=READ_CHUNK_SIZE
+    ) as csvfile, open(output_log_file, "wb") as outfile:
+        if os.fstat(infile.fileno()).st_size == 0:
+            return  # An empty file cannot be mapped
+        with mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            _filter_lines(data, _csv_contents(csvfile), outfile)
+
+
+def main(plugin):
+    filter_logs(plugin.log_file, plugin.structured_file, plugin.headers_file)
+    print(f"Processed loglines have been written to {plugin.headers_file}")
@@ -0,0 +1,124 @@
+"""Adaptive concurrency, rate limits and retry backoff for Loki pushes."""
+
+import asyncio
+import random
+import time
+from typing import Optional
+
+# Responses worth retrying: rate limited, or Loki / the gateway is
+# overloaded or restarting. Anything else 4xx is a bad request for good.
+RETRYABLE_STATUSES = frozenset({408, 429, 500, 502, 503, 504})
+
+
+class AimdLimiter:
+    """Bound the number of in-flight pushes with an AIMD limit
+
+    The limit grows by one for every limit successful pushes that finish
+    within target_latency (additive increase) and is multiplied by
+    decrease_factor when a push is rate limited, fails or is too slow
+    (multiplicative decrease), like TCP congestion control. Only one
+    decrease is applied per round of pushes: congestion signals from
+    pushes started before the last decrease are ignored.
+    """
+
+    def __init__(
+        self,
+        initial: int,
+        minimum: int,
+        maximum: int,
+        target_latency: float,
+        decrease_factor: float = 0.5,
+    ):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.target_latency = target_latency
+        self.decrease_factor = decrease_factor
+        self.limit = float(min(max(initial, minimum), maximum))
+        self.in_flight = 0
+        self._started = 0
+        self._decreased_at = 0
+        self._condition = asyncio.Condition()
+
+    async def acquire(self) -> int:
+        """Wait for a free slot, returns a ticket to pass to release"""
+        async with self._condition:
+            await self._condition.wait_for(
+                lambda: self.in_flight < int(self.limit)
+            )
+            self.in_flight += 1
+            self._started += 1
+            return self._started
+
+    async def release(self, ticket: int, latency: float, congested: bool):
+        """Free a slot and adjust the limit to how the push went"""
+        async with self._condition:
+            self.in_flight -= 1
+            if congested or latency > self.target_latency:
+                if ticket > self._decreased_at:
+                    self.limit = max(
+                        self.limit * self.decrease_factor, self.minimum
+                    )
+                    self._decreased_at = self._started
+            else:
+                self.limit = min(self.limit + 1 / self.limit, self.maximum)
+            self._condition.notify_all()
+
+
+class TokenBucket:
+    """Pace bytes to a sustained rate with bursts, like Loki's rate limits
+
+    Tokens, in bytes, refill at rate per second up to burst, as in the
+    token buckets of Loki's ingestion_rate_mb / ingestion_burst_size_mb
+    and per_stream_rate_limit / per_stream_rate_limit_burst. Callers wait
+    in turn for the bytes they take; a take larger than burst waits for a
+    full bucket and leaves it in debt, so it is still paced at rate.
+    """
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(
+            self.tokens + (now - self._updated) * self.rate, self.burst
+        )
+        self._updated = now
+
+    async def take(self, amount: float) -> float:
+        """Wait until amount bytes may be sent, returns the seconds waited"""
+        async with self._lock:
+            self._refill()
+            wait = (min(amount, self.burst) - self.tokens) / self.rate
+            if wait > 0:
+                await asyncio.sleep(wait)
+                self._refill()
+            self.tokens -= amount
+            return max(wait, 0.0)
+
+
+def backoff_delay(
+    attempt: int,
+    base: float,
+    cap: float,
+    retry_after: Optional[float] = None,
+) -> float:
+    """Full-jitter exponential backoff, at least retry_after if given"""
+    delay = random.uniform(0, min(cap, base * 2**attempt))
+    if retry_after is not None:
+        delay = max(delay, min(retry_after, cap))
+    return delay
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Seconds to wait from a Retry-After header given in seconds"""
+    if value is None:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:  # An HTTP date, rare enough to fall back to backoff
+        return None
+
@@ -0,0 +1,210 @@
+"""Parse the headers and contents of a dataset's log lines into entries.
+
+Contents come from LogHub's structured CSV next to the headers written by
+filter.py or, without one, are split from the raw log and mined into
+templates by Drain in the same pass.
+"""
+
+import csv
+import os
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import Dict
+
+from dotenv import find_dotenv, load_dotenv
+
+from ingest.drain import DrainMiner
+from ingest.log_io import (
+    READ_CHUNK_SIZE,
+    line_chunks,
+    read_chunk,
+    write_blocks,
+)
+from ingest.records import encode_records, write_records
+
+
+def _parse_lines(plugin, lines, csv_content, first_line_id=1):
+    for line_id, line in enumerate(lines, first_line_id):
+        content = csv_content[line_id]
+        fields = plugin.extract_fields(line, content)
+        if fields is None:
+            continue
+        # Validated a block at a time by records.encode_records
+        yield (*fields, content)
+
+
+def _read_csv_content(csvfile, fieldnames=None) -> Dict[int, str]:
+    csv_content = defaultdict(str)
+    for row in csv.DictReader(csvfile, fieldnames=fieldnames):
+        csv_content[int(row["LineId"])] = row["Content"]
+    return csv_content
+
+
+def parse_log(plugin, log_file, csv_file):
+    """Yield one parsed record per log line with a valid timestamp"""
+    with open(csv_file, "r") as csvfile:
+        csv_content = _read_csv_content(csvfile)
+
+    with open(log_file, "r") as file:
+        yield from _parse_lines(plugin, file, csv_content)
+
+
+def parse_raw_log(plugin, log_file, miner: DrainMiner):
+    """Yield one parsed record per raw log line with a valid timestamp
+
+    The id of the Drain template of each content is added to the
+    structured metadata as template_id.
+    """
+    with open(log_file, "r", buffering=READ_CHUNK_SIZE) as file:
+        for line in file:
+            header, content = plugin.split_line(line)
+            fields = plugin.extract_fields(header, content)
+            if fields is None:
+                continue
+            labels, structured_metadata, timestamp = fields
+            template = miner.add(content)
+            structured_metadata = dict(
+                structured_metadata, template_id=str(template.id)
+            )
+            yield labels, structured_metadata, timestamp, content
+
+
+def _parse_chunk(task):
+    (
+        plugin,
+        log_file,
+        log_chunk,
+        csv_file,
+        csv_chunk,
+        fieldnames,
+        output_file,
+    ) = task
+    log_start, log_end, first_line_id = log_chunk
+    csv_content = _read_csv_content(
+        read_chunk(csv_file, *csv_chunk), fieldnames
+    )
+    lines = read_chunk(log_file, log_start, log_end)
+    records = list(_parse_lines(plugin, lines, csv_content, first_line_id))
+    return encode_records(output_file, records, plugin.record_schema)
+
+
+def parse_log_parallel(
+    plugin, log_file, csv_file, output_file, workers, chunk_lines
+):
+    """Parse the log in chunks on a process pool
+
+    The headers file and the structured CSV are split at the same line
+    boundaries, relying on the CSV holding one row per log line in LineId
+    order. Yields blocks encoded for output_file in the original line
+    order, with at most two chunks per worker held in memory.
+    """
+    log_chunks = line_chunks(log_file, chunk_lines)
+    csv_chunks = line_chunks(csv_file, chunk_lines, skip_lines=1)
+    log_lines = sum(num_lines for _, _, num_lines in log_chunks)
+    csv_lines = sum(num_lines for _, _, num_lines in csv_chunks)
+    if log_lines != csv_lines:
+        print(
+            f"{log_file} has {log_lines} lines but {csv_file} has "
+            f"{csv_lines} rows, parsing on a single core"
+        )
+        records = parse_log(plugin, log_file, csv_file)
+        while block := list(islice(records, chunk_lines)):
+            yield encode_records(output_file, block, plugin.record_schema)
+        return
+
+    with open(csv_file, "r") as csvfile:
+        fieldnames = next(csv.reader(csvfile))
+
+    tasks = []
+    first_line_id = 1
+    for (log_start, log_end, num_lines), (csv_start, csv_end, _) in zip(
+        log_chunks, csv_chunks
+    ):
+        tasks.append(
+            (
+                plugin,
+                log_file,
+                (log_start, log_end, first_line_id),
+                csv_file,
+                (csv_start, csv_end),
+                fieldnames,
+                output_file,
+            )
+        )
+        first_line_id += num_lines
+
+    with ProcessPoolExecutor(workers) as pool:
+        pending = deque()
+        for task in tasks:
+            pending.append(pool.submit(_parse_chunk, task))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def main(plugin):
+    load_dotenv(find_dotenv(usecwd=True))
+
+    output_file_path = plugin.parsed_log_file
+    log_file_path = plugin.headers_file
+    csv_file_path = plugin.structured_file
+
+    workers = int(os.getenv("PARSE_WORKERS", os.cpu_count() or 1))
+    chunk_lines = int(os.getenv("PARSE_CHUNK_LINES", 100_000))
+    # "structured" reads the contents from the structured CSV, "drain"
+    # mines them from the raw log, "auto" uses the CSV if there is one
+    content_source = os.getenv("CONTENT_SOURCE", "auto")
+    # Templates kept by Drain, the least recently matched are dropped
+    max_templates = int(os.getenv("DRAIN_MAX_TEMPLATES", 10_000))
+
+    if content_source == "auto":
+        content_source = (
+            "structured" if os.path.exists(csv_file_path) else "drain"
+        )
+    if content_source not in ("structured", "drain"):
+        raise ValueError(
+            "CONTENT_SOURCE must be auto, structured or drain, not "
+            f"{content_source!r}"
+        )
+
+    if content_source == "drain":
+        if plugin.content_pattern is None:
+            raise ValueError(
+                f"{plugin.dataset} has no content_pattern to split its raw "
+                "lines, parse it with its structured CSV"
+            )
+        miner = DrainMiner(
+            plugin.drain_depth,
+            plugin.drain_similarity,
+            max_templates=max_templates,
+            masks=plugin.drain_masks,
+        )
+        records = parse_raw_log(plugin, plugin.log_file, miner)
+        num_entries = write_records(
+            output_file_path, records, plugin.record_schema
+        )
+        miner.write_templates(plugin.templates_file)
+        print(
+            f"{len(miner.templates)} templates written to "
+            f"{plugin.templates_file}"
+        )
+        if miner.evicted:
+            print(f"{miner.evicted} least recently matched templates dropped")
+    elif workers > 1:
+        blocks = parse_log_parallel(
+            plugin,
+            log_file_path,
+            csv_file_path,
+            output_file_path,
+            workers,
+            chunk_lines,
+        )
+        num_entries = write_blocks(output_file_path, blocks, plugin)
+    else:
+        records = parse_log(plugin, log_file_path, csv_file_path)
+        num_entries = write_records(
+            output_file_path, records, plugin.record_schema
+        )
+    print(f"{num_entries} parsed entries written to {output_file_path}")
@@ -0,0 +1,343 @@
+"""Advise which fields to make stream labels, from their cardinality.
+
+Every distinct label set is a Loki stream with its own index entries and
+chunks, so a high-cardinality label such as a request or block id turns a
+dataset into millions of tiny streams. This scans a parsed_*_logs file
+once and estimates, with HyperLogLog sketches in fixed memory, the
+distinct values of every label and structured metadata field and the
+streams of the current labels, of the labels without each one and of the
+labels plus each metadata field. Bytes per stream are counted exactly for
+the current labels. Fields are then recommended as labels or as
+structured metadata, against the thresholds below.
+"""
+
+import json
+import math
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+from ingest.log_io import iter_logs
+
+# A field with more distinct values than this is structured metadata
+LABEL_MAX_VALUES = int(os.getenv("LABEL_MAX_VALUES", 100))
+# A metadata field set on a smaller share of the entries stays metadata
+LABEL_MIN_COVERAGE = float(os.getenv("LABEL_MIN_COVERAGE", 0.9))
+# Loki's max_global_streams_per_user, chunk_target_size,
+# max_label_names_per_series and max_label_value_length defaults
+MAX_STREAMS = int(os.getenv("MAX_STREAMS", 5000))
+CHUNK_TARGET_SIZE = int(os.getenv("CHUNK_TARGET_SIZE", 1572864))
+MAX_LABEL_NAMES = 15
+MAX_LABEL_VALUE_LENGTH = 2048
+# Streams whose bytes are counted exactly, the rest are only estimated
+MAX_TRACKED_STREAMS = 100_000
+# 2**precision registers per sketch, a standard error of 1.04 / 2**(p/2)
+HLL_PRECISION = 12
+
+MASK64 = (1 << 64) - 1
+
+
+def _mix(value: int) -> int:
+    """splitmix64 finalizer, spreads Python hashes over 64 bits"""
+    value = (value ^ (value >> 30)) * 0xBF58476D1CE4E5B9 & MASK64
+    value = (value ^ (value >> 27)) * 0x94D049BB133111EB & MASK64
+    return value ^ (value >> 31)
+
+
+class HyperLogLog:
+    """Estimate the distinct hashable values added, in 2**precision bytes
+
+    Values are hashed with Python's hash(), which is seeded per process,
+    so sketches can only be compared and merged within one run.
+    """
+
+    def __init__(self, precision: int = HLL_PRECISION):
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+        self._shift = 64 - precision
+        self._low_mask = (1 << self._shift) - 1
+
+    def add(self, value: Any):
+        hashed = _mix(hash(value) & MASK64)
+        index = hashed >> self._shift
+        rank = self._shift - (hashed & self._low_mask).bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other: "HyperLogLog"):
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def count(self) -> int:
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0**-r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            # Linear counting is more accurate for small cardinalities
+            estimate = m * math.log(m / zeros)
+        return round(estimate)
+
+
+class FieldStats:
+    """Distinct values, coverage and value lengths of one field"""
+
+    def __init__(self, name: str, kind: str):
+        self.name = name
+        self.kind = kind  # "label" or "metadata"
+        self.values = HyperLogLog()
+        self.present = 0
+        self.max_length = 0
+
+    @property
+    def distinct(self) -> int:
+        """Estimated distinct values, at most the values seen"""
+        return min(self.values.count(), self.present)
+
+    def add(self, value: Optional[str]):
+        if value is None:
+            return
+        value = str(value)
+        self.values.add(value)
+        self.present += 1
+        if len(value) > self.max_length:
+            self.max_length = len(value)
+
+
+class LabelAnalysis:
+    """Field and stream statistics of parsed entries, see the module doc"""
+
+    def __init__(self, plugin):
+        self.plugin = plugin
+        self.label_names = list(plugin.labels_model.model_fields)
+        self.metadata_names = list(plugin.metadata_model.model_fields)
+        self.fields = [
+            FieldStats(name, "label") for name in self.label_names
+        ] + [FieldStats(name, "metadata") for name in self.metadata_names]
+        # Label names of each candidate schema: the current one, without
+        # each label and with each metadata field
+        self.schemas: Dict[str, Tuple[str, ...]] = {
+            "current": tuple(self.label_names)
+        }
+        for name in self.label_names:
+            self.schemas[f"-{name}"] = tuple(
+                label for label in self.label_names if label != name
+            )
+        for name in self.metadata_names:
+            self.schemas[f"+{name}"] = tuple(self.label_names) + (name,)
+        self._schema_streams = {
+            schema: HyperLogLog() for schema in self.schemas
+        }
+        self.stream_bytes: Dict[tuple, List[int]] = {}  # [lines, bytes]
+        self.untracked_lines = 0
+        self.lines = 0
+        self.bytes = 0
+
+    def add(self, entry: Dict[str, Any]):
+        labels = entry["labels"]
+        metadata = entry["structured_metadata"] or {}
+        for field in self.fields:
+            source = labels if field.kind == "label" else metadata
+            field.add(source.get(field.name))
+
+        key = tuple(labels.get(name) for name in self.label_names)
+        size = len(self.plugin.line(entry["content"]).encode("utf-8"))
+        for name, value in metadata.items():
+            if value is not None:
+                size += len(name) + len(str(value).encode("utf-8"))
+        self.lines += 1
+        self.bytes += size
+        counts = self.stream_bytes.get(key)
+        if counts is None and len(self.stream_bytes) < MAX_TRACKED_STREAMS:
+            counts = self.stream_bytes[key] = [0, 0]
+        if counts is None:
+            self.untracked_lines += 1
+        else:
+            counts[0] += 1
+            counts[1] += size
+
+        num_labels = len(self.label_names)
+        for schema, names in self.schemas.items():
+            if schema == "current":
+                values = key
+            elif schema[0] == "-":
+                values = tuple(
+                    value
+                    for name, value in zip(self.label_names, key)
+                    if name != schema[1:]
+                )
+            else:
+                values = key + (metadata.get(names[num_labels]),)
+            self._schema_streams[schema].add(values)
+
+    def streams(self, schema: str = "current") -> int:
+        """Streams of a candidate schema, exact for the tracked ones"""
+        if schema == "current" and not self.untracked_lines:
+            return len(self.stream_bytes)
+        return self._schema_streams[schema].count()
+
+    def stream_sizes(self) -> Dict[str, Any]:
+        """Bytes per stream of the current labels"""
+        sizes = sorted(counts[1] for counts in self.stream_bytes.values())
+        if not sizes:
+            return {"count": 0}
+
+        def quantile(q):
+            return sizes[max(math.ceil(q * len(sizes)) - 1, 0)]
+
+        return {
+            "count": len(sizes),
+            "min": sizes[0],
+            "p50": quantile(0.5),
+            "p90": quantile(0.9),
+            "max": sizes[-1],
+            "mean": round(sum(sizes) / len(sizes)),
+            "below_chunk_target": sum(
+                size < CHUNK_TARGET_SIZE for size in sizes
+            ),
+            "untracked_lines": self.untracked_lines,
+        }
+
+    def _mean_stream_bytes(self, schema: str) -> float:
+        return self.bytes / max(self.streams(schema), 1)
+
+    def recommend(self, field: FieldStats) -> Tuple[str, str]:
+        """"label" or "structured metadata" for a field, and why"""
+        distinct = field.distinct
+        coverage = field.present / max(self.lines, 1)
+        if field.max_length > MAX_LABEL_VALUE_LENGTH:
+            return "structured metadata", (
+                f"values up to {field.max_length} characters"
+            )
+        if distinct > LABEL_MAX_VALUES:
+            return "structured metadata", f"~{distinct} distinct"
+
+        if field.kind == "label":
+            if field.present == 0:
+                return "drop", "never set"
+            schema = f"-{field.name}"
+            without = self.streams(schema)
+            streams = self.streams()
+            if (
+                streams > without
+                and self._mean_stream_bytes("current") < CHUNK_TARGET_SIZE
+                and self._mean_stream_bytes(schema) >= CHUNK_TARGET_SIZE
+            ):
+                return "structured metadata", (
+                    f"splits {without} chunk-sized streams into {streams}"
+                )
+            if streams > MAX_STREAMS and without <= MAX_STREAMS:
+                return "structured metadata", (
+                    f"{streams} streams, {without} without it"
+                )
+            return "label", f"{distinct} distinct, {streams} streams"
+
+        schema = f"+{field.name}"
+        streams = self.streams(schema)
+        if coverage < LABEL_MIN_COVERAGE:
+            return "structured metadata", f"set on {coverage:.0%} of entries"
+        if len(self.label_names) >= MAX_LABEL_NAMES:
+            return "structured metadata", "no label names left"
+        if streams > MAX_STREAMS:
+            return "structured metadata", f"would make {streams} streams"
+        if (
+            streams > self.streams()
+            and self._mean_stream_bytes(schema) < CHUNK_TARGET_SIZE
+        ):
+            return "structured metadata", (
+                f"would make {streams} streams smaller than a chunk"
+            )
+        return "label", f"{distinct} distinct, would make {streams} streams"
+
+    def report(self) -> Dict[str, Any]:
+        fields = []
+        for field in self.fields:
+            placement, reason = self.recommend(field)
+            fields.append(
+                {
+                    "name": field.name,
+                    "kind": field.kind,
+                    "distinct_values": field.distinct,
+                    "coverage": round(field.present / max(self.lines, 1), 4),
+                    "max_length": field.max_length,
+                    "recommendation": placement,
+                    "reason": reason,
+                }
+            )
+        return {
+            "dataset": self.plugin.dataset,
+            "lines": self.lines,
+            "bytes": self.bytes,
+            "thresholds": {
+                "label_max_values": LABEL_MAX_VALUES,
+                "label_min_coverage": LABEL_MIN_COVERAGE,
+                "max_streams": MAX_STREAMS,
+                "chunk_target_size": CHUNK_TARGET_SIZE,
+            },
+            "fields": fields,
+            "schemas": {
+                schema: {
+                    "labels": list(names),
+                    "streams": self.streams(schema),
+                    "mean_stream_bytes": round(
+                        self._mean_stream_bytes(schema)
+                    ),
+                }
+                for schema, names in self.schemas.items()
+            },
+            "stream_bytes": self.stream_sizes(),
+        }
+
+
+def analyze(plugin, filename: str) -> LabelAnalysis:
+    analysis = LabelAnalysis(plugin)
+    for entry in iter_logs(filename):
+        analysis.add(entry)
+    return analysis
+
+
+def print_report(report: Dict[str, Any]):
+    print(
+        f"{report['dataset']}: {report['lines']} entries, "
+        f"{report['bytes'] / 1e6:.1f} MB of lines and metadata"
+    )
+    print()
+    print(
+        f"{'field':<16} {'kind':<9} {'distinct':>9} {'set':>5}  "
+        f"recommendation"
+    )
+    for field in report["fields"]:
+        print(
+            f"{field['name']:<16} {field['kind']:<9} "
+            f"{field['distinct_values']:>9} {field['coverage']:>5.0%}  "
+            f"{field['recommendation']}: {field['reason']}"
+        )
+    print()
+    print(f"{'schema':<20} {'streams':>9} {'MB/stream':>10}")
+    for schema, stats in report["schemas"].items():
+        print(
+            f"{schema:<20} {stats['streams']:>9} "
+            f"{stats['mean_stream_bytes'] / 1e6:>10.3f}"
+        )
+    sizes = report["stream_bytes"]
+    if sizes["count"]:
+        print()
+        print(
+            f"Bytes per stream: min {sizes['min']}, p50 {sizes['p50']}, "
+            f"p90 {sizes['p90']}, max {sizes['max']}; "
+            f"{sizes['below_chunk_target']} of {sizes['count']} streams "
+            f"hold less than a {CHUNK_TARGET_SIZE} byte chunk"
+        )
+
+
+def write_report(report: Dict[str, Any], filename: str):
+    with open(filename, "w") as fd:
+        json.dump(report, fd, indent=2)
+        fd.write("\n")
+
+
+def main(plugin):
+    filename = plugin.parsed_log_file
+    report = analyze(plugin, filename).report()
+    print_report(report)
+    report_file = os.getenv("LABEL_REPORT", f"{filename}.labels.json")
+    write_report(report, report_file)
+    print(f"\nThe report has been written to {report_file}")
@@ -0,0 +1,67 @@
+"""Interned stream label sets, shared by the entries of a stream.
+
+A dataset has few distinct streams: OpenSSH always pushes
+{application: openssh, hostname: LabSZ} and HDFS a few dozen level and
+component pairs. Each distinct label set is interned once as a LabelSet
+with a small id, entries refer to it instead of carrying their own labels
+dict, and the push encoders cache their serialized form of the labels on
+it instead of serializing them again for every batch.
+"""
+
+from typing import Any, Callable, Dict, List
+
+
+class LabelSet(dict):
+    """The labels of a Loki stream, interned by a LabelSetTable
+
+    It is the labels dict itself, so payloads holding it serialize as
+    before. It must not be modified once interned.
+    """
+
+    __slots__ = ("id", "key", "_fragments")
+
+    def __init__(self, id: int, key: tuple, labels: Dict[str, Any]):
+        super().__init__(labels)
+        self.id = id
+        self.key = key  # Sorted label pairs
+        self._fragments: Dict[str, Any] = {}
+
+    def fragment(self, name: str, encode: Callable[[Dict], Any]) -> Any:
+        """encode(self), computed once per name"""
+        fragment = self._fragments.get(name)
+        if fragment is None:
+            fragment = self._fragments[name] = encode(self)
+        return fragment
+
+
+class LabelSetTable:
+    """The distinct label sets of an upload, numbered from 0"""
+
+    def __init__(self):
+        self._by_key: Dict[tuple, LabelSet] = {}
+        self._by_id: List[LabelSet] = []
+
+    def __len__(self) -> int:
+        return len(self._by_id)
+
+    def __getitem__(self, id: int) -> LabelSet:
+        return self._by_id[id]
+
+    def intern(self, labels: Dict[str, Any]) -> LabelSet:
+        """The LabelSet equal to labels, added if it is new"""
+        key = tuple(sorted(labels.items()))
+        label_set = self._by_key.get(key)
+        if label_set is None:
+            label_set = LabelSet(len(self._by_id), key, labels)
+            self._by_key[key] = label_set
+            self._by_id.append(label_set)
+        return label_set
+
+
+def cached_fragment(
+    labels: Dict[str, Any], name: str, encode: Callable[[Dict], Any]
+) -> Any:
+    """encode(labels), cached on labels if it is an interned LabelSet"""
+    if type(labels) is LabelSet:
+        return labels.fragment(name, encode)
+    return encode(labels)
@@ -0,0 +1,330 @@
+"""Readers and writers for the parsed_*_logs intermediate files.
+
+The format is picked from the file suffix:
+
+- .json: a JSON array, one entry per line
+- .ndjson / .jsonl: newline-delimited JSON, one entry per line
+- .parquet: columnar file with a typed timestamp column and struct columns
+  for labels and structured metadata (requires pyarrow)
+
+Writers take the parser plugin of the dataset, whose models give the
+Parquet schema.
+"""
+
+import io
+import json
+import os
+import re
+from datetime import datetime
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow is only needed for .parquet files
+    pa = None
+    pq = None
+
+READ_CHUNK_SIZE = 1 << 16
+WRITE_BUFFER_SIZE = 1 << 20
+SCAN_BLOCK_SIZE = 1 << 20
+# Entries per encoded block, which is also the Parquet row group size
+BLOCK_SIZE = 64 * 1024
+
+JSON_SUFFIXES = (".json",)
+NDJSON_SUFFIXES = (".ndjson", ".jsonl")
+PARQUET_SUFFIXES = (".parquet",)
+
+_WHITESPACE = re.compile(r"\s*")
+
+
+def _log_format(filename: str) -> str:
+    suffix = os.path.splitext(filename)[1].lower()
+    if suffix in JSON_SUFFIXES:
+        return "json"
+    if suffix in NDJSON_SUFFIXES:
+        return "ndjson"
+    if suffix in PARQUET_SUFFIXES:
+        if pa is None:
+            raise RuntimeError(
+                "Parquet log files require pyarrow: pip install pyarrow"
+            )
+        return "parquet"
+    raise ValueError(f"Unsupported log file format: {filename}")
+
+
+def _parquet_schema(plugin) -> "pa.Schema":
+    def struct(model):
+        return pa.struct([(name, pa.string()) for name in model.model_fields])
+
+    return pa.schema(
+        [
+            ("timestamp", pa.timestamp("us")),
+            ("labels", struct(plugin.labels_model)),
+            ("structured_metadata", struct(plugin.metadata_model)),
+            ("content", pa.string()),
+        ]
+    )
+
+
+def iter_logs(filename: str, skip: int = 0) -> Iterator[Dict]:
+    """Yield parsed log entries one at a time, whatever the file format
+
+    The first skip entries are passed over, without being decoded for
+    NDJSON and Parquet files.
+    """
+    log_format = _log_format(filename)
+    if log_format == "json":
+        return islice(iter_json_array(filename), skip, None)
+    if log_format == "ndjson":
+        return iter_ndjson(filename, skip)
+    return iter_parquet(filename, skip)
+
+
+def count_logs(filename: str) -> int:
+    """Number of entries in a parsed log file
+
+    Parquet files keep the count in their metadata and newline-delimited
+    files are counted at disk speed, blank lines included.
+    """
+    log_format = _log_format(filename)
+    if log_format == "parquet":
+        return pq.ParquetFile(filename).metadata.num_rows
+    if log_format == "json":
+        return sum(1 for _ in iter_json_array(filename))
+    count = 0
+    last_byte = b"\n"
+    with open(filename, "rb") as fd:
+        while block := fd.read(SCAN_BLOCK_SIZE):
+            count += block.count(b"\n")
+            last_byte = block[-1:]
+    return count + (last_byte != b"\n")
+
+
+def write_logs(filename: str, entries: Iterable[Dict], plugin) -> int:
+    """Write log entries in the format given by the suffix of filename
+
+    The file is written next to its destination and moved into place once
+    complete, so filename may be the file the entries are read from.
+    Returns the number of entries written.
+    """
+    entries = iter(entries)
+    blocks = iter(
+        lambda: encode_block(
+            filename, list(islice(entries, BLOCK_SIZE)), plugin
+        ),
+        (0, None),
+    )
+    return write_blocks(filename, blocks, plugin)
+
+
+def encode_block(
+    filename: str, entries: List[Dict], plugin
+) -> Tuple[int, Any]:
+    """Serialize entries into a block for write_blocks
+
+    Blocks can be encoded in worker processes and written in order by the
+    parent. Returns the number of entries and the encoded block, or
+    (0, None) when there are no entries.
+    """
+    if not entries:
+        return 0, None
+    log_format = _log_format(filename)
+    if log_format == "parquet":
+        rows = []
+        for entry in entries:
+            row = dict(entry)
+            if isinstance(row["timestamp"], str):
+                row["timestamp"] = datetime.fromisoformat(row["timestamp"])
+            rows.append(row)
+        table = pa.Table.from_pylist(rows, schema=_parquet_schema(plugin))
+        return len(rows), table
+
+    separator = ",\n" if log_format == "json" else "\n"
+    text = separator.join(json.dumps(entry) for entry in entries)
+    if log_format == "ndjson":
+        text += "\n"
+    return len(entries), text
+
+
+def write_blocks(
+    filename: str, blocks: Iterable[Tuple[int, Any]], plugin
+) -> int:
+    """Write blocks made by encode_block, see write_logs"""
+    log_format = _log_format(filename)
+    tmp_filename = f"{filename}.tmp"
+    count = 0
+    if log_format == "parquet":
+        schema = _parquet_schema(plugin)
+        with pq.ParquetWriter(tmp_filename, schema) as writer:
+            for num_entries, table in blocks:
+                if num_entries:
+                    writer.write_table(table)
+                    count += num_entries
+    else:
+        with open(tmp_filename, "w", buffering=WRITE_BUFFER_SIZE) as fd:
+            if log_format == "json":
+                fd.write("[\n")
+            for num_entries, text in blocks:
+                if not num_entries:
+                    continue
+                if log_format == "json" and count:
+                    fd.write(",\n")
+                fd.write(text)
+                count += num_entries
+            if log_format == "json":
+                fd.write("\n]\n")
+    os.replace(tmp_filename, filename)
+    return count
+
+
+def line_chunks(
+    filename: str, chunk_lines: int, skip_lines: int = 0
+) -> List[Tuple[int, int, int]]:
+    """Split a text file at line boundaries
+
+    Returns (start, end, num_lines) byte ranges of chunk_lines lines each,
+    the last one possibly shorter, after skipping the first skip_lines
+    lines. Only the blocks holding a chunk boundary are scanned line by
+    line, so this runs close to disk speed.
+    """
+    chunks = []
+    with open(filename, "rb") as fd:
+        for _ in range(skip_lines):
+            fd.readline()
+        start = position = fd.tell()
+        lines = 0
+        last_byte = b"\n"
+        while block := fd.read(SCAN_BLOCK_SIZE):
+            index = 0
+            while True:
+                needed = chunk_lines - lines
+                remaining = block.count(b"\n", index)
+                if remaining < needed:
+                    lines += remaining
+                    break
+                for _ in range(needed):
+                    index = block.index(b"\n", index) + 1
+                chunks.append((start, position + index, chunk_lines))
+                start = position + index
+                lines = 0
+            position += len(block)
+            last_byte = block[-1:]
+        if position > start:
+            # A last line without a trailing newline still counts
+            lines += last_byte != b"\n"
+            chunks.append((start, position, lines))
+    return chunks
+
+
+def read_chunk(filename: str, start: int, end: int) -> io.TextIOWrapper:
+    """Open the [start, end) byte range of a file as text"""
+    with open(filename, "rb") as fd:
+        fd.seek(start)
+        data = fd.read(end - start)
+    return io.TextIOWrapper(io.BytesIO(data))
+
+
+def iter_ndjson(filename: str, skip: int = 0) -> Iterator[Dict]:
+    """Yield the entries of a newline-delimited JSON file"""
+    with open(filename, "r", buffering=READ_CHUNK_SIZE) as fd:
+        for line in fd:
+            if line.strip():
+                if skip:
+                    skip -= 1
+                    continue
+                yield json.loads(line)
+
+
+def iter_parquet(filename: str, skip: int = 0) -> Iterator[Dict]:
+    """Yield the entries of a memory-mapped Parquet file
+
+    Timestamps are formatted as ISO strings, as in the JSON formats.
+    Row groups holding only skipped entries are not read.
+    """
+    parquet_file = pq.ParquetFile(filename, memory_map=True)
+    row_groups = []
+    for index in range(parquet_file.num_row_groups):
+        num_rows = parquet_file.metadata.row_group(index).num_rows
+        if not row_groups and skip >= num_rows:
+            skip -= num_rows
+        else:
+            row_groups.append(index)
+    if not row_groups:
+        return
+    for record_batch in parquet_file.iter_batches(row_groups=row_groups):
+        if skip >= record_batch.num_rows:
+            skip -= record_batch.num_rows
+            continue
+        if skip:
+            record_batch = record_batch.slice(skip)
+            skip = 0
+        for entry in record_batch.to_pylist():
+            if entry["timestamp"] is not None:
+                entry["timestamp"] = entry["timestamp"].isoformat()
+            yield entry
+
+
+def iter_json_array(
+    filename: str, chunk_size: int = READ_CHUNK_SIZE
+) -> Iterator[Dict]:
+    """Yield the entries of a JSON array file one at a time
+
+    Only chunk_size characters plus the entry being decoded are held in
+    memory, so the first entry is available as soon as it has been read.
+    """
+    decoder = json.JSONDecoder()
+    with open(filename, "r") as fd:
+        buffer = fd.read(chunk_size)
+        pos = 0
+        started = False
+        expect_separator = False
+
+        while True:
+            pos = _WHITESPACE.match(buffer, pos).end()
+            if pos == len(buffer):
+                more = fd.read(chunk_size)
+                if not more:
+                    raise ValueError(f"{filename} ends inside the JSON array")
+                buffer = buffer[pos:] + more
+                pos = 0
+                continue
+
+            char = buffer[pos]
+            if not started:
+                if char != "[":
+                    raise ValueError(
+                        f"{filename} does not contain a JSON array"
+                    )
+                pos += 1
+                started = True
+                continue
+            if char == "]":
+                return
+            if expect_separator:
+                if char != ",":
+                    raise ValueError(
+                        f"Expected ',' in {filename}, found {char!r}"
+                    )
+                pos += 1
+                expect_separator = False
+                continue
+
+            try:
+                entry, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                # The entry continues past the buffered text
+                more = fd.read(chunk_size)
+                if not more:
+                    raise
+                buffer = buffer[pos:] + more
+                pos = 0
+                continue
+
+            yield entry
+            pos = end
+            expect_separator = True
+            if pos > chunk_size:
+                buffer = buffer[pos:]
+                pos = 0
@@ -0,0 +1,270 @@
+"""An in-process stand-in for Loki's push API, for upload benchmarks.
+
+It accepts /loki/api/v1/push requests in every push encoding (JSON, gzip
+JSON and snappy protobuf), decodes them to count streams and lines, and
+answers like Loki's distributor after an optional latency. A share of the
+pushes can be answered with 500 errors and 429 rate limits to exercise the
+uploader's retries and concurrency control without running Loki.
+
+Run it on its own with `python -m ingest.loki_stand_in --port 3100` from
+the logs directory.
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
+
+from aiohttp import web
+
+from ingest.push_encoding import (
+    PROTOBUF_CONTENT_TYPE,
+    format_labels,
+    snappy,
+)
+
+PUSH_PATH = "/loki/api/v1/push"
+# Loki's default -distributor.max-recv-msg-size
+MAX_BODY_BYTES = 100 << 20
+GZIP_MAGIC = b"\x1f\x8b"
+
+# (labels, lines, line bytes) of each stream of a push request
+StreamCounts = List[Tuple[str, int, int]]
+
+
+def _read_varint(data: memoryview, pos: int) -> Tuple[int, int]:
+    result = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+
+def _fields(data: memoryview):
+    """(field number, value) of the varint and length-delimited fields"""
+    pos = 0
+    while pos < len(data):
+        key, pos = _read_varint(data, pos)
+        wire_type = key & 7
+        if wire_type == 0:
+            value, pos = _read_varint(data, pos)
+        elif wire_type == 2:
+            length, pos = _read_varint(data, pos)
+            value = data[pos:pos + length]
+            if len(value) != length:
+                raise ValueError("Truncated protobuf field")
+            pos += length
+        else:
+            raise ValueError(f"Unexpected protobuf wire type {wire_type}")
+        yield key >> 3, value
+
+
+def decode_protobuf(body: bytes) -> StreamCounts:
+    """Streams of a snappy-compressed logproto.PushRequest"""
+    if snappy is None:
+        raise RuntimeError(
+            "Protobuf pushes require python-snappy: pip install python-snappy"
+        )
+    request = memoryview(snappy.decompress(body))
+    streams = []
+    try:
+        for number, stream in _fields(request):
+            if number != 1:
+                continue
+            labels = ""
+            lines = line_bytes = 0
+            for field, value in _fields(stream):
+                if field == 1:
+                    labels = str(value, "utf-8")
+                elif field == 2:
+                    lines += 1
+                    for entry_field, entry_value in _fields(value):
+                        if entry_field == 2:
+                            line_bytes += len(entry_value)
+            streams.append((labels, lines, line_bytes))
+    except IndexError:  # A varint runs past the end
+        raise ValueError("Truncated protobuf message")
+    return streams
+
+
+def decode_json(body: bytes) -> StreamCounts:
+    """Streams of a JSON push request"""
+    streams = []
+    for stream in json.loads(body)["streams"]:
+        values = stream["values"]
+        line_bytes = sum(len(value[1].encode("utf-8")) for value in values)
+        streams.append(
+            (format_labels(stream["stream"]), len(values), line_bytes)
+        )
+    return streams
+
+
+class LokiStandIn:
+    """Answer Loki pushes with a configurable latency and failure rates
+
+    Every push waits latency seconds plus up to jitter seconds. A share
+    error_rate of the pushes is then answered with 500 and a share
+    throttle_rate with 429, sent with a Retry-After header if retry_after
+    is set. Only the lines of pushes answered with 204 are counted.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        throttle_rate: float = 0.0,
+        retry_after: Optional[int] = None,
+        seed: Optional[int] = None,
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self._random = random.Random(seed)
+        self._runner: Optional[web.AppRunner] = None
+        self.url: Optional[str] = None
+        self.reset()
+
+    def reset(self):
+        """Forget the pushes received so far"""
+        self.requests = 0
+        self.responses: Dict[int, int] = {}
+        self.body_bytes = 0
+        self.lines = 0
+        self.line_bytes = 0
+        self.streams: set = set()
+        self.tenant_lines: Dict[str, int] = {}  # By X-Scope-OrgID
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "responses": {
+                str(status): count
+                for status, count in sorted(self.responses.items())
+            },
+            "body_bytes": self.body_bytes,
+            "lines": self.lines,
+            "line_bytes": self.line_bytes,
+            "streams": len(self.streams),
+            "tenant_lines": self.tenant_lines,
+        }
+
+    def _decode(self, request: web.Request, body: bytes) -> StreamCounts:
+        # aiohttp already inflates bodies sent with Content-Encoding: gzip
+        if body[:2] == GZIP_MAGIC:
+            body = zlib.decompress(body, 31)
+        if request.content_type == PROTOBUF_CONTENT_TYPE:
+            return decode_protobuf(body)
+        return decode_json(body)
+
+    def _respond(self, status: int, text: str = "", headers=None):
+        self.responses[status] = self.responses.get(status, 0) + 1
+        return web.Response(status=status, text=text, headers=headers)
+
+    async def push(self, request: web.Request) -> web.Response:
+        body = await request.read()
+        self.requests += 1
+        self.body_bytes += request.content_length or len(body)
+        try:
+            streams = self._decode(request, body)
+        except (ValueError, KeyError, TypeError, IndexError, zlib.error) as e:
+            return self._respond(400, f"Bad push request: {e}")
+
+        delay = self.latency + self._random.uniform(0, self.jitter)
+        if delay:
+            await asyncio.sleep(delay)
+        draw = self._random.random()
+        if draw < self.error_rate:
+            return self._respond(500, "Injected ingester error")
+        if draw < self.error_rate + self.throttle_rate:
+            headers = None
+            if self.retry_after is not None:
+                headers = {"Retry-After": str(self.retry_after)}
+            return self._respond(
+                429, "Ingestion rate limit exceeded", headers
+            )
+
+        tenant = request.headers.get("X-Scope-OrgID", "")
+        for labels, lines, line_bytes in streams:
+            self.streams.add(labels)
+            self.lines += lines
+            self.line_bytes += line_bytes
+            self.tenant_lines[tenant] = (
+                self.tenant_lines.get(tenant, 0) + lines
+            )
+        return self._respond(204)
+
+    def application(self) -> web.Application:
+        async def ready(request):
+            return web.Response(text="ready")
+
+        async def stats(request):
+            return web.json_response(self.stats())
+
+        app = web.Application(client_max_size=MAX_BODY_BYTES)
+        app.router.add_post(PUSH_PATH, self.push)
+        app.router.add_get("/ready", ready)
+        app.router.add_get("/stats", stats)
+        return app
+
+    async def start(self, port: int = 0, host: str = "127.0.0.1") -> str:
+        """Listen on host:port, any free port if 0, returns the push URL"""
+        self._runner = web.AppRunner(self.application())
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = self._runner.addresses[0][1]
+        self.url = f"http://{host}:{port}{PUSH_PATH}"
+        return self.url
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=3100)
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="seconds per push"
+    )
+    parser.add_argument(
+        "--jitter", type=float, default=0.0, help="extra random seconds"
+    )
+    parser.add_argument(
+        "--error-rate", type=float, default=0.0, help="share answered 500"
+    )
+    parser.add_argument(
+        "--throttle-rate", type=float, default=0.0, help="share answered 429"
+    )
+    parser.add_argument(
+        "--retry-after", type=int, help="Retry-After seconds sent with 429"
+    )
+    args = parser.parse_args()
+    stand_in = LokiStandIn(
+        args.latency,
+        args.jitter,
+        args.error_rate,
+        args.throttle_rate,
+        args.retry_after,
+    )
+    print(
+        f"Accepting pushes on http://{args.host}:{args.port}{PUSH_PATH}, "
+        f"counts on /stats"
+    )
+    web.run_app(
+        stand_in.application(), host=args.host, port=args.port, print=None
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,7 @@
+from typing import Any, Dict
+
+from pydantic import BaseModel
+
+
+class LokiPayload(BaseModel):
+    streams: list[Dict[str, Any]]
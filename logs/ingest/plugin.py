@@ -0,0 +1,111 @@
+"""Base class of the per-dataset parser plugins."""
+
+import os
+import re
+from datetime import datetime
+from functools import cached_property
+from typing import Any, Dict, Optional, Sequence, Tuple, Type
+
+from pydantic import BaseModel
+
+from ingest.records import RecordSchema
+
+
+class ParserPlugin:
+    """How one LogHub dataset is parsed into Loki entries
+
+    A plugin names the dataset, points at the pydantic models of its
+    entries (the models.py next to it) and extracts labels, structured
+    metadata and the timestamp of a header line. Filtering, parsing,
+    rebasing and uploading are shared by the ingest engine.
+    """
+
+    # Value of the application label, used in parsed_<name>_logs files
+    name: str
+    # LogHub dataset name, the prefix of the raw and structured log files
+    dataset: str
+
+    labels_model: Type[BaseModel]
+    metadata_model: Type[BaseModel]
+    entry_model: Type[BaseModel]
+
+    # Timestamps of lines that do not match the header pattern of
+    # extract_fields: the first group of timestamp_pattern, parsed with
+    # strptime's timestamp_format
+    timestamp_pattern: re.Pattern
+    timestamp_format: str
+
+    # Entries rebased by update_timestamps.py when loading all of them
+    max_rebase_lines: Optional[int] = None
+
+    # Raw lines without a structured CSV: content_pattern matches the
+    # header up to the content, which is mined into templates by Drain
+    # with these parameters and masks, see ingest/drain.py
+    content_pattern: Optional[re.Pattern] = None
+    drain_depth: int = 4
+    drain_similarity: float = 0.5
+    drain_masks: Sequence[re.Pattern] = ()
+
+    @property
+    def log_file(self) -> str:
+        return f"{self.dataset}_full.log"
+
+    @property
+    def structured_file(self) -> str:
+        return f"{self.dataset}_full.log_structured.csv"
+
+    @property
+    def headers_file(self) -> str:
+        return f"{self.dataset}_headers.log"
+
+    @property
+    def templates_file(self) -> str:
+        return f"{self.dataset}_templates.csv"
+
+    @property
+    def parsed_log_file(self) -> str:
+        return os.getenv(
+            "PARSED_LOG_FILE", f"parsed_{self.name}_logs.ndjson"
+        )
+
+    @cached_property
+    def record_schema(self) -> RecordSchema:
+        """Field layout of the entries, derived from the models"""
+        return RecordSchema(self)
+
+    def extract_fields(
+        self, line: str, content: str
+    ) -> Optional[Tuple[Dict, Dict, datetime]]:
+        """Return labels, structured metadata and timestamp of a header line
+
+        Returns None for lines without a timestamp.
+        """
+        raise NotImplementedError
+
+    def split_line(self, line: str) -> Tuple[str, str]:
+        """Header and content of a raw line, by content_pattern
+
+        Lines that do not match are all header, as filter.py leaves the
+        lines without a structured row.
+        """
+        match = self.content_pattern.match(line)
+        if match is None:
+            return line.strip(), ""
+        return line[:match.end()].strip(), line[match.end():].strip()
+
+    def parse_timestamp(self, line: str) -> Optional[datetime]:
+        """Timestamp of a line in timestamp_format, None if there is none"""
+        match = self.timestamp_pattern.search(line)
+        if match is None:
+            return None
+        return datetime.strptime(match.group(1), self.timestamp_format)
+
+    def stream_labels(self, labels: Dict[str, Any]) -> Dict[str, Any]:
+        """The label set of the Loki stream of entries with these labels"""
+        return {
+            name: value for name, value in labels.items() if value is not None
+        }
+
+    def line(self, content: str) -> str:
+        """The log line pushed to Loki for an entry's content"""
+        return content
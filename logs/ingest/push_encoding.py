@@ -0,0 +1,185 @@
+"""Request body encoders for the Loki push API (/loki/api/v1/push)."""
+
+import io
+import json
+import os
+import zlib
+from typing import Any, Dict, Tuple
+
+from ingest.label_sets import cached_fragment
+from ingest.models import LokiPayload
+
+try:
+    import snappy
+except ImportError:  # python-snappy is only needed for protobuf pushes
+    snappy = None
+
+JSON_CONTENT_TYPE = "application/json"
+PROTOBUF_CONTENT_TYPE = "application/x-protobuf"
+
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", zlib.Z_DEFAULT_COMPRESSION))
+
+# Wire tags of the logproto.PushRequest messages used by Loki:
+#   PushRequest  { repeated StreamAdapter streams = 1; }
+#   StreamAdapter { string labels = 1; repeated EntryAdapter entries = 2; }
+#   EntryAdapter { Timestamp timestamp = 1; string line = 2;
+#                  repeated LabelPairAdapter structuredMetadata = 3; }
+#   LabelPairAdapter { string name = 1; string value = 2; }
+#   Timestamp { int64 seconds = 1; int32 nanos = 2; }
+_TAG_STREAMS = b"\x0a"
+_TAG_LABELS = b"\x0a"
+_TAG_ENTRIES = b"\x12"
+_TAG_TIMESTAMP = b"\x0a"
+_TAG_LINE = b"\x12"
+_TAG_METADATA = b"\x1a"
+_TAG_NAME = b"\x0a"
+_TAG_VALUE = b"\x12"
+_TAG_SECONDS = b"\x08"
+_TAG_NANOS = b"\x10"
+
+_SMALL_VARINTS = [bytes([value]) for value in range(0x80)]
+
+# Encoded structured metadata pairs by (name, value): values such as user
+# and tenant ids repeat from line to line
+MAX_METADATA_FIELDS = 100_000
+_metadata_fields: Dict[Tuple[str, Any], bytes] = {}
+
+
+def _varint(value: int) -> bytes:
+    if 0 <= value < 0x80:
+        return _SMALL_VARINTS[value]
+    if value < 0:  # int64 fields hold negatives in 64-bit two's complement
+        value += 1 << 64
+    out = bytearray()
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def _length_delimited(tag: bytes, data: bytes) -> bytes:
+    return tag + _varint(len(data)) + data
+
+
+def _escape_label_value(value: str) -> str:
+    return (
+        value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    )
+
+
+def format_labels(labels: Dict[str, str]) -> str:
+    """Render a label set in the Prometheus selector form Loki expects
+
+    Labels without a value are left out, as Loki drops empty labels.
+    """
+    pairs = ", ".join(
+        f'{name}="{_escape_label_value(str(value))}"'
+        for name, value in sorted(labels.items())
+        if value is not None
+    )
+    return "{" + pairs + "}"
+
+
+def _labels_field(labels: Dict[str, str]) -> bytes:
+    """The StreamAdapter labels field of a label set"""
+    selector = format_labels(labels).encode("utf-8")
+    return _length_delimited(_TAG_LABELS, selector)
+
+
+def _encode_entry(nanoseconds: str, line: str, metadata: Dict) -> bytes:
+    seconds, nanos = divmod(int(nanoseconds), 1_000_000_000)
+    timestamp = _TAG_SECONDS + _varint(seconds)
+    if nanos:
+        timestamp += _TAG_NANOS + _varint(nanos)
+    entry = _length_delimited(_TAG_TIMESTAMP, timestamp)
+    entry += _length_delimited(_TAG_LINE, line.encode("utf-8"))
+    for item in metadata.items():
+        field = _metadata_fields.get(item)
+        if field is None:
+            field = _metadata_field(*item)
+        entry += field
+    return entry
+
+
+def _metadata_field(name: str, value) -> bytes:
+    """The EntryAdapter structuredMetadata field of a name and value"""
+    pair = _length_delimited(_TAG_NAME, name.encode("utf-8"))
+    pair += _length_delimited(_TAG_VALUE, str(value).encode("utf-8"))
+    field = _length_delimited(_TAG_METADATA, pair)
+    if len(_metadata_fields) >= MAX_METADATA_FIELDS:
+        _metadata_fields.clear()
+    _metadata_fields[name, value] = field
+    return field
+
+
+def encode_json(payload: LokiPayload) -> Tuple[bytes, Dict[str, str]]:
+    """Encode the payload as a plain JSON push request"""
+    body = payload.model_dump_json().encode("utf-8")
+    return body, {"Content-Type": JSON_CONTENT_TYPE}
+
+
+class GzipJsonEncoder:
+    """Stream a JSON push request through gzip into a reusable buffer"""
+
+    def __init__(self, level: int = GZIP_LEVEL):
+        self.level = level
+        self._buffer = io.BytesIO()
+        self._dumps = json.JSONEncoder(
+            ensure_ascii=False, separators=(",", ":")
+        ).encode
+
+    def __call__(self, payload: LokiPayload) -> Tuple[bytes, Dict[str, str]]:
+        buffer = self._buffer
+        buffer.seek(0)
+        buffer.truncate()
+        # wbits=31 makes zlib emit a gzip header and trailer
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, 31)
+        dumps = self._dumps
+
+        buffer.write(compressor.compress(b'{"streams":['))
+        for index, stream in enumerate(payload.streams):
+            parts = [
+                "," if index else "",
+                '{"stream":',
+                cached_fragment(stream["stream"], "json", dumps),
+                ',"values":[',
+                ",".join(dumps(value) for value in stream["values"]),
+                "]}",
+            ]
+            buffer.write(compressor.compress("".join(parts).encode("utf-8")))
+        buffer.write(compressor.compress(b"]}"))
+        buffer.write(compressor.flush())
+
+        headers = {
+            "Content-Type": JSON_CONTENT_TYPE,
+            "Content-Encoding": "gzip",
+        }
+        return buffer.getvalue(), headers
+
+
+def encode_protobuf(payload: LokiPayload) -> Tuple[bytes, Dict[str, str]]:
+    """Encode the payload as a snappy-compressed protobuf PushRequest"""
+    if snappy is None:
+        raise RuntimeError(
+            "Protobuf pushes require python-snappy: pip install python-snappy"
+        )
+    request = bytearray()
+    for stream in payload.streams:
+        adapter = bytearray(
+            cached_fragment(stream["stream"], "protobuf", _labels_field)
+        )
+        for value in stream["values"]:
+            metadata = value[2] if len(value) > 2 else {}
+            entry = _encode_entry(value[0], value[1], metadata)
+            adapter += _length_delimited(_TAG_ENTRIES, entry)
+        request += _length_delimited(_TAG_STREAMS, bytes(adapter))
+    body = snappy.compress(bytes(request))
+    return body, {"Content-Type": PROTOBUF_CONTENT_TYPE}
+
+
+ENCODERS = {
+    "json": encode_json,
+    "gzip": GzipJsonEncoder(),
+    "protobuf": encode_protobuf,
+}
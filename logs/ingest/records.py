@@ -0,0 +1,373 @@
+"""Compact entry records, the fast path around per-line pydantic models.
+
+Parsing and uploading handle millions of lines, and building a pydantic
+model per line costs more than extracting its fields. Entries are kept as
+plain tuples and __slots__ records instead, laid out by a RecordSchema
+derived from the plugin's pydantic models: those stay the single
+definition of field names, order, defaults and types. Field types are
+checked a column of a block at a time, timestamp strings by parsing each
+distinct one, and blocks that do not pass are validated by the models
+entry by entry, so their coercions and errors still apply.
+"""
+
+import json
+import typing
+from datetime import datetime
+from functools import partial
+from itertools import islice
+from operator import itemgetter, methodcaller
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from pydantic import BaseModel
+
+from ingest.label_sets import LabelSet, LabelSetTable
+from ingest.log_io import (
+    BLOCK_SIZE,
+    _log_format,
+    _parquet_schema,
+    write_blocks,
+)
+
+try:
+    import pyarrow as pa
+except ImportError:  # pyarrow is only needed for .parquet files
+    pa = None
+
+# An entry as extracted from a header line: labels, structured metadata,
+# timestamp and content. The dicts may leave out fields with defaults.
+Record = Tuple[Dict[str, Any], Dict[str, Any], Optional[datetime], str]
+# Validated fields of a block of entries: the label values of each entry,
+# one column per structured metadata field, timestamps and contents
+Columns = Tuple[List[tuple], List[list], Sequence, Sequence]
+
+# Distinct label dicts remembered as validated, few in practice
+MAX_LABEL_SETS = 100_000
+
+_MISSING = object()  # Default of the required fields
+_STR = {str}
+_OPTIONAL_STR = {str, type(None)}
+_encode_string = json.encoder.encode_basestring_ascii
+
+
+def _fields(model) -> List[Tuple[str, Any, bool]]:
+    """(name, default, nullable) of each field of a model, in order"""
+    fields = []
+    for name, field in model.model_fields.items():
+        default = _MISSING if field.is_required() else field.default
+        fields.append((name, default, _nullable(field)))
+    return fields
+
+
+def _nullable(field) -> bool:
+    return type(None) in typing.get_args(field.annotation)
+
+
+def _json_value(value: Optional[str]) -> str:
+    return "null" if value is None else _encode_string(value)
+
+
+def _json_column(values: List[Optional[str]]) -> List[str]:
+    """Values as json.dumps encodes them"""
+    if None in values:
+        return ["null" if v is None else _encode_string(v) for v in values]
+    return list(map(_encode_string, values))
+
+
+def _json_timestamps(timestamps: Sequence[Optional[datetime]]) -> List[str]:
+    """Timestamps as json.dumps encodes their isoformat()"""
+    # Lines often share a timestamp, so each distinct one is formatted once
+    distinct = dict.fromkeys(timestamps)
+    has_none = None in distinct
+    distinct.pop(None, None)
+    formatted = dict(
+        zip(distinct, map('"{}"'.format, map(datetime.isoformat, distinct)))
+    )
+    if has_none:
+        formatted[None] = "null"
+    return list(map(formatted.__getitem__, timestamps))
+
+
+def _iso_timestamps(timestamps: Sequence) -> bool:
+    """Whether the string timestamps all parse as ISO 8601"""
+    strings = [t for t in dict.fromkeys(timestamps) if type(t) is str]
+    try:
+        list(map(datetime.fromisoformat, strings))
+    except ValueError:
+        return False
+    return True
+
+
+def _dumped(entry: BaseModel) -> Record:
+    return (
+        entry.labels.model_dump(),
+        entry.structured_metadata.model_dump(mode="json"),
+        entry.timestamp,
+        entry.content,
+    )
+
+
+class UploadRecord:
+    """A parsed entry as the uploader pushes it"""
+
+    __slots__ = ("stream", "metadata", "timestamp", "line")
+
+    def __init__(self, stream, metadata, timestamp, line):
+        # Interned labels of the entry's stream, shared with its other lines
+        self.stream: LabelSet = stream
+        # Structured metadata without the fields that are not set
+        self.metadata: Dict[str, str] = metadata
+        # ISO string or datetime as read, None if the entry has none
+        self.timestamp = timestamp
+        self.line: str = line
+
+
+class RecordSchema:
+    """Field layout and bulk type checks of a plugin's entries"""
+
+    def __init__(self, plugin):
+        self.plugin = plugin
+        self.label_fields = _fields(plugin.labels_model)
+        self.metadata_fields = _fields(plugin.metadata_model)
+        self.timestamp_nullable = _nullable(
+            plugin.entry_model.model_fields["timestamp"]
+        )
+        # Label values of each distinct label dict, checked once
+        self._label_sets: Dict[tuple, tuple] = {}
+        # Stream label sets, and the label set of each label values row
+        self.label_sets = LabelSetTable()
+        self._streams: Dict[tuple, LabelSet] = {}
+
+        # model_dump() of an entry through json.dumps, as % templates
+        def members(fields):
+            return ", ".join(f'"{name}": %s' for name, _, _ in fields)
+
+        self._labels_template = f"{{{members(self.label_fields)}}}"
+        self._json_template = (
+            '{"labels": %s, '
+            f'"structured_metadata": {{{members(self.metadata_fields)}}}, '
+            '"timestamp": %s, "content": %s}'
+        )
+
+    def _label_values(self, labels: Sequence[Dict]) -> Optional[List[tuple]]:
+        """Label values of each dict, None unless all have the field types"""
+        try:
+            keys = list(map(tuple, map(dict.items, labels)))
+            distinct = dict.fromkeys(keys)
+        except TypeError:  # Not a dict, or an unhashable value
+            return None
+        label_sets = self._label_sets
+        for key in distinct.keys() - label_sets.keys():
+            values = dict(key)
+            row = []
+            for name, default, nullable in self.label_fields:
+                value = values.get(name, default)
+                if type(value) is not str and not (
+                    value is None and nullable
+                ):
+                    return None
+                row.append(value)
+            if len(label_sets) >= MAX_LABEL_SETS:
+                label_sets.clear()
+            label_sets[key] = tuple(row)
+        return list(map(label_sets.__getitem__, keys))
+
+    @staticmethod
+    def _column(dicts: Sequence[Dict], field) -> Optional[list]:
+        """Values of a field in dicts, None unless all have its type"""
+        name, default, nullable = field
+        values = list(map(methodcaller("get", name, default), dicts))
+        if set(map(type, values)) <= (_OPTIONAL_STR if nullable else _STR):
+            return values
+        return None
+
+    def _columns(
+        self, records: Sequence[Record], timestamp_types: set
+    ) -> Optional[Columns]:
+        """Columns of the fields, None if one of them has another type"""
+        labels, metadata, timestamps, contents = zip(*records)
+        if self.timestamp_nullable:
+            timestamp_types = timestamp_types | {type(None)}
+        types = set(map(type, timestamps))
+        if not (types <= timestamp_types and set(map(type, contents)) <= _STR):
+            return None
+        # The models parse timestamp strings, whose format is checked here
+        # so that the uploader's fromisoformat() cannot fail on them later
+        if str in types and not _iso_timestamps(timestamps):
+            return None
+        label_rows = self._label_values(labels)
+        try:
+            metadata_columns = [
+                self._column(metadata, field)
+                for field in self.metadata_fields
+            ]
+        except AttributeError:  # Not a dict
+            return None
+        if label_rows is None or None in metadata_columns:
+            return None
+        return label_rows, metadata_columns, timestamps, contents
+
+    def _dumped_columns(self, records: Sequence[Record]) -> Columns:
+        """Columns of records dumped from the models"""
+        labels, metadata, timestamps, contents = zip(*records)
+        label_rows = [tuple(values.values()) for values in labels]
+        metadata_columns = [
+            list(map(itemgetter(name), metadata))
+            for name, _, _ in self.metadata_fields
+        ]
+        return label_rows, metadata_columns, timestamps, contents
+
+    def _validated(self, labels, metadata, timestamp, content) -> Record:
+        """An extracted entry validated by the models"""
+        plugin = self.plugin
+        return _dumped(
+            plugin.entry_model(
+                labels=plugin.labels_model(**labels),
+                structured_metadata=plugin.metadata_model(**metadata),
+                timestamp=timestamp,
+                content=content,
+            )
+        )
+
+    def columns(self, records: Sequence[Record]) -> Columns:
+        """Validated columns of a block of extracted entries"""
+        columns = self._columns(records, {datetime})
+        if columns is None:
+            columns = self._dumped_columns(
+                [self._validated(*record) for record in records]
+            )
+        return columns
+
+    def to_json(self, records: Sequence[Record]) -> List[str]:
+        """Each record as json.dumps would write the entry's model_dump()"""
+        label_rows, metadata_columns, timestamps, contents = self.columns(
+            records
+        )
+        labels_json = {
+            values: self._labels_template % tuple(map(_json_value, values))
+            for values in dict.fromkeys(label_rows)
+        }
+        encoded = [list(map(labels_json.__getitem__, label_rows))]
+        encoded.extend(map(_json_column, metadata_columns))
+        encoded.append(_json_timestamps(timestamps))
+        encoded.append(list(map(_encode_string, contents)))
+        return list(map(self._json_template.__mod__, zip(*encoded)))
+
+    def _stream(self, values: tuple) -> LabelSet:
+        """Label set of the stream of entries with these label values"""
+        stream = self._streams.get(values)
+        if stream is None:
+            names = [name for name, _, _ in self.label_fields]
+            labels = self.plugin.stream_labels(dict(zip(names, values)))
+            # Unset labels are left out, so every push encoding sends the
+            # same streams instead of null or "None" values
+            labels = {
+                name: value
+                for name, value in labels.items()
+                if value is not None
+            }
+            stream = self._streams[values] = self.label_sets.intern(labels)
+        return stream
+
+    def upload_records(self, entries: Sequence[Dict]) -> List[UploadRecord]:
+        """Upload records of entries read from a parsed log file"""
+        if not entries:
+            return []
+        members = itemgetter(
+            "labels", "structured_metadata", "timestamp", "content"
+        )
+        try:
+            columns = self._columns(
+                list(map(members, entries)), {str, datetime}
+            )
+        except (KeyError, TypeError):
+            columns = None
+        if columns is None:
+            columns = self._dumped_columns(
+                [
+                    _dumped(self.plugin.entry_model(**entry))
+                    for entry in entries
+                ]
+            )
+        label_rows, metadata_columns, timestamps, contents = columns
+
+        streams = {
+            values: self._stream(values)
+            for values in dict.fromkeys(label_rows)
+        }
+        streams = list(map(streams.__getitem__, label_rows))
+        names = [name for name, _, _ in self.metadata_fields]
+        rows = zip(*metadata_columns)
+        if any(None in column for column in metadata_columns):
+            metadata = [
+                {
+                    name: value
+                    for name, value in zip(names, row)
+                    if value is not None
+                }
+                for row in rows
+            ]
+        else:
+            metadata = list(map(dict, map(partial(zip, names), rows)))
+        return list(
+            map(
+                UploadRecord,
+                streams,
+                metadata,
+                timestamps,
+                map(self.plugin.line, contents),
+            )
+        )
+
+
+def encode_records(
+    filename: str, records: List[Record], schema: RecordSchema
+) -> Tuple[int, Any]:
+    """Serialize records into a block for log_io.write_blocks
+
+    Same output as log_io.encode_block on the entries' model_dump().
+    """
+    if not records:
+        return 0, None
+    log_format = _log_format(filename)
+    if log_format == "parquet":
+        table_schema = _parquet_schema(schema.plugin)
+        label_rows, metadata_columns, timestamps, contents = schema.columns(
+            records
+        )
+
+        def struct(columns, name):
+            return pa.StructArray.from_arrays(
+                [pa.array(column, pa.string()) for column in columns],
+                fields=list(table_schema.field(name).type),
+            )
+
+        table = pa.Table.from_arrays(
+            [
+                pa.array(timestamps, table_schema.field("timestamp").type),
+                struct(list(zip(*label_rows)), "labels"),
+                struct(metadata_columns, "structured_metadata"),
+                pa.array(contents, pa.string()),
+            ],
+            schema=table_schema,
+        )
+        return len(records), table
+
+    separator = ",\n" if log_format == "json" else "\n"
+    text = separator.join(schema.to_json(records))
+    if log_format == "ndjson":
+        text += "\n"
+    return len(records), text
+
+
+def write_records(
+    filename: str, records: Iterable[Record], schema: RecordSchema
+) -> int:
+    """Write records like log_io.write_logs writes entries"""
+    records = iter(records)
+    blocks = iter(
+        lambda: encode_records(
+            filename, list(islice(records, BLOCK_SIZE)), schema
+        ),
+        (0, None),
+    )
+    return write_blocks(filename, blocks, schema.plugin)
@@ -0,0 +1,111 @@
+"""Replay entries at the pace they were logged, sped up by a factor.
+
+Uploads normally push entries as fast as Loki takes them. A replay
+releases each entry once the replay clock, started at the first timestamp
+and running speed times faster than real time, reaches its timestamp, so
+that Loki sees the bursts and lulls of the original logs, e.g. ten times
+faster than they were written. This needs the entries in time order, as
+sort_logs.py writes them with SORT_BY=time.
+"""
+
+import asyncio
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence
+
+# Entries due within this many seconds are released together
+REPLAY_TICK_SECONDS = 0.01
+
+
+class Replay:
+    """Schedule entries by their timestamps, see the module doc
+
+    Entries older than the newest one released so far are out of order and
+    released at once, without moving the clock back. Gaps between
+    timestamps are cut to max_gap seconds of log time if it is set.
+    Entries are released late when the upload cannot keep up, which shows
+    as lag.
+    """
+
+    def __init__(self, speed: float, max_gap: Optional[float] = None):
+        if speed <= 0:
+            raise ValueError(f"The replay speed must be positive, not {speed}")
+        self.speed = speed
+        self.max_gap = max_gap
+        self.started: Optional[float] = None  # time.monotonic()
+        self.finished: Optional[float] = None
+        self._newest: Optional[int] = None  # Nanoseconds of the newest entry
+        self.log_seconds = 0.0  # Log time from the first entry to the newest
+        self.lines = 0
+        self.out_of_order = 0
+        self.lag = 0.0  # Seconds the last entry was released late
+        self.max_lag = 0.0
+
+    def _due(self, nanoseconds: Optional[int]) -> float:
+        """When the next entry is due, in time.monotonic() seconds"""
+        if self.started is None:
+            self.started = time.monotonic()
+        if nanoseconds is not None:
+            if self._newest is None:
+                self._newest = nanoseconds
+            elif nanoseconds > self._newest:
+                gap = (nanoseconds - self._newest) / 1e9
+                if self.max_gap is not None:
+                    gap = min(gap, self.max_gap)
+                self.log_seconds += gap
+                self._newest = nanoseconds
+            elif nanoseconds < self._newest:
+                self.out_of_order += 1
+        return self.started + self.log_seconds / self.speed
+
+    async def release(
+        self, items: Sequence[Any], timestamps: Sequence[Optional[int]]
+    ) -> AsyncIterator[List[Any]]:
+        """Yield the items in groups, each once it is due
+
+        timestamps are the nanoseconds of the items, None for an item
+        without one, which is due with the item before it.
+        """
+        group = []
+        for item, nanoseconds in zip(items, timestamps):
+            due = self._due(nanoseconds)
+            if group and due - time.monotonic() > REPLAY_TICK_SECONDS:
+                yield group
+                group = []
+            delay = due - time.monotonic()
+            if delay > REPLAY_TICK_SECONDS:
+                await asyncio.sleep(delay)
+                self.lag = 0.0
+            else:
+                self.lag = max(-delay, 0.0)
+                self.max_lag = max(self.max_lag, self.lag)
+            group.append(item)
+            self.lines += 1
+        if group:
+            yield group
+        self.finished = time.monotonic()
+
+    def summary(self) -> Dict[str, Any]:
+        """Target and achieved release rates of the entries"""
+        target_seconds = self.log_seconds / self.speed
+        elapsed = 0.0
+        if self.started is not None:
+            end = self.finished if self.finished is not None else (
+                time.monotonic()
+            )
+            elapsed = end - self.started
+
+        def rate(seconds):
+            return round(self.lines / seconds, 1) if seconds else None
+
+        return {
+            "speed": self.speed,
+            "max_gap_seconds": self.max_gap,
+            "lines": self.lines,
+            "out_of_order_lines": self.out_of_order,
+            "log_seconds": round(self.log_seconds, 3),
+            "target_seconds": round(target_seconds, 3),
+            "elapsed_seconds": round(elapsed, 3),
+            "target_lines_per_second": rate(target_seconds),
+            "released_lines_per_second": rate(elapsed),
+            "max_lag_seconds": round(self.max_lag, 3),
+        }
@@ -0,0 +1,204 @@
+"""Sort parsed log entries by stream and timestamp in bounded memory.
+
+LogHub lines are not always in time order within a stream, which Loki
+rejects or has to reorder. Entries are read in runs of at most
+SORT_MEMORY_MB, each run is sorted and spilled to a temporary file next to
+the logs, and the runs are k-way merged into the sorted file, merging at
+most SORT_MAX_FAN_IN runs at a time. The sort is stable: entries with the
+same key keep their file order.
+"""
+
+import heapq
+import json
+import os
+import tempfile
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+import numpy as np
+from dotenv import find_dotenv, load_dotenv
+
+from ingest.log_io import (
+    NDJSON_SUFFIXES,
+    READ_CHUNK_SIZE,
+    WRITE_BUFFER_SIZE,
+    encode_block,
+    iter_logs,
+    write_blocks,
+)
+
+load_dotenv(find_dotenv(usecwd=True))
+
+# Memory for the entries of a run, and runs merged at once
+SORT_MEMORY_MB = float(os.getenv("SORT_MEMORY_MB", 256))
+SORT_MAX_FAN_IN = int(os.getenv("SORT_MAX_FAN_IN", 64))
+# "stream" groups each stream's entries in time order, "time" orders all
+# entries by time, which keeps streams interleaved for parallel uploads
+SORT_BY = os.getenv("SORT_BY", "stream")
+# Python objects held per entry besides its JSON text, in bytes
+ENTRY_OVERHEAD = 300
+# Entries decoded at a time, whose timestamps are parsed together
+DECODE_CHUNK_SIZE = 4096
+
+# (stream number, nanoseconds) or (nanoseconds,) and the JSON text
+SortItem = Tuple[Tuple[int, ...], str]
+
+
+class StreamNumbers:
+    """Number streams in order of first appearance"""
+
+    def __init__(self, plugin):
+        self.plugin = plugin
+        self._by_labels: Dict[tuple, int] = {}
+        self._by_stream: Dict[tuple, int] = {}
+
+    def __call__(self, labels: Dict) -> int:
+        key = tuple(labels.items())
+        number = self._by_labels.get(key)
+        if number is None:
+            stream = tuple(sorted(self.plugin.stream_labels(labels).items()))
+            number = self._by_stream.setdefault(stream, len(self._by_stream))
+            self._by_labels[key] = number
+        return number
+
+
+def _sort_items(
+    plugin, entries: Iterator[Dict], sort_by: str
+) -> Iterator[SortItem]:
+    """Sort key and JSON text of each entry"""
+    stream_number = StreamNumbers(plugin)
+    while chunk := list(islice(entries, DECODE_CHUNK_SIZE)):
+        timestamps = np.array(
+            [entry["timestamp"] for entry in chunk], dtype="datetime64[ns]"
+        ).view("int64").tolist()
+        for entry, nanoseconds in zip(chunk, timestamps):
+            if sort_by == "time":
+                key = (nanoseconds,)
+            else:
+                key = (stream_number(entry["labels"]), nanoseconds)
+            yield key, json.dumps(entry)
+
+
+def _write_run(directory: str, items: Iterable[SortItem]) -> str:
+    """Spill sorted items to a run file, one "<key> <json>" per line"""
+    fd, path = tempfile.mkstemp(dir=directory, suffix=".run")
+    with open(fd, "w", buffering=WRITE_BUFFER_SIZE) as run:
+        for key, text in items:
+            run.write(" ".join(map(str, key)))
+            run.write(" ")
+            run.write(text)
+            run.write("\n")
+    return path
+
+
+def _read_run(path: str, key_size: int) -> Iterator[SortItem]:
+    with open(path, "r", buffering=READ_CHUNK_SIZE) as run:
+        for line in run:
+            fields = line.split(" ", key_size)
+            yield tuple(map(int, fields[:key_size])), fields[key_size][:-1]
+
+
+def _merge(paths: List[str], key_size: int) -> Iterator[SortItem]:
+    """Merge sorted runs, earlier runs first among equal keys"""
+    return heapq.merge(
+        *(_read_run(path, key_size) for path in paths),
+        key=lambda item: item[0],
+    )
+
+
+def spill_runs(
+    items: Iterator[SortItem], directory: str, memory_bytes: float
+) -> Tuple[List[str], int, int]:
+    """Sort items in runs that fit memory_bytes and spill them
+
+    Returns the run files in input order, the number of items and the
+    number of items whose key was smaller than the one before.
+    """
+    runs = []
+    run: List[SortItem] = []
+    run_bytes = 0
+    count = 0
+    out_of_order = 0
+    previous = None
+    for item in items:
+        if previous is not None and item[0] < previous:
+            out_of_order += 1
+        previous = item[0]
+        run.append(item)
+        count += 1
+        run_bytes += len(item[1]) + ENTRY_OVERHEAD
+        if run_bytes >= memory_bytes:
+            run.sort(key=lambda item: item[0])
+            runs.append(_write_run(directory, run))
+            run.clear()
+            run_bytes = 0
+    if run or not runs:
+        run.sort(key=lambda item: item[0])
+        runs.append(_write_run(directory, run))
+    return runs, count, out_of_order
+
+
+def merge_runs(
+    runs: List[str], directory: str, key_size: int, fan_in: int
+) -> Iterator[SortItem]:
+    """Merge runs down to fan_in files, then yield their merged items"""
+    fan_in = max(fan_in, 2)
+    while len(runs) > fan_in:
+        merged = []
+        for start in range(0, len(runs), fan_in):
+            group = runs[start:start + fan_in]
+            merged.append(_write_run(directory, _merge(group, key_size)))
+            for path in group:
+                os.remove(path)
+        runs = merged
+    return _merge(runs, key_size)
+
+
+def _blocks(filepath: str, items: Iterator[SortItem], plugin):
+    """write_blocks blocks of the sorted entries"""
+    ndjson = os.path.splitext(filepath)[1].lower() in NDJSON_SUFFIXES
+    while chunk := list(islice(items, DECODE_CHUNK_SIZE)):
+        if ndjson:  # The spilled JSON text is already the NDJSON line
+            yield len(chunk), "\n".join(text for _, text in chunk) + "\n"
+        else:
+            entries = [json.loads(text) for _, text in chunk]
+            yield encode_block(filepath, entries, plugin)
+
+
+def sort_logs(
+    plugin,
+    filepath: str,
+    sort_by: str = SORT_BY,
+    memory_mb: float = SORT_MEMORY_MB,
+    fan_in: int = SORT_MAX_FAN_IN,
+) -> Tuple[int, int, int]:
+    """Sort a parsed log file in place, see the module doc
+
+    Returns the number of entries, of entries that were out of order and
+    of runs spilled.
+    """
+    if sort_by not in ("stream", "time"):
+        raise ValueError(f"SORT_BY must be stream or time, not {sort_by!r}")
+    key_size = 1 if sort_by == "time" else 2
+    directory = os.path.dirname(os.path.abspath(filepath))
+    with tempfile.TemporaryDirectory(dir=directory) as run_dir:
+        items = _sort_items(plugin, iter_logs(filepath), sort_by)
+        runs, count, out_of_order = spill_runs(
+            items, run_dir, memory_mb * (1 << 20)
+        )
+        num_runs = len(runs)
+        if out_of_order:
+            merged = merge_runs(runs, run_dir, key_size, fan_in)
+            write_blocks(filepath, _blocks(filepath, merged, plugin), plugin)
+    return count, out_of_order, num_runs
+
+
+def main(plugin):
+    filepath = plugin.parsed_log_file
+    print(f"Sorting {filepath} by {SORT_BY}...")
+    count, out_of_order, num_runs = sort_logs(plugin, filepath)
+    print(f"Read {count} log entries in {num_runs} sorted runs")
+    if out_of_order:
+        print(f"Found {out_of_order} entries out of order")
+    else:
+        print("The entries were already in order, the file is unchanged")
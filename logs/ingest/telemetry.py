@@ -0,0 +1,335 @@
+"""Upload telemetry: push latencies, throughput, retries and queue depths.
+
+The metrics are served in the Prometheus text format while uploading and
+written as a JSON summary when the upload ends, to size Loki's write path
+and compare encoding and batching settings.
+"""
+
+import asyncio
+import json
+import time
+from array import array
+from bisect import bisect_left
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from aiohttp import web
+
+# Upper bounds of the push latency histogram buckets, in seconds
+LATENCY_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+)
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class Histogram:
+    """A Prometheus histogram that also keeps its observations
+
+    Pushes are counted in thousands, not millions, so the observations are
+    kept to report exact quantiles in the summary.
+    """
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # The last one is +Inf
+        self.sum = 0.0
+        self.values = array("d")
+
+    @property
+    def count(self) -> int:
+        return len(self.values)
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.values.append(value)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Nearest-rank q-quantile of the observations, None if empty"""
+        if not self.values:
+            return None
+        values = sorted(self.values)
+        return values[min(int(q * len(values)), len(values) - 1)]
+
+    def cumulative_counts(self) -> List[int]:
+        counts = []
+        total = 0
+        for count in self.counts:
+            total += count
+            counts.append(total)
+        return counts
+
+
+class Gauge:
+    """A probed value sampled periodically for its max and mean"""
+
+    def __init__(self, probe: Callable[[], float], help_text: str):
+        self.probe = probe
+        self.help_text = help_text
+        self.max = 0.0
+        self.total = 0.0
+        self.samples = 0
+
+    def sample(self) -> float:
+        value = self.probe()
+        self.max = max(self.max, value)
+        self.total += value
+        self.samples += 1
+        return value
+
+    def summary(self) -> Dict[str, float]:
+        mean = self.total / self.samples if self.samples else 0.0
+        return {"max": self.max, "mean": round(mean, 3), "last": self.probe()}
+
+
+class UploadMetrics:
+    """Counters, histogram and gauges of one upload"""
+
+    def __init__(self, settings: Optional[Dict[str, Any]] = None):
+        # Upload settings copied into the summary for comparisons
+        self.settings = settings or {}
+        self.started = time.monotonic()
+        self.started_at = datetime.now(timezone.utc)
+        self.finished: Optional[float] = None
+        self.push_latency = Histogram(LATENCY_BUCKETS)
+        self.lines = {"pushed": 0, "dropped": 0}
+        self.tenant_lines: Dict[str, Dict[str, int]] = {}  # By tenant
+        self.batches = {"pushed": 0, "dropped": 0}
+        self.line_bytes = 0  # Log line bytes of the pushed batches
+        self.sent_bytes = 0  # Request body bytes, retries included
+        self.responses: Dict[str, int] = {}  # By status, or "error"
+        self.retries = 0
+        self.encode_seconds = 0.0
+        self.rate_limit_seconds = 0.0  # Waited for the rate limits
+        # Queue depths and concurrency, by metric name
+        self.gauges: Dict[str, Gauge] = {}
+        # Summaries of other parts of the upload, by summary key
+        self.reports: Dict[str, Callable[[], Any]] = {}
+
+    def watch(self, name: str, probe: Callable[[], float], help_text: str):
+        """Sample probe() as the gauge loki_ingest_<name>"""
+        self.gauges[name] = Gauge(probe, help_text)
+
+    def report(self, name: str, probe: Callable[[], Any]):
+        """Add probe() to the summary as name"""
+        self.reports[name] = probe
+
+    def encoded(self, seconds: float):
+        self.encode_seconds += seconds
+
+    def pushed(self, num_bytes: int, latency: float, status: str):
+        """Record one push attempt and its response status"""
+        self.sent_bytes += num_bytes
+        self.push_latency.observe(latency)
+        self.responses[status] = self.responses.get(status, 0) + 1
+
+    def rate_limited(self, seconds: float):
+        self.rate_limit_seconds += seconds
+
+    def retried(self):
+        self.retries += 1
+
+    def batch_done(
+        self,
+        num_lines: int,
+        num_bytes: int,
+        accepted: bool,
+        tenant: Optional[str] = None,
+    ):
+        result = "pushed" if accepted else "dropped"
+        self.lines[result] += num_lines
+        if tenant is not None:
+            lines = self.tenant_lines.setdefault(
+                tenant, {"pushed": 0, "dropped": 0}
+            )
+            lines[result] += num_lines
+        self.batches[result] += 1
+        if accepted:
+            self.line_bytes += num_bytes
+
+    async def sample(self, interval: float):
+        """Sample the gauges every interval seconds until cancelled"""
+        while True:
+            for gauge in self.gauges.values():
+                gauge.sample()
+            await asyncio.sleep(interval)
+
+    def finish(self):
+        self.finished = time.monotonic()
+
+    def elapsed(self) -> float:
+        end = self.finished if self.finished is not None else time.monotonic()
+        return end - self.started
+
+    def render(self) -> str:
+        """The metrics in the Prometheus text exposition format"""
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP loki_ingest_{name} {help_text}")
+            lines.append(f"# TYPE loki_ingest_{name} {kind}")
+            for suffix, labels, value in samples:
+                label_text = ",".join(f'{k}="{v}"' for k, v in labels)
+                if label_text:
+                    label_text = f"{{{label_text}}}"
+                lines.append(f"loki_ingest_{name}{suffix}{label_text} {value}")
+
+        metric(
+            "lines_total",
+            "counter",
+            "Log lines pushed or dropped after failing",
+            [("", [("result", k)], v) for k, v in self.lines.items()],
+        )
+        metric(
+            "tenant_lines_total",
+            "counter",
+            "Log lines pushed or dropped by tenant",
+            [
+                ("", [("tenant", tenant), ("result", k)], v)
+                for tenant, lines in sorted(self.tenant_lines.items())
+                for k, v in lines.items()
+            ],
+        )
+        metric(
+            "batches_total",
+            "counter",
+            "Batches pushed or dropped after failing",
+            [("", [("result", k)], v) for k, v in self.batches.items()],
+        )
+        metric(
+            "line_bytes_total",
+            "counter",
+            "Log line bytes pushed",
+            [("", [], self.line_bytes)],
+        )
+        metric(
+            "sent_bytes_total",
+            "counter",
+            "Request body bytes sent, retries included",
+            [("", [], self.sent_bytes)],
+        )
+        metric(
+            "push_requests_total",
+            "counter",
+            "Push attempts by response status, error if none",
+            [
+                ("", [("status", k)], v)
+                for k, v in sorted(self.responses.items())
+            ],
+        )
+        metric(
+            "retries_total",
+            "counter",
+            "Push attempts retried after a retryable failure",
+            [("", [], self.retries)],
+        )
+        metric(
+            "encode_seconds_total",
+            "counter",
+            "Time spent encoding push request bodies",
+            [("", [], round(self.encode_seconds, 6))],
+        )
+        metric(
+            "rate_limit_wait_seconds_total",
+            "counter",
+            "Time pushes waited for the ingestion rate limits",
+            [("", [], round(self.rate_limit_seconds, 6))],
+        )
+        histogram = self.push_latency
+        bounds = [str(bound) for bound in histogram.buckets] + ["+Inf"]
+        metric(
+            "push_duration_seconds",
+            "histogram",
+            "Latency of push attempts",
+            [
+                ("_bucket", [("le", bound)], count)
+                for bound, count in zip(
+                    bounds, histogram.cumulative_counts()
+                )
+            ]
+            + [
+                ("_sum", [], round(histogram.sum, 6)),
+                ("_count", [], histogram.count),
+            ],
+        )
+        for name, gauge in self.gauges.items():
+            metric(name, "gauge", gauge.help_text, [("", [], gauge.probe())])
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> Dict[str, Any]:
+        """The totals, rates and latency quantiles of the upload"""
+        elapsed = self.elapsed()
+        histogram = self.push_latency
+
+        def rate(total):
+            return round(total / elapsed, 1) if elapsed else None
+
+        def seconds(value):
+            return None if value is None else round(value, 6)
+
+        return {
+            "started": self.started_at.isoformat(),
+            "elapsed_seconds": round(elapsed, 3),
+            "settings": self.settings,
+            "lines": self.lines,
+            "tenant_lines": self.tenant_lines,
+            "batches": self.batches,
+            "line_bytes": self.line_bytes,
+            "sent_bytes": self.sent_bytes,
+            "lines_per_second": rate(self.lines["pushed"]),
+            "line_bytes_per_second": rate(self.line_bytes),
+            "sent_bytes_per_second": rate(self.sent_bytes),
+            "responses": self.responses,
+            "retries": self.retries,
+            "encode_seconds": round(self.encode_seconds, 3),
+            "rate_limit_wait_seconds": round(self.rate_limit_seconds, 3),
+            "push_latency_seconds": {
+                "count": histogram.count,
+                "mean": seconds(
+                    histogram.sum / histogram.count
+                    if histogram.count
+                    else None
+                ),
+                "p50": seconds(histogram.quantile(0.5)),
+                "p90": seconds(histogram.quantile(0.9)),
+                "p99": seconds(histogram.quantile(0.99)),
+                "max": seconds(max(histogram.values, default=None)),
+            },
+            "gauges": {
+                name: gauge.summary() for name, gauge in self.gauges.items()
+            },
+            **{name: probe() for name, probe in self.reports.items()},
+        }
+
+    def write_summary(self, path: str):
+        with open(path, "w") as fd:
+            json.dump(self.summary(), fd, indent=2)
+            fd.write("\n")
+
+    async def serve(self, port: int, host: str = "127.0.0.1") -> web.AppRunner:
+        """Serve the metrics on http://host:port/metrics"""
+
+        async def handle(request):
+            return web.Response(
+                body=self.render().encode("utf-8"),
+                headers={"Content-Type": PROMETHEUS_CONTENT_TYPE},
+            )
+
+        app = web.Application()
+        app.router.add_get("/metrics", handle)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        return runner
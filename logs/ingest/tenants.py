@@ -0,0 +1,62 @@
+"""Route Loki streams to tenants (X-Scope-OrgID) by their labels."""
+
+from typing import Any, Dict, List, Sequence, Tuple
+
+# (label, value, tenant) of a routing rule
+TenantRule = Tuple[str, str, str]
+
+
+def parse_tenant_map(spec: str) -> List[TenantRule]:
+    """Parse comma-separated label=value:tenant rules"""
+    rules = []
+    for rule in spec.split(","):
+        if not rule.strip():
+            continue
+        selector, colon, tenant = rule.rpartition(":")
+        label, equals, value = selector.partition("=")
+        if not (colon and equals and label.strip() and tenant.strip()):
+            raise ValueError(
+                f"Invalid tenant rule {rule.strip()!r}, expected "
+                "label=value:tenant"
+            )
+        rules.append((label.strip(), value.strip(), tenant.strip()))
+    return rules
+
+
+def parse_tenant_limits(spec: str) -> Dict[str, Tuple[float, float]]:
+    """Parse comma-separated tenant=rate:burst overrides, in MiB"""
+    limits = {}
+    for override in spec.split(","):
+        if not override.strip():
+            continue
+        tenant, equals, values = override.rpartition("=")
+        rate, colon, burst = values.partition(":")
+        try:
+            if not (equals and colon and tenant.strip()):
+                raise ValueError
+            limits[tenant.strip()] = (float(rate), float(burst))
+        except ValueError:
+            raise ValueError(
+                f"Invalid tenant limits {override.strip()!r}, expected "
+                "tenant=rate_mb:burst_mb"
+            ) from None
+    return limits
+
+
+class TenantRouter:
+    """Pick the tenant of a stream from its labels
+
+    Rules are tried in order and the first one whose label has its value
+    names the tenant, e.g. application=hdfs:storage. Streams that no rule
+    matches go to the default tenant.
+    """
+
+    def __init__(self, default: str, rules: Sequence[TenantRule] = ()):
+        self.default = default
+        self.rules = list(rules)
+
+    def tenant(self, labels: Dict[str, Any]) -> str:
+        for label, value, tenant in self.rules:
+            if labels.get(label) == value:
+                return tenant
+        return self.default
@@ -0,0 +1,415 @@
+"""Rebase parsed log timestamps so that the logs end at the current time."""
+
+import os
+import shutil
+import tempfile
+from datetime import datetime, timedelta
+from itertools import islice
+from typing import Dict, Iterator, List, Optional, TextIO
+
+import numpy as np
+from dotenv import find_dotenv, load_dotenv
+
+from ingest.log_io import encode_block, iter_logs, write_blocks, write_logs
+
+load_dotenv(find_dotenv(usecwd=True))
+
+MAX_DEBUG_PRINTS = 10
+MIN_WINDOW_SIZE = 1024
+MAX_WINDOW_SIZE = 1 << 20
+
+# "memory" loads every entry, "stream" rebases files larger than RAM in
+# two passes of REBASE_CHUNK_SIZE entries at a time
+REBASE_MODE = os.getenv("REBASE_MODE", "memory")
+REBASE_CHUNK_SIZE = int(os.getenv("REBASE_CHUNK_SIZE", 1_000_000))
+VALIDATION_ERRORS_FILE = "validation_errors.txt"
+
+
+def load_logs(filepath: str) -> List[Dict]:
+    """Load every entry, sharing one labels dict between equal labels"""
+    # Entries have few distinct label sets, and a dict per entry took a
+    # third of the memory
+    label_sets: Dict[tuple, Dict] = {}
+    logs = []
+    for log in iter_logs(filepath):
+        labels = log["labels"]
+        log["labels"] = label_sets.setdefault(tuple(labels.items()), labels)
+        logs.append(log)
+    return logs
+
+
+def parse_timestamps(logs: List[Dict]) -> np.ndarray:
+    """Parse the ISO timestamps of all entries once into datetime64[ns]"""
+    return np.array([log["timestamp"] for log in logs], dtype="datetime64[ns]")
+
+
+def _to_datetime(timestamp: np.datetime64) -> datetime:
+    return timestamp.astype("datetime64[us]").item()
+
+
+def _to_timedelta(difference: np.timedelta64) -> timedelta:
+    return difference.astype("timedelta64[us]").item()
+
+
+def validate_timestamps(
+    logs: List[Dict], timestamps: np.ndarray
+) -> List[dict]:
+    """Verify timestamps are non-decreasing and return list of errors"""
+    errors = []
+    for i in np.flatnonzero(timestamps[1:] < timestamps[:-1]).tolist():
+        error = {
+            'index': i,
+            'current_time': _to_datetime(timestamps[i]),
+            'next_time': _to_datetime(timestamps[i + 1]),
+            'current_log': logs[i],
+            'next_log': logs[i + 1]
+        }
+        errors.append(error)
+    return errors
+
+
+def write_validation_errors(errors: List[dict]):
+    """Write validation errors to a file"""
+    with open(VALIDATION_ERRORS_FILE, "w") as f:
+        f.write(f"Found {len(errors)} timestamp validation errors:\n\n")
+        for error in errors:
+            _write_validation_error(f, error)
+
+
+def _write_validation_error(f: TextIO, error: dict):
+    f.write(f"Error at index: {error['index']}\n")
+    f.write(f"Current time: {error['current_time']}\n")
+    f.write(f"Next time: {error['next_time']}\n")
+    f.write(f"Current log entry: {error['current_log']}\n")
+    f.write(f"Next log entry: {error['next_log']}\n")
+    f.write("-" * 80 + "\n\n")
+
+
+def _print_indices(message: str, indices: np.ndarray, current, next_time):
+    """Print the first few flagged differences and a count of the rest"""
+    for i in indices[:MAX_DEBUG_PRINTS].tolist():
+        print(f"\n{message} at index {i}")
+        print(f"Current: {_to_datetime(current[i])}")
+        print(f"Next: {_to_datetime(next_time[i])}")
+        print(f"Difference: {_to_timedelta(next_time[i] - current[i])}")
+    if len(indices) > MAX_DEBUG_PRINTS:
+        print(f"\n... and {len(indices) - MAX_DEBUG_PRINTS} more")
+
+
+def _adjusted_next_times(timestamps: np.ndarray):
+    """Return the successor of each timestamp and the Dec→Jan indices
+
+    If going from December to January, the successor is kept in the year
+    of the entry before it.
+    """
+    next_time = timestamps[1:]
+    years = timestamps.astype("datetime64[Y]")
+    months = (timestamps.astype("datetime64[M]") - years).astype(int)
+    new_year = np.flatnonzero((months[:-1] == 11) & (months[1:] == 0))
+    if len(new_year):
+        next_time = next_time.copy()
+        next_time[new_year] = years[new_year] + (
+            next_time[new_year] - years[new_year + 1]
+        )
+    return next_time, new_year
+
+
+def calculate_time_differences(timestamps: np.ndarray) -> np.ndarray:
+    """Calculate time differences between consecutive log entries"""
+    print("\nDebug: Checking time differences...")
+    current = timestamps[:-1]
+    next_time, new_year = _adjusted_next_times(timestamps)
+    if len(new_year):
+        for i in new_year[:MAX_DEBUG_PRINTS].tolist():
+            print(f"\nDebug: Dec→Jan transition at index {i}")
+            print(f"Debug: Current time: {_to_datetime(current[i])}")
+            print(f"Debug: Next time after adjustment: "
+                  f"{_to_datetime(next_time[i])}")
+
+    differences = next_time - current
+
+    # If we get a negative difference, something's wrong
+    negative = np.flatnonzero(differences < np.timedelta64(0))
+    _print_indices(
+        "Warning: Negative time difference", negative, current, next_time
+    )
+
+    # Print significant time differences (more than 1 day)
+    large = np.flatnonzero(differences > np.timedelta64(1, "D"))
+    _print_indices("Debug: Large time gap", large, current, next_time)
+
+    total_span = _to_timedelta(differences.sum())
+    print(f"\nTotal time span: {total_span}")
+    print(f"In days and hours: {total_span.days} days, {total_span.seconds//3600} hours")
+
+    return differences
+
+
+def _replace_year(timestamp: np.datetime64, year: int) -> np.datetime64:
+    """Vector form of datetime.replace(year=year)"""
+    months = timestamp.astype("datetime64[M]")
+    month_of_year = months - months.astype("datetime64[Y]")
+    return (np.datetime64(f"{year}-01", "M") + month_of_year) + (
+        timestamp - months
+    )
+
+
+def _keep_in_year(
+    timestamps: np.ndarray, year: int, in_place: bool = False
+) -> np.ndarray:
+    """Move timestamps outside year into it, walking back from the end
+
+    Each timestamp moved into the year shifts all earlier ones by the same
+    amount, as replacing the year of each entry in turn would. Windows
+    without a crossing are shifted as a whole, so the cost is linear in
+    the number of timestamps plus the number of year crossings. Windows
+    are capped at MAX_WINDOW_SIZE, so a memory-mapped array can be
+    updated in place without being loaded.
+    """
+    year_start = np.datetime64(f"{year}-01-01", "ns")
+    year_end = np.datetime64(f"{year + 1}-01-01", "ns")
+    result = timestamps if in_place else timestamps.copy()
+    shift = np.timedelta64(0, "ns")
+    end = len(result)
+    window_size = MIN_WINDOW_SIZE
+    while end > 0:
+        start = max(end - window_size, 0)
+        window = result[start:end] + shift
+        outside = np.flatnonzero((window < year_start) | (window >= year_end))
+        if len(outside) == 0:
+            result[start:end] = window
+            end = start
+            window_size = min(window_size * 2, MAX_WINDOW_SIZE)
+            continue
+
+        last = outside[-1]
+        result[start + last + 1 : end] = window[last + 1 :]
+        moved = _replace_year(window[last], year)
+        shift += moved - window[last]
+        result[start + last] = moved
+        end = start + last
+        window_size = MIN_WINDOW_SIZE
+    return result
+
+
+def _anchor_time() -> np.datetime64:
+    """The time the rebased logs end at"""
+    current_time = datetime.now()
+    # Ensure we're in 2024
+    return np.datetime64(current_time.replace(year=2024), "ns")
+
+
+def generate_new_timestamps(differences: np.ndarray) -> np.ndarray:
+    """Generate new timestamps working backwards from current time"""
+    current_time = _anchor_time()
+
+    # Each entry sits the sum of all following differences before now
+    offsets = np.zeros(len(differences) + 1, dtype="timedelta64[ns]")
+    offsets[:-1] = np.cumsum(differences[::-1])[::-1]
+
+    # Ensure all timestamps stay in 2024
+    return _keep_in_year(current_time - offsets, 2024)
+
+
+def update_log_timestamps(
+    logs: List[Dict], new_timestamps: np.ndarray
+) -> List[Dict]:
+    """Update logs with new timestamps while preserving format"""
+    updated_logs = logs.copy()
+    formatted = np.datetime_as_string(new_timestamps, unit="s").tolist()
+    for log, new_time in zip(updated_logs, formatted):
+        log["timestamp"] = new_time
+    return updated_logs
+
+def iter_chunks(
+    filepath: str, chunk_size: int, max_lines: Optional[int] = None
+) -> Iterator[List[Dict]]:
+    """Yield the entries of a parsed log file in lists of chunk_size"""
+    entries = islice(iter_logs(filepath), max_lines)
+    while chunk := list(islice(entries, chunk_size)):
+        yield chunk
+
+
+def spool_timestamps(
+    filepath: str,
+    spool_path: str,
+    chunk_size: int,
+    max_lines: Optional[int] = None,
+) -> int:
+    """First pass: write all timestamps as int64 nanoseconds to spool_path
+
+    Validation errors are written as they are found. Returns the number
+    of timestamps spooled.
+    """
+    count = 0
+    num_errors = 0
+    previous_log = previous_time = None
+    body_path = f"{spool_path}.errors"
+    with open(spool_path, "wb") as spool, open(body_path, "w") as body:
+        for chunk in iter_chunks(filepath, chunk_size, max_lines):
+            timestamps = parse_timestamps(chunk)
+            timestamps.view("int64").tofile(spool)
+
+            # Validate across the chunk boundary too
+            logs, checked, first_index = chunk, timestamps, count
+            if previous_log is not None:
+                logs = [previous_log] + chunk
+                checked = np.concatenate([previous_time, timestamps])
+                first_index -= 1
+            for error in validate_timestamps(logs, checked):
+                error["index"] += first_index
+                _write_validation_error(body, error)
+                num_errors += 1
+
+            previous_log, previous_time = chunk[-1], timestamps[-1:]
+            count += len(chunk)
+
+    if num_errors:
+        print(f"Found {num_errors} timestamp validation errors")
+        print(f"Writing errors to {VALIDATION_ERRORS_FILE}")
+        with open(VALIDATION_ERRORS_FILE, "w") as f, open(body_path) as body:
+            f.write(f"Found {num_errors} timestamp validation errors:\n\n")
+            shutil.copyfileobj(body, f)
+        print("Continuing with processing...")
+    os.remove(body_path)
+    return count
+
+
+def _chunk_differences(timestamps: np.ndarray, start: int, end: int):
+    """Differences from each entry in [start, end) to the one after it"""
+    window = np.array(timestamps[start : end + 1])
+    next_time, _ = _adjusted_next_times(window)
+    return next_time - window[:-1]
+
+
+def rebase_spooled_timestamps(timestamps: np.ndarray, chunk_size: int):
+    """Replace memory-mapped timestamps by rebased ones, chunk by chunk
+
+    The same differences, anchor and year wrap as generate_new_timestamps
+    are used, so both modes produce the same timestamps.
+    """
+    total = len(timestamps)
+    total_span = np.timedelta64(0, "ns")
+    negative = large = 0
+    for start in range(0, total, chunk_size):
+        differences = _chunk_differences(timestamps, start, start + chunk_size)
+        total_span += differences.sum()
+        negative += np.count_nonzero(differences < np.timedelta64(0))
+        large += np.count_nonzero(differences > np.timedelta64(1, "D"))
+    if negative:
+        print(f"\nWarning: {negative} negative time differences")
+    print(f"Debug: {large} time gaps of more than a day")
+    span = _to_timedelta(total_span)
+    print(f"\nTotal time span: {span}")
+    print(f"In days and hours: {span.days} days, {span.seconds//3600} hours")
+
+    # Each entry sits the sum of all following differences before now, so
+    # walking forward it is the anchor minus the span still ahead of it.
+    # A chunk is overwritten only after its differences are taken, which
+    # read the first original timestamp of the next chunk.
+    position = _anchor_time() - total_span
+    for start in range(0, total, chunk_size):
+        end = min(start + chunk_size, total)
+        differences = _chunk_differences(timestamps, start, end)
+        offsets = np.zeros(end - start, dtype="timedelta64[ns]")
+        offsets[1:] = np.cumsum(differences[: end - start - 1])
+        timestamps[start:end] = position + offsets
+        position += differences.sum()
+    _keep_in_year(timestamps, 2024, in_place=True)
+
+
+def rebase_streaming(
+    plugin,
+    filepath: str,
+    chunk_size: int,
+    max_lines: Optional[int] = None,
+):
+    """Rebase a parsed log file without loading it, see REBASE_MODE
+
+    Pass one spools the timestamps to a memory-mapped int64 file next to
+    the logs, which is rebased in place. Pass two rewrites the entries
+    chunk by chunk into a new file that replaces filepath.
+    """
+    directory = os.path.dirname(os.path.abspath(filepath))
+    with tempfile.TemporaryDirectory(dir=directory) as spool_dir:
+        spool_path = os.path.join(spool_dir, "timestamps.bin")
+
+        print("Pass 1: reading timestamps...")
+        count = spool_timestamps(filepath, spool_path, chunk_size, max_lines)
+        print(f"Read {count} log entries")
+        if count == 0:
+            return
+
+        print("\nGenerating new timestamps...")
+        timestamps = np.memmap(
+            spool_path, dtype="datetime64[ns]", mode="r+", shape=(count,)
+        )
+        rebase_spooled_timestamps(timestamps, chunk_size)
+
+        print("\nPass 2: writing updated logs...")
+
+        def blocks():
+            position = 0
+            for chunk in iter_chunks(filepath, chunk_size, max_lines):
+                originals = [log["timestamp"] for log in chunk[:3]]
+                new_timestamps = timestamps[position : position + len(chunk)]
+                updated_logs = update_log_timestamps(chunk, new_timestamps)
+                if position == 0:
+                    print("\nSample of updates:")
+                    for original, log in zip(originals, updated_logs):
+                        print(f"Original: {original}")
+                        print(f"New:      {log['timestamp']}")
+                        print("-" * 50)
+                yield encode_block(filepath, updated_logs, plugin)
+                position += len(chunk)
+
+        write_blocks(filepath, blocks(), plugin)
+        del timestamps
+
+
+def main(plugin):
+    filepath = plugin.parsed_log_file
+
+    if REBASE_MODE == "stream":
+        # Nothing is held in memory, so there is no need to cap the lines
+        rebase_streaming(plugin, filepath, REBASE_CHUNK_SIZE)
+        print("Done!")
+        return
+
+    print("Loading logs...")
+    logs = load_logs(filepath)
+    if plugin.max_rebase_lines is not None:
+        logs = logs[: plugin.max_rebase_lines]
+        print(f"Processing first {plugin.max_rebase_lines} log entries")
+    else:
+        print(f"Loaded {len(logs)} log entries")
+
+    timestamps = parse_timestamps(logs)
+
+    print("\nChecking for timestamp validation errors...")
+    validation_errors = validate_timestamps(logs, timestamps)
+    if validation_errors:
+        print(f"Found {len(validation_errors)} timestamp validation errors")
+        print("Writing errors to validation_errors.txt")
+        write_validation_errors(validation_errors)
+        print("Continuing with processing...")
+
+    print("\nCalculating time differences...")
+    differences = calculate_time_differences(timestamps)
+    print(f"Found {len(differences)} time differences")
+
+    print("\nGenerating new timestamps...")
+    new_timestamps = generate_new_timestamps(differences)
+
+    print("\nUpdating logs with new timestamps...")
+    updated_logs = update_log_timestamps(logs, new_timestamps)
+
+    print("\nSample of updates:")
+    for i in range(min(3, len(logs))):
+        print(f"Original: {_to_datetime(timestamps[i]).isoformat()}")
+        print(f"New:      {updated_logs[i]['timestamp']}")
+        print("-" * 50)
+
+    print("\nSaving updated logs...")
+    write_logs(filepath, updated_logs, plugin)
+    print("Done!")
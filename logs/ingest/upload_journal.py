@@ -0,0 +1,141 @@
+"""Checkpoint journal of the log entries Loki has acknowledged.
+
+The journal is a text file next to the parsed logs. Its first line
+identifies the parsed log file, every following line is the
+"<start> <end>" range of entry positions of one acknowledged batch.
+Lines are appended and flushed as batches are acknowledged, and synced to
+disk every JOURNAL_SYNC_SECONDS. After a crash of the uploader only the
+batches in flight are pushed again, after a crash of the machine at most
+the last JOURNAL_SYNC_SECONDS of checkpoints.
+"""
+
+import json
+import os
+import time
+from typing import IO, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+JOURNAL_SYNC_SECONDS = float(os.getenv("JOURNAL_SYNC_SECONDS", 1.0))
+
+
+def _file_identity(log_file: str) -> dict:
+    stat = os.stat(log_file)
+    return {
+        "log_file": os.path.abspath(log_file),
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+    }
+
+
+def merge_ranges(ranges: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """Merge overlapping and adjacent [start, end) ranges"""
+    merged: List[Tuple[int, int]] = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def within_ranges(
+    entries: Iterator, ranges: List[Tuple[int, int]], first_index: int = 0
+) -> Iterator[Tuple[int, object]]:
+    """Yield (position, entry) for the entries in sorted, merged ranges
+
+    entries must start at position first_index.
+    """
+    ranges = iter(ranges)
+    current = next(ranges, None)
+    for index, entry in enumerate(entries, first_index):
+        while current is not None and index >= current[1]:
+            current = next(ranges, None)
+        if current is None:
+            break
+        if index >= current[0]:
+            yield index, entry
+
+
+class UploadJournal:
+    """Append-only record of acknowledged entry ranges of one log file"""
+
+    def __init__(self, path: str, log_file: str, resume: bool = False):
+        self.path = path
+        self.acknowledged: List[Tuple[int, int]] = []
+        identity = _file_identity(log_file)
+        if resume and os.path.exists(path):
+            self.acknowledged = self._load(identity)
+        # Rewrite the journal compacted, then append to it
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as fd:
+            fd.write(json.dumps(identity) + "\n")
+            for start, end in self.acknowledged:
+                fd.write(f"{start} {end}\n")
+            fd.flush()
+            os.fsync(fd.fileno())
+        os.replace(tmp_path, path)
+        self._fd: Optional[IO[str]] = open(path, "a")
+        self._synced = time.monotonic()
+
+    def _load(self, identity: dict) -> List[Tuple[int, int]]:
+        with open(self.path) as fd:
+            header = json.loads(fd.readline())
+            if header != identity:
+                raise ValueError(
+                    f"{self.path} was written for {header['log_file']} as "
+                    "it was then, remove it to upload from the start"
+                )
+            ranges = []
+            for line in fd:
+                parts = line.split()
+                # The last line may be torn by a crash
+                if len(parts) == 2 and line.endswith("\n"):
+                    ranges.append((int(parts[0]), int(parts[1])))
+        return merge_ranges(ranges)
+
+    @property
+    def num_acknowledged(self) -> int:
+        return sum(end - start for start, end in self.acknowledged)
+
+    @property
+    def acknowledged_prefix(self) -> int:
+        """Number of leading entries that are all acknowledged"""
+        if self.acknowledged and self.acknowledged[0][0] == 0:
+            return self.acknowledged[0][1]
+        return 0
+
+    def pending(
+        self, entries: Iterator, first_index: int = 0
+    ) -> Iterator[Tuple[int, object]]:
+        """Yield (position, entry) for entries not acknowledged yet
+
+        entries must start at position first_index.
+        """
+        ranges = iter(self.acknowledged)
+        skip = next(ranges, None)
+        for index, entry in enumerate(entries, first_index):
+            while skip is not None and index >= skip[1]:
+                skip = next(ranges, None)
+            if skip is not None and index >= skip[0]:
+                continue
+            yield index, entry
+
+    def record(self, start: int, end: int):
+        """Checkpoint the acknowledged entries [start, end)"""
+        self.record_ranges([(start, end)])
+
+    def record_ranges(self, ranges: Iterable[Sequence[int]]):
+        """Checkpoint the acknowledged [start, end) ranges of a batch"""
+        self._fd.write("".join(f"{start} {end}\n" for start, end in ranges))
+        self._fd.flush()
+        now = time.monotonic()
+        if now - self._synced >= JOURNAL_SYNC_SECONDS:
+            os.fsync(self._fd.fileno())
+            self._synced = now
+
+    def close(self):
+        if self._fd is not None:
+            self._fd.flush()
+            os.fsync(self._fd.fileno())
+            self._fd.close()
+            self._fd = None
@@ -0,0 +1,906 @@
+"""Push parsed log entries to Grafana Loki."""
+
+import argparse
+import asyncio
+import heapq
+import os
+import time
+from datetime import datetime
+from itertools import islice
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import aiohttp
+from dotenv import find_dotenv, load_dotenv
+from tqdm import tqdm
+
+from ingest.flow_control import (
+    RETRYABLE_STATUSES,
+    AimdLimiter,
+    TokenBucket,
+    backoff_delay,
+    parse_retry_after,
+)
+from ingest.label_sets import LabelSet
+from ingest.log_io import JSON_SUFFIXES, count_logs, iter_logs
+from ingest.models import LokiPayload
+from ingest.push_encoding import ENCODERS
+from ingest.records import UploadRecord
+from ingest.replay import Replay
+from ingest.telemetry import UploadMetrics
+from ingest.tenants import (
+    TenantRouter,
+    parse_tenant_limits,
+    parse_tenant_map,
+)
+from ingest.upload_journal import UploadJournal, merge_ranges, within_ranges
+
+load_dotenv(find_dotenv(usecwd=True))
+
+LOKI_URL = os.getenv("LOKI_URL")
+# Streams are pushed to the Loki tenant (X-Scope-OrgID) LOKI_TENANT unless
+# a TENANT_MAP rule routes them to another one. TENANT_MAP is a
+# comma-separated list of label=value:tenant rules, the first rule that
+# matches a stream's labels wins, e.g. "log_level=ERROR:alerts".
+LOKI_TENANT = os.getenv("LOKI_TENANT", "tenant1")
+TENANT_MAP = os.getenv("TENANT_MAP", "")
+# Acknowledged batches are checkpointed in UPLOAD_JOURNAL for --resume,
+# by default <PARSED_LOG_FILE>.journal
+UPLOAD_JOURNAL = os.getenv("UPLOAD_JOURNAL")
+USER_ID = os.getenv("USER_ID", "")
+API_KEY = os.getenv("API_KEY", "")
+
+# Pushes in flight adapt between MIN_CONCURRENCY and MAX_CONCURRENCY: the
+# limit grows while pushes finish within TARGET_LATENCY_SECONDS and halves
+# on 429/5xx responses, connection errors and slower pushes
+MAX_CONCURRENCY = int(os.getenv("MAX_CONCURRENCY", 100))
+MIN_CONCURRENCY = int(os.getenv("MIN_CONCURRENCY", 1))
+INITIAL_CONCURRENCY = int(os.getenv("INITIAL_CONCURRENCY", 10))
+TARGET_LATENCY_SECONDS = float(os.getenv("TARGET_LATENCY_SECONDS", 2.0))
+NUM_WORKERS = MAX_CONCURRENCY  # Number of worker tasks
+
+# Pushes are paced to Loki's rate limits, in MiB/s of log line and
+# structured metadata bytes, so that sustained uploads do not run into
+# 429s. The defaults are Loki's, as set in run_loki/loki-config.yaml; 0
+# turns a limit off. TENANT_LIMITS overrides the tenant limits as
+# comma-separated tenant=rate_mb:burst_mb values, e.g. "alerts=1:2".
+INGESTION_RATE_MB = float(os.getenv("INGESTION_RATE_MB", 4))
+INGESTION_BURST_SIZE_MB = float(os.getenv("INGESTION_BURST_SIZE_MB", 6))
+PER_STREAM_RATE_LIMIT_MB = float(os.getenv("PER_STREAM_RATE_LIMIT_MB", 3))
+PER_STREAM_RATE_LIMIT_BURST_MB = float(
+    os.getenv("PER_STREAM_RATE_LIMIT_BURST_MB", 15)
+)
+TENANT_LIMITS = os.getenv("TENANT_LIMITS", "")
+MIB = 1 << 20
+
+# Retryable failures are retried with full-jitter exponential backoff
+MAX_RETRIES = int(os.getenv("MAX_RETRIES", 10))
+RETRY_BASE_SECONDS = float(os.getenv("RETRY_BASE_SECONDS", 0.5))
+RETRY_MAX_SECONDS = float(os.getenv("RETRY_MAX_SECONDS", 30.0))
+
+# A batch is flushed as soon as any of these limits is reached
+BATCH_MAX_LINES = int(os.getenv("BATCH_MAX_LINES", 1000))
+BATCH_MAX_BYTES = int(os.getenv("BATCH_MAX_BYTES", 1024 * 1024))
+BATCH_LINGER_SECONDS = float(os.getenv("BATCH_LINGER_SECONDS", 1.0))
+
+# Request body encoding, one of push_encoding.ENCODERS:
+# "json", "gzip" (gzip-compressed JSON) or "protobuf"
+PUSH_ENCODING = os.getenv("PUSH_ENCODING", "json")
+
+# "now" stamps lines with the time they are sent and pushes batches in any
+# order. "ordered" sends the timestamp of each entry, as rebased by
+# update_timestamps.py, and pushes each stream in order from its own lane,
+# with different streams pushed in parallel.
+UPLOAD_MODE = os.getenv("UPLOAD_MODE", "now")
+LANE_QUEUE_SIZE = int(os.getenv("LANE_QUEUE_SIZE", 2))  # Batches per lane
+# update_timestamps.py writes whole-second timestamps, so offsets below
+# this many nanoseconds never reorder entries with different timestamps
+TIMESTAMP_NUDGE = 1_000_000_000
+
+# With REPLAY_SPEED set, entries are released at the pace they were logged,
+# REPLAY_SPEED times faster, instead of as fast as Loki takes them. Gaps
+# between entries are cut to REPLAY_MAX_GAP_SECONDS of log time if set.
+REPLAY_SPEED = float(os.getenv("REPLAY_SPEED") or 0)
+REPLAY_MAX_GAP_SECONDS = os.getenv("REPLAY_MAX_GAP_SECONDS")
+
+# The producer validates and queues entries in chunks, as a queue round
+# trip per line costs more CPU than the rest of its handling
+ENTRY_CHUNK_SIZE = 1000
+ENTRY_QUEUE_SIZE = 2  # Chunks queued ahead of the batcher
+
+# Prometheus metrics are served on http://127.0.0.1:METRICS_PORT/metrics
+# while uploading if it is set. A JSON summary is written to
+# METRICS_SUMMARY, by default <PARSED_LOG_FILE>.metrics.json.
+METRICS_PORT = os.getenv("METRICS_PORT")
+METRICS_SUMMARY = os.getenv("METRICS_SUMMARY")
+# Queue depths and concurrency are sampled for the summary this often
+METRICS_SAMPLE_SECONDS = float(os.getenv("METRICS_SAMPLE_SECONDS", 1.0))
+
+
+def entry_nanoseconds(record: UploadRecord) -> int:
+    """The timestamp of an entry as nanoseconds since the epoch"""
+    timestamp = record.timestamp
+    if isinstance(timestamp, str):
+        timestamp = datetime.fromisoformat(timestamp)
+    seconds = int(timestamp.replace(microsecond=0).timestamp())
+    return seconds * 1_000_000_000 + timestamp.microsecond * 1000
+
+
+class Batch:
+    """Log entries grouped by label set into multi-value Loki streams"""
+
+    def __init__(self, plugin):
+        self.plugin = plugin
+        # Streams by label set id
+        self.streams: Dict[int, Dict[str, Any]] = {}
+        self.num_lines = 0
+        self.num_bytes = 0
+        # Line and structured metadata bytes, as Loki's rate limits count
+        self.rate_bytes = 0
+        self.created = None
+        # Position of the first entry in the parsed log file, and the
+        # [start, end) ranges of positions of all entries
+        self.start: Optional[int] = None
+        self.ranges: List[List[int]] = []
+
+    def add(
+        self,
+        record: UploadRecord,
+        index: Optional[int] = None,
+        nanoseconds: Optional[int] = None,
+    ):
+        if self.created is None:
+            self.created = time.monotonic()
+        if index is not None:
+            if self.start is None:
+                self.start = index
+            if self.ranges and self.ranges[-1][1] == index:
+                self.ranges[-1][1] = index + 1
+            else:
+                self.ranges.append([index, index + 1])
+        stream = self.streams.get(record.stream.id)
+        if stream is None:
+            stream = self.streams[record.stream.id] = {
+                "stream": record.stream,
+                "entries": [],
+                "rate_bytes": 0,
+            }
+        stream["entries"].append((record, nanoseconds))
+        num_bytes = len(record.line)
+        rate_bytes = num_bytes
+        for name, value in record.metadata.items():
+            rate_bytes += len(name) + len(value)
+        stream["rate_bytes"] += rate_bytes
+        self.num_lines += 1
+        self.num_bytes += num_bytes
+        self.rate_bytes += rate_bytes
+
+    def is_full(self) -> bool:
+        return (
+            self.num_lines >= BATCH_MAX_LINES
+            or self.num_bytes >= BATCH_MAX_BYTES
+        )
+
+    def linger_remaining(self) -> Optional[float]:
+        """Seconds left before the batch must be flushed, None if empty"""
+        if self.created is None:
+            return None
+        elapsed = time.monotonic() - self.created
+        return max(BATCH_LINGER_SECONDS - elapsed, 0)
+
+    def to_payload(self) -> LokiPayload:
+        # Lines added without a timestamp are offset by their position in the
+        # batch so lines sent in the same request keep their order and are
+        # not deduplicated by Loki
+        nanoseconds = int(datetime.now().timestamp() * 1e9)
+        streams = []
+        offset = 0
+        for stream in self.streams.values():
+            values = []
+            for record, line_nanoseconds in stream["entries"]:
+                if line_nanoseconds is None:
+                    line_nanoseconds = nanoseconds + offset
+                values.append(
+                    [str(line_nanoseconds), record.line, record.metadata]
+                )
+                offset += 1
+            streams.append({"stream": stream["stream"], "values": values})
+        # The streams are built from validated records
+        return LokiPayload.model_construct(streams=streams)
+
+
+class Tenant:
+    """A Loki tenant's connection pool, limits and batch queue
+
+    Tenants push independently of each other: a tenant that Loki
+    throttles backs off and shrinks its own concurrency, and the batches
+    it has no room for are deferred instead of holding up the batcher and
+    the other tenants, see batcher().
+    """
+
+    def __init__(
+        self,
+        name: str,
+        queue: asyncio.Queue,
+        room: Optional[asyncio.Event] = None,
+    ):
+        self.name = name
+        self.queue = queue  # Batches for the tenant's workers
+        # Set when a worker takes a batch, shared by the tenants
+        self.room = room or asyncio.Event()
+        # Pushes waiting for the rate limits or backing off after failures
+        self.throttled = 0
+        # [start, end) positions of the entries of deferred batches
+        self.deferred: List[List[int]] = []
+        self.session: Optional[aiohttp.ClientSession] = None
+        self.limiter: Optional[AimdLimiter] = None
+        self.workers: List[asyncio.Task] = []
+        # Rate limits of the tenant and of each of its streams, by label
+        # set id, None when turned off
+        rate, burst = parse_tenant_limits(TENANT_LIMITS).get(
+            name, (INGESTION_RATE_MB, INGESTION_BURST_SIZE_MB)
+        )
+        self.rate_limit: Optional[TokenBucket] = None
+        if rate > 0:
+            self.rate_limit = TokenBucket(rate * MIB, burst * MIB)
+        self.stream_limits: Dict[int, TokenBucket] = {}
+
+    async def pace(self, batch: Batch) -> float:
+        """Wait until the rate limits allow a push of the batch
+
+        Returns the seconds waited.
+        """
+        waited = 0.0
+        if PER_STREAM_RATE_LIMIT_MB > 0:
+            for stream_id, stream in batch.streams.items():
+                bucket = self.stream_limits.get(stream_id)
+                if bucket is None:
+                    bucket = self.stream_limits[stream_id] = TokenBucket(
+                        PER_STREAM_RATE_LIMIT_MB * MIB,
+                        PER_STREAM_RATE_LIMIT_BURST_MB * MIB,
+                    )
+                waited += await bucket.take(stream["rate_bytes"])
+        if self.rate_limit is not None:
+            waited += await self.rate_limit.take(batch.rate_bytes)
+        return waited
+
+    def connect(self, auth: aiohttp.BasicAuth):
+        """Open the tenant's own connection pool"""
+        self.session = aiohttp.ClientSession(
+            auth=auth,
+            connector=aiohttp.TCPConnector(limit=MAX_CONCURRENCY),
+        )
+        self.limiter = AimdLimiter(
+            INITIAL_CONCURRENCY,
+            MIN_CONCURRENCY,
+            MAX_CONCURRENCY,
+            TARGET_LATENCY_SECONDS,
+        )
+
+
+class Tenants:
+    """The tenants of an upload, created when a stream is first routed"""
+
+    def __init__(self, router: TenantRouter, create: Callable[[str], Tenant]):
+        self.router = router
+        self._create = create
+        self.by_name: Dict[str, Tenant] = {}
+        self._by_stream: Dict[int, Tenant] = {}  # By label set id
+
+    def __iter__(self):
+        return iter(list(self.by_name.values()))
+
+    def of(self, stream: LabelSet) -> Tenant:
+        tenant = self._by_stream.get(stream.id)
+        if tenant is None:
+            name = self.router.tenant(stream)
+            tenant = self.by_name.get(name)
+            if tenant is None:
+                tenant = self.by_name[name] = self._create(name)
+            self._by_stream[stream.id] = tenant
+        return tenant
+
+
+async def upload_to_loki(
+    tenant: Tenant, batch: Batch, metrics: UploadMetrics
+) -> bool:
+    """Push a batch, retrying retryable failures, True once accepted
+
+    Unexpected errors drop the batch, so that the workers keep draining
+    their queues and the upload ends.
+    """
+    try:
+        accepted = await _push(tenant, batch, metrics)
+    except Exception as e:
+        print(f"Error during upload to Loki: {e!r}")
+        print(f"Problematic batch: {batch.num_lines} lines")
+        accepted = False
+    metrics.batch_done(
+        batch.num_lines, batch.num_bytes, accepted, tenant.name
+    )
+    return accepted
+
+
+async def _push(tenant, batch, metrics) -> bool:
+    session = tenant.session
+    limiter = tenant.limiter
+    headers = {"X-Scope-OrgID": tenant.name}
+    start = time.perf_counter()
+    try:
+        body, encoding_headers = ENCODERS[PUSH_ENCODING](batch.to_payload())
+    except Exception as e:
+        print(f"Error encoding batch for Loki: {str(e)}")
+        print(f"Problematic batch: {batch.num_lines} lines")
+        return False
+    metrics.encoded(time.perf_counter() - start)
+    headers.update(encoding_headers)
+
+    # The same body is sent on every attempt, so an attempt that reached
+    # Loki before failing is deduplicated rather than ingested twice
+    for attempt in range(MAX_RETRIES + 1):
+        retry_after = None
+        congested = True
+        status = "error"  # No response
+        tenant.throttled += 1
+        try:
+            metrics.rate_limited(await tenant.pace(batch))
+        finally:
+            tenant.throttled -= 1
+        ticket = await limiter.acquire()
+        start = time.monotonic()
+        try:
+            async with session.post(
+                url=LOKI_URL, data=body, headers=headers
+            ) as response:
+                status = str(response.status)
+                if response.status == 204:
+                    congested = False
+                    return True
+                error = f"{response.status} {await response.text()}"
+                retryable = response.status in RETRYABLE_STATUSES
+                congested = retryable
+                retry_after = parse_retry_after(
+                    response.headers.get("Retry-After")
+                )
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            error = str(e) or type(e).__name__
+            retryable = True
+        finally:
+            latency = time.monotonic() - start
+            await limiter.release(ticket, latency, congested)
+            metrics.pushed(len(body), latency, status)
+
+        if not retryable:
+            print(f"Failed to upload to Loki: {error}")
+            print(f"Problematic batch: {batch.num_lines} lines")
+            return False
+        if attempt < MAX_RETRIES:
+            metrics.retried()
+            tenant.throttled += 1
+            try:
+                await asyncio.sleep(
+                    backoff_delay(
+                        attempt,
+                        RETRY_BASE_SECONDS,
+                        RETRY_MAX_SECONDS,
+                        retry_after,
+                    )
+                )
+            finally:
+                tenant.throttled -= 1
+
+    print(f"Giving up after {MAX_RETRIES + 1} attempts: {error}")
+    print(f"Problematic batch: {batch.num_lines} lines")
+    return False
+
+
+async def worker(name, tenant, journal, progress_bar, metrics):
+    queue = tenant.queue
+    while True:
+        batch = await queue.get()
+        tenant.room.set()
+        if batch is None:
+            queue.task_done()
+            break
+        if await upload_to_loki(tenant, batch, metrics):
+            journal.record_ranges(batch.ranges)
+        progress_bar.update(batch.num_lines)
+        progress_bar.set_postfix(
+            concurrency=int(tenant.limiter.limit), refresh=False
+        )
+        queue.task_done()
+
+
+async def batcher(entry_queue, tenants: Tenants, plugin, defer: bool = True):
+    """Group queued entry chunks into batches for each tenant's workers
+
+    The batcher waits for room in a tenant's queue, except with defer for
+    a throttled tenant while another tenant has room: the batch is then
+    dropped and its positions kept in the tenant's deferred ranges, to be
+    read again once the other tenants are done.
+    """
+    # Partial batch of each tenant by name, the oldest batch first
+    batches: Dict[str, Batch] = {}
+
+    async def flush(name):
+        tenant = tenants.by_name[name]
+        batch = batches.pop(name)
+        while defer and tenant.throttled and tenant.queue.full():
+            if any(not other.queue.full() for other in tenants):
+                tenant.deferred.extend(batch.ranges)
+                return
+            # Every tenant is behind, wait for any of them to take a batch
+            tenant.room.clear()
+            await tenant.room.wait()
+        await tenant.queue.put(batch)
+
+    while True:
+        oldest = next(iter(batches.values()), None)
+        try:
+            item = await asyncio.wait_for(
+                entry_queue.get(),
+                timeout=oldest.linger_remaining() if oldest else None,
+            )
+        except asyncio.TimeoutError:
+            await flush(next(iter(batches)))
+            continue
+        if item is None:
+            break
+        for index, record in item:
+            name = tenants.of(record.stream).name
+            batch = batches.get(name)
+            if batch is None:
+                batch = batches[name] = Batch(plugin)
+            batch.add(record, index)
+            if batch.is_full():
+                await flush(name)
+
+    for name in list(batches):
+        await flush(name)
+
+
+class Lane:
+    """The batches of one stream, pushed in order by a single task"""
+
+    def __init__(
+        self, plugin, tenant: Tenant, timestamps: Optional[Dict] = None
+    ):
+        self.tenant = tenant
+        self.batch = Batch(plugin)
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=LANE_QUEUE_SIZE)
+        self.last_nanoseconds: Optional[int] = None
+        self.newest: Optional[int] = None  # Newest entry timestamp
+        # Entries sharing the newest timestamp of the stream or older than
+        # it, counted over the lanes
+        self.timestamps = timestamps or {"shared": 0, "out_of_order": 0}
+        self.task: Optional[asyncio.Task] = None
+
+    def add(self, record: UploadRecord, index: int):
+        # Loki drops a line repeated with the same timestamp in a stream, so
+        # entries are offset by their position modulo TIMESTAMP_NUDGE
+        # nanoseconds, which stays distinct and increasing within a second
+        # for files of up to a billion entries. The offset only depends on
+        # the entry, so an entry pushed again by --resume gets the same
+        # nanoseconds and Loki deduplicates it. Lines without a timestamp
+        # follow the previous line of the stream.
+        if record.timestamp is None:
+            if self.last_nanoseconds is None:
+                nanoseconds = time.time_ns()
+            else:
+                nanoseconds = self.last_nanoseconds + 1
+        else:
+            timestamp = entry_nanoseconds(record)
+            if self.newest is not None and timestamp <= self.newest:
+                key = "shared" if timestamp == self.newest else "out_of_order"
+                self.timestamps[key] += 1
+            else:
+                self.newest = timestamp
+            nanoseconds = timestamp + index % TIMESTAMP_NUDGE
+        self.last_nanoseconds = nanoseconds
+        self.batch.add(record, index, nanoseconds)
+
+
+class Watermark:
+    """Journal the position below which every entry is acknowledged
+
+    Lanes finish batches out of file order and a batch of one stream
+    spans entries of others, so checkpoints advance to the start of the
+    oldest batch not acknowledged yet. Entries acknowledged past it are
+    pushed again on --resume, which Loki deduplicates as they carry the
+    same timestamps. Batches that failed for good no longer hold the
+    checkpoint back, but their entries are left out of it, so --resume
+    pushes them again.
+    """
+
+    def __init__(self, journal: UploadJournal, position: int):
+        self.journal = journal
+        self.position = position
+        self._next = position
+        self._open: List[int] = []  # Heap of the starts of open batches
+        self._closed = set()  # Starts of batches acknowledged or failed
+        # Sorted, merged ranges of the entries of failed batches not
+        # passed by the checkpoint yet
+        self._failed: List[Tuple[int, int]] = []
+
+    def read(self, index: int):
+        self._next = index + 1
+
+    def opened(self, start: int):
+        heapq.heappush(self._open, start)
+
+    def acknowledge(self, start: int):
+        self._close(start)
+
+    def fail(self, batch: Batch):
+        self._failed = merge_ranges(
+            self._failed + [tuple(r) for r in batch.ranges]
+        )
+        self._close(batch.start)
+
+    def _close(self, start: int):
+        self._closed.add(start)
+        while self._open and self._open[0] in self._closed:
+            self._closed.remove(heapq.heappop(self._open))
+        position = self._open[0] if self._open else self._next
+        if position > self.position:
+            ranges = self._acknowledged(self.position, position)
+            if ranges:
+                self.journal.record_ranges(ranges)
+            self.position = position
+
+    def _acknowledged(self, start: int, end: int) -> List[Tuple[int, int]]:
+        """The ranges of [start, end) outside of the failed batches"""
+        ranges = []
+        for failed_start, failed_end in self._failed:
+            if failed_start >= end:
+                break
+            if failed_start > start:
+                ranges.append((start, failed_start))
+            start = max(start, failed_end)
+        if start < end:
+            ranges.append((start, end))
+        self._failed = [r for r in self._failed if r[1] > end]
+        return ranges
+
+
+async def lane_worker(lane, watermark, progress_bar, metrics):
+    while True:
+        batch = await lane.queue.get()
+        if batch is None:
+            break
+        if await upload_to_loki(lane.tenant, batch, metrics):
+            watermark.acknowledge(batch.start)
+        else:
+            watermark.fail(batch)
+        progress_bar.update(batch.num_lines)
+        progress_bar.set_postfix(
+            concurrency=int(lane.tenant.limiter.limit), refresh=False
+        )
+
+
+async def ordered_batcher(
+    entry_queue, tenants, watermark, progress_bar, metrics, plugin
+):
+    """Split queued entry chunks into one lane per stream and push them"""
+    # Lanes by label set id
+    lanes: Dict[int, Lane] = {}
+    # Lanes holding a partial batch, the oldest batch first
+    lingering: Dict[int, Lane] = {}
+    timestamps = {"shared": 0, "out_of_order": 0}
+    metrics.report("timestamps", lambda: dict(timestamps))
+    metrics.watch("lanes", lambda: len(lanes), "Streams with a lane")
+    metrics.watch(
+        "batch_queue_depth",
+        lambda: sum(lane.queue.qsize() for lane in lanes.values()),
+        "Batches queued in the stream lanes",
+    )
+
+    async def flush(key):
+        lane = lingering.pop(key)
+        await lane.queue.put(lane.batch)
+        lane.batch = Batch(plugin)
+
+    while True:
+        oldest = next(iter(lingering.values()), None)
+        try:
+            item = await asyncio.wait_for(
+                entry_queue.get(),
+                timeout=oldest.batch.linger_remaining() if oldest else None,
+            )
+        except asyncio.TimeoutError:
+            await flush(next(iter(lingering)))
+            continue
+        if item is None:
+            break
+        for index, record in item:
+            watermark.read(index)
+            key = record.stream.id
+            lane = lanes.get(key)
+            if lane is None:
+                lane = lanes[key] = Lane(
+                    plugin, tenants.of(record.stream), timestamps
+                )
+                lane.task = asyncio.create_task(
+                    lane_worker(lane, watermark, progress_bar, metrics)
+                )
+            if not lane.batch.num_lines:
+                lingering[key] = lane
+                watermark.opened(index)
+            lane.add(record, index)
+            if lane.batch.is_full():
+                await flush(key)
+
+    for key in list(lingering):
+        await flush(key)
+    for lane in lanes.values():
+        await lane.queue.put(None)
+    await asyncio.gather(*(lane.task for lane in lanes.values()))
+
+
+async def producer(
+    queue,
+    filename,
+    journal,
+    plugin,
+    replay: Optional[Replay] = None,
+    ranges: Optional[List[Tuple[int, int]]] = None,
+):
+    """Queue the entries not acknowledged yet with their positions
+
+    With a replay, each entry is queued once it is due. With ranges, only
+    the entries at those positions are queued.
+    """
+    upload_records = plugin.record_schema.upload_records
+    if ranges is not None:
+        skip = ranges[0][0] if ranges else 0
+        pending = within_ranges(iter_logs(filename, skip), ranges, skip)
+    else:
+        skip = journal.acknowledged_prefix
+        pending = journal.pending(iter_logs(filename, skip), skip)
+    while chunk := list(islice(pending, ENTRY_CHUNK_SIZE)):
+        indexes, entries = zip(*chunk)
+        items = list(zip(indexes, upload_records(entries)))
+        if replay is None:
+            await queue.put(items)
+            continue
+        timestamps = [
+            None if record.timestamp is None else entry_nanoseconds(record)
+            for _, record in items
+        ]
+        async for group in replay.release(items, timestamps):
+            await queue.put(group)
+
+
+async def count_total(progress_bar: tqdm, filename: str):
+    """Set the progress bar total once the entries are counted"""
+    progress_bar.total = await asyncio.to_thread(count_logs, filename)
+    progress_bar.refresh()
+
+
+async def main(plugin, resume: bool = False):
+    if not LOKI_URL:
+        raise RuntimeError("LOKI_URL is not set, see the README")
+    parsed_log_file = plugin.parsed_log_file
+    auth = aiohttp.BasicAuth(USER_ID, API_KEY)
+    router = TenantRouter(LOKI_TENANT, parse_tenant_map(TENANT_MAP))
+    entry_queue = asyncio.Queue(
+        maxsize=ENTRY_QUEUE_SIZE
+    )  # Limit queue size to control memory usage
+
+    journal = UploadJournal(
+        UPLOAD_JOURNAL or f"{parsed_log_file}.journal", parsed_log_file, resume
+    )
+    if journal.num_acknowledged:
+        print(f"Resuming, {journal.num_acknowledged} entries already pushed")
+
+    metrics = UploadMetrics(
+        {
+            "dataset": plugin.dataset,
+            "parsed_log_file": parsed_log_file,
+            "upload_mode": UPLOAD_MODE,
+            "push_encoding": PUSH_ENCODING,
+            "tenant": LOKI_TENANT,
+            "tenant_map": TENANT_MAP,
+            "batch_max_lines": BATCH_MAX_LINES,
+            "batch_max_bytes": BATCH_MAX_BYTES,
+            "batch_linger_seconds": BATCH_LINGER_SECONDS,
+            "min_concurrency": MIN_CONCURRENCY,
+            "initial_concurrency": INITIAL_CONCURRENCY,
+            "max_concurrency": MAX_CONCURRENCY,
+            "target_latency_seconds": TARGET_LATENCY_SECONDS,
+            "max_retries": MAX_RETRIES,
+            "ingestion_rate_mb": INGESTION_RATE_MB,
+            "ingestion_burst_size_mb": INGESTION_BURST_SIZE_MB,
+            "per_stream_rate_limit_mb": PER_STREAM_RATE_LIMIT_MB,
+            "per_stream_rate_limit_burst_mb": PER_STREAM_RATE_LIMIT_BURST_MB,
+            "tenant_limits": TENANT_LIMITS,
+            "replay_speed": REPLAY_SPEED or None,
+        }
+    )
+    replay = None
+    if REPLAY_SPEED:
+        replay = Replay(
+            REPLAY_SPEED,
+            float(REPLAY_MAX_GAP_SECONDS) if REPLAY_MAX_GAP_SECONDS else None,
+        )
+        metrics.watch(
+            "replay_lag_seconds",
+            lambda: replay.lag,
+            "Seconds the replay released the last entry behind schedule",
+        )
+        metrics.report("replay", replay.summary)
+    progress_bar = tqdm(
+        initial=journal.num_acknowledged, desc="Upload Progress"
+    )
+    # Entries are counted alongside the upload, so that it starts at once.
+    # Counting a JSON array decodes all of it, so its total stays unknown.
+    counter = None
+    if not parsed_log_file.lower().endswith(JSON_SUFFIXES):
+        counter = asyncio.create_task(
+            count_total(progress_bar, parsed_log_file)
+        )
+
+    room = asyncio.Event()
+
+    def create_tenant(name: str) -> Tenant:
+        tenant = Tenant(name, asyncio.Queue(maxsize=NUM_WORKERS), room)
+        tenant.connect(auth)
+        if UPLOAD_MODE != "ordered":
+            tenant.workers = [
+                asyncio.create_task(
+                    worker(
+                        f"{name}-worker-{i}",
+                        tenant,
+                        journal,
+                        progress_bar,
+                        metrics,
+                    )
+                )
+                for i in range(NUM_WORKERS)
+            ]
+        return tenant
+
+    tenants = Tenants(router, create_tenant)
+    metrics.watch(
+        "entry_queue_depth",
+        entry_queue.qsize,
+        "Entry chunks queued for the batcher",
+    )
+    metrics.watch(
+        "tenants", lambda: len(tenants.by_name), "Tenants pushed to"
+    )
+    metrics.watch(
+        "concurrency_limit",
+        lambda: sum(int(tenant.limiter.limit) for tenant in tenants),
+        "Pushes allowed in flight, summed over the tenants",
+    )
+    metrics.watch(
+        "pushes_in_flight",
+        lambda: sum(tenant.limiter.in_flight for tenant in tenants),
+        "Pushes in flight",
+    )
+    sampler = asyncio.create_task(metrics.sample(METRICS_SAMPLE_SECONDS))
+    server = None
+    if METRICS_PORT:
+        server = await metrics.serve(int(METRICS_PORT))
+        print(f"Serving metrics on http://127.0.0.1:{METRICS_PORT}/metrics")
+
+    try:
+        # Start the producer and the batcher
+        producer_task = asyncio.create_task(
+            producer(entry_queue, parsed_log_file, journal, plugin, replay)
+        )
+        if UPLOAD_MODE == "ordered":
+            watermark = Watermark(journal, journal.acknowledged_prefix)
+            batcher_task = asyncio.create_task(
+                ordered_batcher(
+                    entry_queue,
+                    tenants,
+                    watermark,
+                    progress_bar,
+                    metrics,
+                    plugin,
+                )
+            )
+            await producer_task
+            await entry_queue.put(None)
+            await batcher_task
+        else:
+            metrics.watch(
+                "batch_queue_depth",
+                lambda: sum(tenant.queue.qsize() for tenant in tenants),
+                "Batches queued for the workers",
+            )
+            batcher_task = asyncio.create_task(
+                batcher(entry_queue, tenants, plugin)
+            )
+
+            # Wait for the producer to finish, then flush the last batches
+            await producer_task
+            await entry_queue.put(None)
+            await batcher_task
+
+            # Read the batches deferred by tenants that fell behind again,
+            # now waiting for room as the other tenants are done
+            deferred = merge_ranges(
+                [tuple(r) for tenant in tenants for r in tenant.deferred]
+            )
+            if deferred:
+                deferred_lines = sum(end - start for start, end in deferred)
+                metrics.report("deferred_lines", lambda: deferred_lines)
+                print(f"\nPushing {deferred_lines} deferred lines")
+                batcher_task = asyncio.create_task(
+                    batcher(entry_queue, tenants, plugin, defer=False)
+                )
+                await producer(
+                    entry_queue, parsed_log_file, journal, plugin, None,
+                    deferred,
+                )
+                await entry_queue.put(None)
+                await batcher_task
+
+            # Send termination signals to the workers of every tenant
+            for tenant in tenants:
+                for _ in tenant.workers:
+                    await tenant.queue.put(None)
+
+            # Wait for all workers to finish
+            await asyncio.gather(
+                *(task for tenant in tenants for task in tenant.workers)
+            )
+    finally:
+        if counter is not None:
+            counter.cancel()
+        progress_bar.close()
+        for tenant in tenants:
+            await tenant.session.close()
+    journal.close()
+
+    metrics.finish()
+    sampler.cancel()
+    if server is not None:
+        await server.cleanup()
+    summary_file = METRICS_SUMMARY or f"{parsed_log_file}.metrics.json"
+    metrics.write_summary(summary_file)
+    summary = metrics.summary()
+    print(
+        f"{summary['lines']['pushed']} lines pushed in "
+        f"{summary['elapsed_seconds']:.1f}s "
+        f"({summary['lines_per_second']} lines/s, "
+        f"p99 push latency {summary['push_latency_seconds']['p99']}s, "
+        f"{summary['retries']} retries), summary written to {summary_file}"
+    )
+    timestamps = summary.get("timestamps")
+    if timestamps and timestamps["out_of_order"]:
+        print(
+            f"{timestamps['out_of_order']} entries were older than an "
+            "earlier entry of their stream, sort_logs.py puts them in order"
+        )
+    if replay is not None:
+        replayed = summary["replay"]
+        print(
+            f"Replayed at {REPLAY_SPEED:g}x: target "
+            f"{replayed['target_lines_per_second']} lines/s over "
+            f"{replayed['target_seconds']}s, achieved "
+            f"{replayed['released_lines_per_second']} lines/s released "
+            f"over {replayed['elapsed_seconds']}s and "
+            f"{summary['lines_per_second']} lines/s pushed, max lag "
+            f"{replayed['max_lag_seconds']}s"
+        )
+        if replayed["out_of_order_lines"]:
+            print(
+                f"{replayed['out_of_order_lines']} lines were older than a "
+                "line before them and released at once, sort the file "
+                "with SORT_BY=time to replay them in time"
+            )
+
+
+def run(plugin):
+    parser = argparse.ArgumentParser(description="Upload parsed logs to Loki")
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="skip the batches acknowledged by an earlier run, as recorded "
+        "in UPLOAD_JOURNAL",
+    )
+    args = parser.parse_args()
+    asyncio.run(main(plugin, resume=args.resume))
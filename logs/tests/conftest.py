@@ -0,0 +1,52 @@
+import importlib.util
+import os
+import sys
+
+import pytest
+
+LOGS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+sys.path.insert(0, LOGS_DIR)
+
+
+def load_plugin(dataset: str):
+    """The PLUGIN of a dataset directory, whose models.py it imports"""
+    directory = os.path.join(LOGS_DIR, dataset)
+    sys.path.insert(0, directory)
+    sys.modules.pop("models", None)
+    try:
+        spec = importlib.util.spec_from_file_location(
+            f"{dataset.lower()}_plugin", os.path.join(directory, "plugin.py")
+        )
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    finally:
+        sys.path.remove(directory)
+        sys.modules.pop("models", None)
+    return module.PLUGIN
+
+
+@pytest.fixture(scope="session")
+def openstack():
+    return load_plugin("OpenStack")
+
+
+def openstack_entry(timestamp: str = "2017-05-16T00:00:00.008000", **labels):
+    """A parsed OpenStack entry, with labels overriding the defaults"""
+    return {
+        "labels": {
+            "application": "openstack",
+            "log_file_type": "nova-api",
+            "log_level": "INFO",
+            "component": "nova.osapi_compute.wsgi.server",
+            "log_file_name": "nova-api.log.1.2017-05-16_13:53:08",
+            **labels,
+        },
+        "structured_metadata": {
+            "request_id": "e3cbf9e1-5a5b-4b6e-8e24-0b8c2a8c6f0e",
+            "tenant_id": "113d3a99c3da401fbd62cc2caa5b96d2",
+            "user_id": None,
+            "template_id": None,
+        },
+        "timestamp": timestamp,
+        "content": 'GET /v2/servers/detail HTTP/1.1" status: 200',
+    }
@@ -0,0 +1,39 @@
+from ingest.drain import WILDCARD, DrainMiner
+
+
+def _nodes(node) -> int:
+    """Nodes and templates lists below a parse tree node"""
+    if isinstance(node, list):
+        return 1
+    return 1 + sum(_nodes(child) for child in node.values())
+
+
+def _word(number: int) -> str:
+    """A token without digits, so it gets a tree branch of its own"""
+    word = ""
+    while True:
+        number, letter = divmod(number, 26)
+        word += chr(ord("a") + letter)
+        if not number:
+            return word
+
+
+def test_evicted_templates_leave_no_nodes_behind():
+    miner = DrainMiner(depth=5, max_templates=10)
+    for i in range(5000):
+        miner.add(f"{_word(i)} {_word(i + 1)} {_word(i + 2)} started")
+
+    assert len(miner.templates) == 10
+    assert miner.evicted == 4990
+    # The root, a token count node, three levels of leading tokens and a
+    # templates list per template
+    assert _nodes(miner._root) <= 2 + 10 * 4
+
+
+def test_templates_merge_variable_tokens():
+    miner = DrainMiner()
+    first = miner.add("Connection closed by 10.0.0.1 port 22")
+    second = miner.add("Connection closed by 10.0.0.2 port 22")
+    assert second is first
+    assert first.tokens[3] == WILDCARD
+    assert first.size == 2
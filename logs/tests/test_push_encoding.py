@@ -0,0 +1,79 @@
+import gzip
+import json
+
+import pytest
+
+from conftest import openstack_entry
+from ingest.push_encoding import ENCODERS
+from ingest.upload_to_loki import Batch
+
+
+def _fields(data: bytes):
+    """(field number, value) of a protobuf message, bytes for strings"""
+    position = 0
+
+    def varint():
+        nonlocal position
+        value = shift = 0
+        while True:
+            byte = data[position]
+            position += 1
+            value |= (byte & 0x7F) << shift
+            shift += 7
+            if byte < 0x80:
+                return value
+
+    while position < len(data):
+        key = varint()
+        if key & 7 == 0:
+            yield key >> 3, varint()
+        else:
+            size = varint()
+            yield key >> 3, data[position:position + size]
+            position += size
+
+
+def _selector_labels(selector: str):
+    pairs = selector.strip("{}").split(", ")
+    return dict(
+        (name, value.strip('"'))
+        for name, value in (pair.split("=", 1) for pair in pairs)
+    )
+
+
+def _stream_labels(encoding: str, body: bytes):
+    """Stream label sets of a push body"""
+    if encoding == "protobuf":
+        snappy = pytest.importorskip("snappy")
+        request = snappy.decompress(body)
+        return [
+            _selector_labels(value.decode())
+            for _, stream in _fields(request)
+            for number, value in _fields(stream)
+            if number == 1
+        ]
+    if encoding == "gzip":
+        body = gzip.decompress(body)
+    return [stream["stream"] for stream in json.loads(body)["streams"]]
+
+
+@pytest.mark.parametrize("encoding", sorted(ENCODERS))
+def test_unset_labels_are_left_out(openstack, encoding):
+    entries = [
+        openstack_entry(log_level=None, component=None),
+        openstack_entry(),
+    ]
+    batch = Batch(openstack)
+    for record in openstack.record_schema.upload_records(entries):
+        batch.add(record)
+    body, _ = ENCODERS[encoding](batch.to_payload())
+
+    expected = [
+        {
+            name: value
+            for name, value in entry["labels"].items()
+            if value is not None
+        }
+        for entry in entries
+    ]
+    assert _stream_labels(encoding, body) == expected
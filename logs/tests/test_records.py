@@ -0,0 +1,29 @@
+from datetime import datetime
+
+import pytest
+from pydantic import ValidationError
+
+from conftest import openstack_entry
+
+
+def test_upload_records_keep_valid_timestamp_strings(openstack):
+    entries = [openstack_entry(), openstack_entry("2017-05-16T00:00:01")]
+    records = openstack.record_schema.upload_records(entries)
+    assert [record.timestamp for record in records] == [
+        entry["timestamp"] for entry in entries
+    ]
+
+
+@pytest.mark.parametrize("timestamp", ["16/May/2017 00:00:00", "2017-13-01"])
+def test_upload_records_reject_invalid_timestamp_strings(
+    openstack, timestamp
+):
+    entries = [openstack_entry(), openstack_entry(timestamp)]
+    with pytest.raises(ValidationError):
+        openstack.record_schema.upload_records(entries)
+
+
+def test_upload_records_coerce_timestamps_as_the_models(openstack):
+    entries = [openstack_entry(), openstack_entry("1494892800")]
+    records = openstack.record_schema.upload_records(entries)
+    assert all(isinstance(record.timestamp, datetime) for record in records)
@@ -0,0 +1,34 @@
+import asyncio
+
+from ingest.replay import Replay
+
+SECOND = 1_000_000_000
+
+
+def _replay(replay, timestamps):
+    async def release():
+        groups = []
+        async for group in replay.release(timestamps, timestamps):
+            groups.append(group)
+        return groups
+
+    return asyncio.run(release())
+
+
+def test_stream_order_does_not_stretch_the_replay():
+    # Two streams over the same ten seconds, one after the other
+    timestamps = [t * SECOND for t in (0, 5, 10, 0, 5, 10)]
+    replay = Replay(speed=1000)
+    groups = _replay(replay, timestamps)
+
+    summary = replay.summary()
+    assert summary["log_seconds"] == 10
+    assert summary["out_of_order_lines"] == 2
+    assert [t for group in groups for t in group] == timestamps
+
+
+def test_gaps_are_cut_to_max_gap():
+    timestamps = [t * SECOND for t in (0, 1, 3601, 3602)]
+    replay = Replay(speed=1000, max_gap=5)
+    _replay(replay, timestamps)
+    assert replay.summary()["log_seconds"] == 7
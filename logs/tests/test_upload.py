@@ -0,0 +1,192 @@
+import asyncio
+import json
+import time
+
+import pytest
+
+from conftest import openstack_entry
+from ingest import upload_to_loki
+from ingest.loki_stand_in import LokiStandIn
+
+NUM_ENTRIES = 3000
+
+
+@pytest.fixture
+def parsed_logs(tmp_path, monkeypatch):
+    filename = tmp_path / "parsed_openstack_logs.ndjson"
+    with open(filename, "w") as fd:
+        for i in range(NUM_ENTRIES):
+            timestamp = f"2017-05-16T00:{i // 60 % 60:02d}:{i % 60:02d}"
+            fd.write(json.dumps(openstack_entry(timestamp)) + "\n")
+    monkeypatch.setenv("PARSED_LOG_FILE", str(filename))
+    monkeypatch.setattr(
+        upload_to_loki, "LOKI_URL", "http://127.0.0.1:9/loki/api/v1/push"
+    )
+    monkeypatch.setattr(upload_to_loki, "METRICS_PORT", None)
+    return filename
+
+
+@pytest.mark.parametrize("mode", ["now", "ordered"])
+def test_unexpected_push_errors_end_the_upload(
+    openstack, parsed_logs, monkeypatch, mode
+):
+    pushed = []
+
+    async def failing_push(tenant, batch, metrics):
+        pushed.append(batch.num_lines)
+        raise TypeError("not an aiohttp error")
+
+    monkeypatch.setattr(upload_to_loki, "UPLOAD_MODE", mode)
+    monkeypatch.setattr(upload_to_loki, "_push", failing_push)
+    asyncio.run(asyncio.wait_for(upload_to_loki.main(openstack), 30))
+
+    assert sum(pushed) == NUM_ENTRIES
+    # Nothing was acknowledged, so a resumed upload pushes everything
+    journal = upload_to_loki.UploadJournal(
+        f"{parsed_logs}.journal", str(parsed_logs), True
+    )
+    assert journal.num_acknowledged == 0
+
+
+def test_failed_batches_do_not_stop_the_ordered_checkpoint(
+    openstack, parsed_logs, monkeypatch
+):
+    failed = []
+
+    async def push_failing_first(tenant, batch, metrics):
+        if not failed:
+            failed.extend(batch.ranges)
+            return False
+        return True
+
+    monkeypatch.setattr(upload_to_loki, "UPLOAD_MODE", "ordered")
+    monkeypatch.setattr(upload_to_loki, "_push", push_failing_first)
+    asyncio.run(asyncio.wait_for(upload_to_loki.main(openstack), 30))
+
+    # The entries after the failed batch are checkpointed, and a resumed
+    # upload pushes the failed batch again
+    journal = upload_to_loki.UploadJournal(
+        f"{parsed_logs}.journal", str(parsed_logs), True
+    )
+    ((start, end),) = failed
+    assert start == 0
+    assert journal.acknowledged == [(end, NUM_ENTRIES)]
+
+
+def test_watermark_leaves_failed_entries_out_of_the_checkpoint(
+    openstack, parsed_logs
+):
+    journal = upload_to_loki.UploadJournal(
+        f"{parsed_logs}.journal", str(parsed_logs)
+    )
+    watermark = upload_to_loki.Watermark(journal, 0)
+    records = openstack.record_schema.upload_records(
+        [openstack_entry() for _ in range(6)]
+    )
+    # Two streams' batches interleaved over positions 0 to 5
+    failing = upload_to_loki.Batch(openstack)
+    for index in (0, 2, 4):
+        watermark.read(index)
+        failing.add(records[index], index)
+    watermark.opened(0)
+    watermark.opened(1)
+    watermark.read(5)
+    watermark.fail(failing)
+    watermark.acknowledge(1)
+    journal.close()
+
+    resumed = upload_to_loki.UploadJournal(
+        f"{parsed_logs}.journal", str(parsed_logs), True
+    )
+    assert resumed.acknowledged == [(1, 2), (3, 4), (5, 6)]
+    assert watermark.position == 6
+
+
+def _lane_nanoseconds(plugin, entries, start):
+    """Nanoseconds a lane sends for the entries from position start on"""
+    lane = upload_to_loki.Lane(plugin, None)
+    records = plugin.record_schema.upload_records(entries[start:])
+    for index, record in enumerate(records, start):
+        lane.add(record, index)
+    (stream,) = lane.batch.streams.values()
+    return [nanoseconds for _, nanoseconds in stream["entries"]], lane
+
+
+def test_ordered_timestamps_are_reproduced_on_resume(openstack):
+    seconds = [0, 0, 0, 1, 1, 0, 2, 2, 2, 2]
+    entries = [
+        openstack_entry(f"2017-05-16T00:00:0{second}.008000")
+        for second in seconds
+    ]
+    sent, lane = _lane_nanoseconds(openstack, entries, 0)
+    resumed, _ = _lane_nanoseconds(openstack, entries, 4)
+
+    assert resumed == sent[4:]
+    # Repeated timestamps are kept apart, without passing the next one
+    assert len(set(sent)) == len(sent)
+    assert max(sent[:3]) < min(sent[3:5]) < max(sent[3:5]) < min(sent[6:])
+    assert lane.timestamps == {"shared": 6, "out_of_order": 1}
+
+
+def test_repeated_lines_in_one_second_all_arrive_in_order(
+    openstack, parsed_logs, monkeypatch
+):
+    # The same line over and over in the same second of one stream
+    with open(parsed_logs, "w") as fd:
+        for _ in range(NUM_ENTRIES):
+            fd.write(json.dumps(openstack_entry("2017-05-16T00:00:00")) + "\n")
+    pushed = []
+
+    async def recording_push(tenant, batch, metrics):
+        (stream,) = batch.streams.values()
+        pushed.extend(stream["entries"])
+        return True
+
+    monkeypatch.setattr(upload_to_loki, "UPLOAD_MODE", "ordered")
+    monkeypatch.setattr(upload_to_loki, "_push", recording_push)
+    asyncio.run(asyncio.wait_for(upload_to_loki.main(openstack), 30))
+
+    # Loki would drop a repeated (timestamp, line) and reject a timestamp
+    # older than the last one of the stream
+    nanoseconds = [nanoseconds for _, nanoseconds in pushed]
+    assert len(nanoseconds) == NUM_ENTRIES
+    assert nanoseconds == sorted(set(nanoseconds))
+    assert nanoseconds[-1] - nanoseconds[0] < 1_000_000_000
+
+
+def test_throttled_tenant_does_not_hold_up_the_others(
+    openstack, parsed_logs, monkeypatch
+):
+    with open(parsed_logs, "w") as fd:
+        for i in range(NUM_ENTRIES):
+            entry = openstack_entry(f"2017-05-16T00:00:{i % 60:02d}")
+            entry["labels"]["log_level"] = "ERROR" if i % 2 else "INFO"
+            fd.write(json.dumps(entry) + "\n")
+    # ERROR lines go to a tenant paced to about 4 seconds of pushes
+    monkeypatch.setattr(upload_to_loki, "TENANT_MAP", "log_level=ERROR:slow")
+    monkeypatch.setattr(upload_to_loki, "TENANT_LIMITS", "slow=0.05:0.01")
+    monkeypatch.setattr(upload_to_loki, "INGESTION_RATE_MB", 0)
+    monkeypatch.setattr(upload_to_loki, "PER_STREAM_RATE_LIMIT_MB", 0)
+    monkeypatch.setattr(upload_to_loki, "NUM_WORKERS", 4)
+    monkeypatch.setattr(upload_to_loki, "BATCH_MAX_LINES", 50)
+
+    async def upload():
+        stand_in = LokiStandIn(latency=0.01)
+        monkeypatch.setattr(upload_to_loki, "LOKI_URL", await stand_in.start())
+        start = time.monotonic()
+        fast_done = None
+        task = asyncio.create_task(upload_to_loki.main(openstack))
+        while not task.done():
+            lines = stand_in.tenant_lines.get("tenant1", 0)
+            if fast_done is None and lines == NUM_ENTRIES // 2:
+                fast_done = time.monotonic() - start
+            await asyncio.sleep(0.01)
+        await task
+        await stand_in.stop()
+        return stand_in.tenant_lines, fast_done, time.monotonic() - start
+
+    tenant_lines, fast_done, elapsed = asyncio.run(upload())
+    half = NUM_ENTRIES // 2
+    assert tenant_lines == {"tenant1": half, "slow": half}
+    assert elapsed > 2
+    assert fast_done < elapsed / 4